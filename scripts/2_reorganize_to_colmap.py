@@ -14,13 +14,94 @@ To COLMAP structure:
     │   ├── frame_00001.png
     │   └── ...
     └── transforms.json
+
+Scenes are independent, with --workers N they are reorganized by N threads (the moves are
+filesystem-latency bound, e.g. on NFS). Every scene is processed by a single task and a failed
+scene does not affect the others, the summary lists the failures in a stable order.
+
+Finished scenes are recorded in a ledger in the output directory (scene_ledger), a rerun skips
+them with a lookup instead of listing their images. --verify re-derives the state of every
+scene from the output directory and corrects the ledger.
 """
 
 import os
+import errno
 import shutil
 import argparse
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
+from scene_ledger import SceneLedger, source_fingerprint
+
+
+def move_images_per_file(image_dirs: list, images_folder: Path) -> int:
+    """ Move the frames one by one with shutil.move, works across filesystems """
+    image_count = 0
+    for img_dir in image_dirs:
+        # Move all images from images_X to images/
+        for img_file in sorted(img_dir.glob('*.png')):
+            # Use original filename, but if duplicate exists, rename
+            dest_file = images_folder / img_file.name
+            if dest_file.exists():
+                # Add suffix if file already exists (from different camera view)
+                stem = img_file.stem
+                suffix = img_file.suffix
+                dest_file = images_folder / f"{stem}_{img_dir.name}{suffix}"
+            
+            shutil.move(str(img_file), str(dest_file))
+            image_count += 1
+    return image_count
+
+
+def move_images(image_dirs: list, images_folder: Path):
+    """ Move the frames of the images_X folders into images/, with the cheapest safe method
+
+        - 'rename_dir': a single images_X folder holding only frames and an empty images/: the
+          folder itself is renamed, one metadata operation for the whole scene
+        - 'rename': the destination names (with the images_X suffix on collisions) are planned
+          from one listing of images/ and every frame is renamed directly, one operation per
+          frame instead of an exists() check and a shutil.move
+        - 'move': source and destination on different filesystems, per-file shutil.move
+
+    :return: (number of images, method)
+    """
+    if not image_dirs:
+        return 0, None
+    with os.scandir(images_folder) as entries:
+        taken = {e.name for e in entries}
+    sources = []
+    for img_dir in image_dirs:
+        with os.scandir(img_dir) as entries:
+            names = sorted(e.name for e in entries)
+        sources.append((img_dir, [n for n in names if n.endswith('.png')], len(names)))
+
+    if len(sources) == 1 and not taken and len(sources[0][1]) == sources[0][2]:
+        img_dir, names, _ = sources[0]
+        try:
+            os.rmdir(images_folder)
+            os.rename(img_dir, images_folder)
+            return len(names), 'rename_dir'
+        except OSError:
+            images_folder.mkdir(exist_ok=True)
+
+    image_count = 0
+    try:
+        for img_dir, names, _ in sources:
+            for name in names:
+                dest_name = name
+                if dest_name in taken:
+                    # Add suffix if file already exists (from different camera view)
+                    stem, suffix = os.path.splitext(name)
+                    dest_name = f"{stem}_{img_dir.name}{suffix}"
+                os.rename(img_dir / name, images_folder / dest_name)
+                taken.add(dest_name)
+                image_count += 1
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # cross-device: what is left goes through shutil.move
+        return image_count + move_images_per_file(image_dirs, images_folder), 'move'
+    return image_count, 'rename'
 
 
 def reorganize_to_colmap_structure(extracted_path: str, scene_name: str, output_dir: str):
@@ -29,6 +110,7 @@ def reorganize_to_colmap_structure(extracted_path: str, scene_name: str, output_
     :param extracted_path: Path to the extracted folder (batch/hash_name)
     :param scene_name: Scene name (hash_name) 
     :param output_dir: Root output directory
+    :return: (found_colmap, image_count, method used to move the images, see move_images)
     """
     extracted_folder = Path(extracted_path)
     scene_folder = Path(output_dir) / scene_name
@@ -43,20 +125,7 @@ def reorganize_to_colmap_structure(extracted_path: str, scene_name: str, output_
     # Collect all images from images_* folders
     image_dirs = sorted([d for d in extracted_folder.iterdir() if d.is_dir() and d.name.startswith('images_')])
     
-    image_count = 0
-    for img_dir in image_dirs:
-        # Move all images from images_X to images/
-        for img_file in sorted(img_dir.glob('*.png')):
-            # Use original filename, but if duplicate exists, rename
-            dest_file = images_folder / img_file.name
-            if dest_file.exists():
-                # Add suffix if file already exists (from different camera view)
-                stem = img_file.stem
-                suffix = img_file.suffix
-                dest_file = images_folder / f"{stem}_{img_dir.name}{suffix}"
-            
-            shutil.move(str(img_file), str(dest_file))
-            image_count += 1
+    image_count, image_method = move_images(image_dirs, images_folder)
     
     # Handle transforms.json and COLMAP files
     transforms_json = extracted_folder / 'transforms.json'
@@ -94,16 +163,82 @@ def reorganize_to_colmap_structure(extracted_path: str, scene_name: str, output_
                         shutil.move(str(source_file), str(sparse_folder / colmap_file))
                         found_colmap = True
     
-    return found_colmap, image_count
+    return found_colmap, image_count, image_method
+
+
+def reorganized_frames(target_scene: Path) -> int:
+    """ Number of frames of a scene in the output directory, 0 unless both images and sparse files exist """
+    sparse = target_scene / 'sparse' / '0'
+    if not ((sparse / 'images.bin').exists() or (sparse / 'images.txt').exists()):
+        return 0
+    try:
+        with os.scandir(target_scene / 'images') as entries:
+            return sum(1 for e in entries if e.name.endswith('.png'))
+    except FileNotFoundError:
+        return 0
 
 
-def reorganize_dataset(input_dir: str, output_dir: str, batch_name: str = None, scene_name: str = None):
+def reorganize_scene(scene_name: str, scene_folders: list, output_path: Path, ledger: SceneLedger,
+                     verify: bool = False):
+    """ Reorganize one scene, never raises so that a failed scene does not stop the others
+
+        A scene the ledger records as done from the same source is skipped without touching the
+        output directory. The output directory is only inspected for scenes the ledger does not
+        know (reorganized before the ledger existed) and, with verify, for every scene.
+
+    :param scene_name: Scene name (hash)
+    :param scene_folders: Extracted folders of the scene (batch/hash_name), usually one
+    :param output_path: Root output directory
+    :param ledger: completion ledger of the output directory
+    :param verify: re-derive the state from the output directory instead of trusting the ledger
+    :return: (status, found_colmap, image_count, error, image_method), status is 'done', 'skipped',
+             'corrected' or 'error', image_method how the images were moved (see move_images)
+    """
+    fingerprint = source_fingerprint(scene_folders)
+    entry = ledger.get(scene_name)
+    if not verify and ledger.is_done(scene_name, fingerprint):
+        return 'skipped', entry['colmap'], entry['frames'], None, None
+
+    if verify or entry is None:
+        # Check if already reorganized (skip only if both images and sparse files exist)
+        frames = reorganized_frames(output_path / scene_name)
+        if frames > 0:
+            stale = entry is not None and (entry['stage'] != 'done' or entry['frames'] != frames)
+            ledger.record(scene_name, 'done', frames, True, fingerprint)
+            return 'corrected' if stale else 'skipped', True, frames, None, None
+        if entry is not None:
+            ledger.forget(scene_name)
+
+    found_colmap, image_count, methods = False, 0, []
+    try:
+        for scene_folder in scene_folders:
+            found, count, method = reorganize_to_colmap_structure(str(scene_folder), scene_name, str(output_path))
+            found_colmap = found_colmap or found
+            image_count += count
+            if method is not None and method not in methods:
+                methods.append(method)
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+        ledger.record(scene_name, 'error', image_count, found_colmap, source_fingerprint(scene_folders), error)
+        return 'error', found_colmap, image_count, error, None
+    # moving files out of the source folders changes their mtime, fingerprint them afterwards.
+    # A scene still missing its images or sparse files is looked at again by the next run
+    frames = reorganized_frames(output_path / scene_name)
+    ledger.record(scene_name, 'done' if frames > 0 else 'incomplete', frames,
+                  found_colmap or (entry is not None and entry['colmap']), source_fingerprint(scene_folders))
+    return 'done', found_colmap, image_count, None, '+'.join(methods) or None
+
+
+def reorganize_dataset(input_dir: str, output_dir: str, batch_name: str = None, scene_name: str = None,
+                       workers: int = 1, verify: bool = False):
     """ Reorganize entire dataset or specific scene
     
     :param input_dir: Input directory containing batch folders (e.g., images/1K/)
     :param output_dir: Output directory for COLMAP structure
     :param batch_name: Optional batch name (e.g., '1K'). If None, processes all batches
     :param scene_name: Optional specific scene name (hash). If None, processes all scenes
+    :param workers: Number of scenes reorganized concurrently
+    :param verify: Re-derive the state of the scenes from the output directory instead of trusting the ledger
     """
     input_path = Path(input_dir)
     output_path = Path(output_dir)
@@ -141,37 +276,51 @@ def reorganize_dataset(input_dir: str, output_dir: str, batch_name: str = None,
         print(f"No scenes found to process in {input_dir}")
         return
     
+    # a scene found in several batches is merged by one task, never by two concurrent ones
+    scene_folders = {}
+    for _, scene_name, scene_folder in scenes_to_process:
+        scene_folders.setdefault(scene_name, []).append(scene_folder)
+
     print(f"Found {len(scenes_to_process)} scene(s) to reorganize")
-    
-    success_count = 0
-    skip_count = 0
-    
-    for batch_name, scene_name, scene_folder in tqdm(scenes_to_process, desc='Reorganizing'):
-        # Check if already reorganized (skip only if both images and sparse files exist)
-        target_scene = output_path / scene_name
-        images_exist = (target_scene / 'images').exists() and len(list((target_scene / 'images').glob('*.png'))) > 0
-        sparse_exist = (target_scene / 'sparse' / '0').exists() and (
-            (target_scene / 'sparse' / '0' / 'images.bin').exists() or
-            (target_scene / 'sparse' / '0' / 'images.txt').exists()
-        )
-        if target_scene.exists() and images_exist and sparse_exist:
-            skip_count += 1
-            continue
-        
-        try:
-            found_colmap, image_count = reorganize_to_colmap_structure(
-                str(scene_folder), scene_name, str(output_path)
-            )
-            success_count += 1
-            if image_count > 0:
-                print(f"✓ {scene_name}: {image_count} images, COLMAP files: {found_colmap}")
-        except Exception as e:
-            print(f"✗ Error processing {scene_name}: {e}")
-    
+    ledger = SceneLedger(str(output_path))
+
+    results = {}
+    with tqdm(total=len(scene_folders), desc='Reorganizing') as pbar:
+        def finish(scene_name, result):
+            results[scene_name] = result
+            status, found_colmap, image_count, error, image_method = result
+            if status == 'error':
+                print(f"✗ Error processing {scene_name}: {error}")
+            elif status == 'done' and image_count > 0:
+                print(f"✓ {scene_name}: {image_count} images ({image_method}), COLMAP files: {found_colmap}")
+            pbar.update(1)
+
+        if workers <= 1:
+            for scene_name, folders in scene_folders.items():
+                finish(scene_name, reorganize_scene(scene_name, folders, output_path, ledger, verify))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(reorganize_scene, scene_name, folders, output_path, ledger, verify): scene_name
+                           for scene_name, folders in scene_folders.items()}
+                for future in as_completed(futures):
+                    finish(futures[future], future.result())
+
+    statuses = [r[0] for r in results.values()]
+    failed = sorted(name for name, r in results.items() if r[0] == 'error')
     print(f"\nSummary:")
-    print(f"  Successfully reorganized: {success_count} scene(s)")
-    print(f"  Skipped (already exists): {skip_count} scene(s)")
+    print(f"  Successfully reorganized: {statuses.count('done')} scene(s), "
+          f"{sum(r[2] for r in results.values() if r[0] == 'done')} images")
+    methods = [r[4] for r in results.values() if r[0] == 'done' and r[4] is not None]
+    if methods:
+        print(f"  Image moves: " + ', '.join(f"{methods.count(m)} {m}" for m in sorted(set(methods))))
+    print(f"  Skipped (already exists): {statuses.count('skipped') + statuses.count('corrected')} scene(s)")
+    if verify:
+        print(f"  Ledger corrected from the output directory: {statuses.count('corrected')} scene(s)")
+    print(f"  Failed: {len(failed)} scene(s)")
+    for scene_name in failed:
+        print(f"    ✗ {scene_name}: {results[scene_name][3]}")
     print(f"  Output directory: {output_path}")
+    print(f"  Ledger: {ledger.path} ({len(ledger)} scene(s))")
 
 
 if __name__ == "__main__":
@@ -184,8 +333,12 @@ if __name__ == "__main__":
                         help='Optional: specific batch name (e.g., 1K). If not specified, processes all batches')
     parser.add_argument('--scene', type=str, default=None,
                         help='Optional: specific scene name (hash). If not specified, processes all scenes')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of scenes reorganized concurrently (threads)')
+    parser.add_argument('--verify', action='store_true',
+                        help='Re-derive the state of every scene from the output directory instead of trusting the ledger')
     
     args = parser.parse_args()
     
-    reorganize_dataset(args.input_dir, args.output_dir, args.batch, args.scene)
+    reorganize_dataset(args.input_dir, args.output_dir, args.batch, args.scene, args.workers, args.verify)
 
@@ -18,6 +18,19 @@ Usage examples:
 
   # Copy all scenes
   python scripts/copy_selected_scenes.py --input_dir data/dl3dv_colmap --output_dir data/dl3dv --all
+
+  # Build a subset without copying any data (hardlinks/reflinks on the same filesystem, copy otherwise)
+  python scripts/copy_selected_scenes.py --input_dir data/dl3dv_colmap --output_dir data/dl3dv --hash_file hashes.txt --link_mode auto
+
+Link modes (see file_links), applied to the image folders (images, images_2, ...) only:
+  copy      independent copy, copy_file_range in the kernel where possible (default)
+  hardlink  second name for the same files, no extra space, same filesystem only
+  reflink   copy-on-write clone (btrfs, xfs), no extra space until a file is modified
+  symlink   one link per image folder, breaks if the source is moved or removed
+  auto      reflink, then hardlink, then copy, decided per file
+A failed hardlink or reflink (e.g. across filesystems) falls back to a copy for that file.
+Everything else, sparse/ in particular (a few KB), is always copied: 5_rescale_cameras.py rewrites
+sparse/0 in place, through a hardlink or a symlink that would modify the source dataset.
 """
 
 import os
@@ -25,6 +38,7 @@ import shutil
 import argparse
 from pathlib import Path
 from tqdm import tqdm
+from file_links import LINK_MODES, link_file, link_tree
 
 
 def get_scene_list(input_dir: str, hash_name: str, hash_list: list, copy_all: bool):
@@ -68,13 +82,55 @@ def get_scene_list(input_dir: str, hash_name: str, hash_list: list, copy_all: bo
     return []
 
 
-def copy_scene(scene_name: str, input_dir: str, output_dir: str, overwrite: bool = False):
+def entry_link_mode(name: str, link_mode: str) -> str:
+    """Link mode of a scene entry: only the image folders are linked, the rest (sparse/) is modified in place
+    by the next steps and is always copied"""
+    return link_mode if name.startswith('images') else 'copy'
+
+
+def copy_tree(src: Path, dst: Path, link_mode: str = 'copy', methods: dict = None):
+    """Materialize src at dst with link_mode, counting the files per method actually used
+
+    :param methods: method -> number of files, updated in place
+    """
+    for method, count in link_tree(str(src), str(dst), link_mode).items():
+        if methods is not None:
+            methods[method] = methods.get(method, 0) + count
+
+
+def copy_scene_tree(src: Path, dst: Path, link_mode: str = 'copy', methods: dict = None):
+    """Materialize a whole scene folder, with link_mode for its image folders and a copy for the rest"""
+    if link_mode == 'copy':
+        copy_tree(src, dst, link_mode, methods)
+        return
+    dst.mkdir(parents=True, exist_ok=True)
+    for entry in sorted(src.iterdir()):
+        if entry.is_dir():
+            copy_tree(entry, dst / entry.name, entry_link_mode(entry.name, link_mode), methods)
+        elif not os.path.lexists(dst / entry.name):
+            method = link_file(str(entry), str(dst / entry.name), 'copy')
+            if methods is not None:
+                methods[method] = methods.get(method, 0) + 1
+
+
+def remove_tree(path: Path):
+    """Remove a scene folder, or the link to it (symlink mode)"""
+    if path.is_symlink():
+        path.unlink()
+    else:
+        shutil.rmtree(path)
+
+
+def copy_scene(scene_name: str, input_dir: str, output_dir: str, overwrite: bool = False, link_mode: str = 'copy',
+               methods: dict = None):
     """Copy a single scene from input to output directory
 
     :param scene_name: Scene name (hash)
     :param input_dir: Source directory
     :param output_dir: Destination directory
     :param overwrite: If True, overwrite existing files
+    :param link_mode: One of file_links.LINK_MODES
+    :param methods: method -> number of files, updated in place
     :return: Tuple of (success: bool, status: str) where status is 'copied', 'partial', or 'skipped'
     """
     input_path = Path(input_dir) / scene_name
@@ -112,8 +168,8 @@ def copy_scene(scene_name: str, input_dir: str, output_dir: str, overwrite: bool
             if images_src.exists() and is_empty_or_missing(images_dst):
                 try:
                     if images_dst.exists():
-                        shutil.rmtree(images_dst)  # Remove empty directory
-                    shutil.copytree(images_src, images_dst)
+                        remove_tree(images_dst)  # Remove empty directory
+                    copy_tree(images_src, images_dst, link_mode, methods)
                     copied_something = True
                 except Exception as e:
                     print(f"Error copying images for {scene_name}: {e}")
@@ -123,8 +179,8 @@ def copy_scene(scene_name: str, input_dir: str, output_dir: str, overwrite: bool
             if sparse_src.exists() and is_empty_or_missing(sparse_dst):
                 try:
                     if sparse_dst.exists():
-                        shutil.rmtree(sparse_dst)  # Remove empty directory
-                    shutil.copytree(sparse_src, sparse_dst)
+                        remove_tree(sparse_dst)  # Remove empty directory
+                    copy_tree(sparse_src, sparse_dst, entry_link_mode('sparse', link_mode), methods)
                     copied_something = True
                 except Exception as e:
                     print(f"Error copying sparse for {scene_name}: {e}")
@@ -136,11 +192,11 @@ def copy_scene(scene_name: str, input_dir: str, output_dir: str, overwrite: bool
                 return False, 'skipped'  # Both images and sparse already exist
         else:
             # Remove existing directory
-            shutil.rmtree(output_path)
+            remove_tree(output_path)
 
     # Copy the entire scene directory
     try:
-        shutil.copytree(input_path, output_path)
+        copy_scene_tree(input_path, output_path, link_mode, methods)
         return True, 'copied'
     except Exception as e:
         print(f"Error copying {scene_name}: {e}")
@@ -148,7 +204,7 @@ def copy_scene(scene_name: str, input_dir: str, output_dir: str, overwrite: bool
 
 
 def copy_scenes(input_dir: str, output_dir: str, hash_name: str, hash_list: list,
-                copy_all: bool, overwrite: bool):
+                copy_all: bool, overwrite: bool, link_mode: str = 'copy'):
     """Copy selected scenes from input to output directory
 
     :param input_dir: Source directory containing scene folders
@@ -157,6 +213,7 @@ def copy_scenes(input_dir: str, output_dir: str, hash_name: str, hash_list: list
     :param hash_list: List of hashes to copy
     :param copy_all: If True, copy all scenes
     :param overwrite: If True, overwrite existing scenes
+    :param link_mode: One of file_links.LINK_MODES
     """
     input_path = Path(input_dir)
     output_path = Path(output_dir)
@@ -178,16 +235,18 @@ def copy_scenes(input_dir: str, output_dir: str, hash_name: str, hash_list: list
 
     print(f"Found {len(scenes_to_copy)} scene(s) to copy")
     print(f"Source: {input_dir}")
-    print(f"Destination: {output_dir}\n")
+    print(f"Destination: {output_dir}")
+    print(f"Link mode: {link_mode}\n")
 
     # Copy scenes
     success_count = 0
     partial_count = 0
     skip_count = 0
     error_count = 0
+    methods = {}
 
     for scene_name in tqdm(scenes_to_copy, desc='Copying scenes'):
-        success, status = copy_scene(scene_name, input_dir, output_dir, overwrite)
+        success, status = copy_scene(scene_name, input_dir, output_dir, overwrite, link_mode, methods)
 
         if success:
             if status == 'copied':
@@ -205,6 +264,8 @@ def copy_scenes(input_dir: str, output_dir: str, hash_name: str, hash_list: list
     print(f"  Partially copied (images or sparse): {partial_count} scene(s)")
     print(f"  Skipped (already exists): {skip_count} scene(s)")
     print(f"  Failed: {error_count} scene(s)")
+    if methods:
+        print("  Files: " + ', '.join(f"{count} {method}" for method, count in sorted(methods.items())))
     print(f"  Destination: {output_path}")
 
 
@@ -232,6 +293,10 @@ if __name__ == "__main__":
     # Additional options
     parser.add_argument('--overwrite', action='store_true',
                         help='Overwrite existing scenes in output directory')
+    parser.add_argument('--link_mode', choices=LINK_MODES, default='copy',
+                        help='How the image folders are materialized: copy, hardlink, reflink, symlink (per image folder) '
+                             'or auto (reflink, then hardlink, then copy). Failed links fall back to a copy per file. '
+                             'sparse/ and the other files are always copied, the next steps modify them in place')
 
     args = parser.parse_args()
 
@@ -261,4 +326,4 @@ if __name__ == "__main__":
         exit(1)
 
     # Copy scenes
-    copy_scenes(args.input_dir, args.output_dir, args.hash, hash_list, args.all, args.overwrite)
+    copy_scenes(args.input_dir, args.output_dir, args.hash, hash_list, args.all, args.overwrite, args.link_mode)
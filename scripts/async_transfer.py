@@ -0,0 +1,292 @@
+""" Asyncio transfer engine with pooled keep-alive HTTP connections.
+
+    hf_hub_download opens the transfer of every file with its own metadata request and then
+    downloads it, for small files (colmap_cache zips, transforms.json, ...) the time goes into
+    connection setup and round trips rather than bytes. This engine:
+
+        - keeps the connections to every host (hub and CDN) open and reuses them (HTTP/1.1
+          keep-alive), at most max_per_host per host;
+        - sends a single GET per file on the resolve url and follows the redirect to the CDN,
+          the sizes and hashes come from the directory listings cached by hub_metadata instead
+          of a metadata request per file;
+        - runs all the transfers of the process on one event loop, so hundreds of small
+          transfers can be in flight without a thread each.
+
+    Only the standard library is used (asyncio streams, ssl). The download scripts drive it from
+    their worker threads through fetch(), see download.py --backend async.
+"""
+
+import os
+import ssl
+import asyncio
+import threading
+import urllib.parse
+from email.message import Message
+
+
+CHUNK = 1024 * 1024
+REDIRECTS = (301, 302, 303, 307, 308)
+
+
+class HTTPStatusError(Exception):
+    """ Error status of a response, code and headers follow urllib.error.HTTPError (see retry_policy) """
+
+    def __init__(self, url: str, code: int, reason: str, headers: Message):
+        super().__init__(f'HTTP {code} {reason} for {url}')
+        self.url = url
+        self.code = code
+        self.headers = headers
+
+
+class Connection:
+    __slots__ = ('key', 'reader', 'writer', 'reused')
+
+    def __init__(self, key, reader, writer):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+
+
+class ConnectionPool:
+    """ Idle keep-alive connections per (scheme, host, port) """
+
+    def __init__(self, max_per_host: int = 16, timeout: float = 60):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.ssl_context = ssl.create_default_context()
+        self.idle = {}
+        self.slots = {}
+        self.opened = 0
+
+    async def acquire(self, scheme: str, host: str, port: int) -> Connection:
+        key = (scheme, host, port)
+        if key not in self.slots:
+            self.slots[key] = asyncio.Semaphore(self.max_per_host)
+        await self.slots[key].acquire()
+        idle = self.idle.get(key, [])
+        while idle:
+            conn = idle.pop()
+            if not conn.writer.is_closing() and not conn.reader.at_eof():
+                conn.reused = True
+                return conn
+            conn.writer.close()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=self.ssl_context if scheme == 'https' else None,
+                                        server_hostname=host if scheme == 'https' else None),
+                self.timeout)
+        except BaseException:
+            self.slots[key].release()
+            raise
+        self.opened += 1
+        return Connection(key, reader, writer)
+
+    def release(self, conn: Connection, reusable: bool):
+        if reusable:
+            self.idle.setdefault(conn.key, []).append(conn)
+        else:
+            conn.writer.close()
+        self.slots[conn.key].release()
+
+    def close(self):
+        for conns in self.idle.values():
+            for conn in conns:
+                conn.writer.close()
+        self.idle.clear()
+
+
+class AsyncTransferEngine:
+    """ Downloads files over pooled HTTP/1.1 connections on a single event loop """
+
+    def __init__(self, headers: dict = None, max_per_host: int = 16, timeout: float = 60, max_redirects: int = 10,
+                 limiter=None):
+        """
+        :param headers: headers of every request (e.g. the hub authorization), Authorization is
+                        dropped when a redirect leaves the host
+        :param max_per_host: maximum number of connections per host
+        :param timeout: seconds without progress before a request fails
+        :param max_redirects: maximum number of redirects per transfer
+        :param limiter: bandwidth.TokenBucket shared with the other transfers, None for no limit
+        """
+        self.headers = dict(headers or {})
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.limiter = limiter
+        self.pool = None
+        self.loop = None
+        self.thread = None
+
+    async def request(self, method: str, url: str, headers: dict = None, dest: str = None):
+        """ One request on a pooled connection, the body is written to dest or returned.
+
+        :return: (status, reason, headers, body bytes or number of bytes written to dest)
+        """
+        if self.pool is None:
+            self.pool = ConnectionPool(self.max_per_host, self.timeout)
+        parts = urllib.parse.urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        lines = [f'{method} {target} HTTP/1.1', f'Host: {parts.netloc}', 'Connection: keep-alive']
+        lines += [f'{k}: {v}' for k, v in (headers or {}).items()]
+        raw_request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+        for attempt in range(2):
+            conn = await self.pool.acquire(parts.scheme, parts.hostname, port)
+            got_response = False
+            reusable = False
+            try:
+                conn.writer.write(raw_request)
+                await conn.writer.drain()
+                status, reason, response_headers = await self.read_head(conn.reader)
+                got_response = True
+                if 200 <= status < 300 and dest is not None:
+                    body = await self.read_body(conn.reader, method, status, response_headers, dest)
+                else:
+                    body = await self.read_body(conn.reader, method, status, response_headers, None)
+                reusable = (response_headers.get('Connection', '').lower() != 'close'
+                            and (method == 'HEAD' or 'Content-Length' in response_headers
+                                 or 'chunked' in response_headers.get('Transfer-Encoding', '').lower()))
+                return status, reason, response_headers, body
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                # a reused keep-alive connection the server closed in the meantime: retry on a new one
+                if conn.reused and not got_response and attempt == 0:
+                    continue
+                raise ConnectionError(f'{type(e).__name__} while reading {url}') from e
+            finally:
+                self.pool.release(conn, reusable)
+
+    async def read_head(self, reader):
+        status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+        if not status_line:
+            raise asyncio.IncompleteReadError(b'', None)
+        _, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+        headers = Message()
+        while True:
+            line = await asyncio.wait_for(reader.readline(), self.timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip()] = value.strip()
+        return int(status), reason, headers
+
+    async def read_body(self, reader, method: str, status: int, headers: Message, dest: str):
+        """ Read the response body into dest (returns the byte count) or into memory (returns bytes) """
+        out = open(dest, 'wb') if dest is not None else None
+        data = bytearray()
+        nbytes = 0
+
+        async def write(chunk):
+            nonlocal nbytes
+            nbytes += len(chunk)
+            if out is not None:
+                out.write(chunk)
+            else:
+                data.extend(chunk)
+            if self.limiter is not None:
+                await self.limiter.consume_async(len(chunk))
+
+        try:
+            if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+                pass
+            elif 'chunked' in headers.get('Transfer-Encoding', '').lower():
+                while True:
+                    size_line = await asyncio.wait_for(reader.readline(), self.timeout)
+                    size = int(size_line.split(b';')[0].strip() or b'0', 16)
+                    if size == 0:
+                        # trailers
+                        while (await asyncio.wait_for(reader.readline(), self.timeout)) not in (b'\r\n', b'\n', b''):
+                            pass
+                        break
+                    while size > 0:
+                        chunk = await asyncio.wait_for(reader.read(min(size, CHUNK)), self.timeout)
+                        if not chunk:
+                            raise asyncio.IncompleteReadError(b'', size)
+                        await write(chunk)
+                        size -= len(chunk)
+                    await asyncio.wait_for(reader.readexactly(2), self.timeout)
+            elif 'Content-Length' in headers:
+                remaining = int(headers['Content-Length'])
+                while remaining > 0:
+                    chunk = await asyncio.wait_for(reader.read(min(remaining, CHUNK)), self.timeout)
+                    if not chunk:
+                        raise asyncio.IncompleteReadError(b'', remaining)
+                    await write(chunk)
+                    remaining -= len(chunk)
+            else:
+                while True:
+                    chunk = await asyncio.wait_for(reader.read(CHUNK), self.timeout)
+                    if not chunk:
+                        break
+                    await write(chunk)
+        finally:
+            if out is not None:
+                out.close()
+        return nbytes if dest is not None else bytes(data)
+
+    async def download(self, url: str, dest: str) -> int:
+        """ GET url into dest, following the redirects. The file is written to dest.async.part first:
+        dest.part and dest.part.chunks belong to a resumable segmented_download of the same file
+        and are left alone.
+
+        :return: number of bytes written
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        tmp_file = dest + '.async.part'
+        headers = dict(self.headers)
+        host = urllib.parse.urlsplit(url).netloc
+        try:
+            for _ in range(self.max_redirects + 1):
+                status, reason, response_headers, body = await self.request('GET', url, headers, tmp_file)
+                if status in REDIRECTS and 'Location' in response_headers:
+                    url = urllib.parse.urljoin(url, response_headers['Location'])
+                    if urllib.parse.urlsplit(url).netloc != host:
+                        # do not send the credentials to another host (signed CDN url)
+                        headers.pop('Authorization', None)
+                    continue
+                if status >= 300:
+                    raise HTTPStatusError(url, status, reason, response_headers)
+                os.replace(tmp_file, dest)
+                return body
+            raise HTTPStatusError(url, 310, 'Too many redirects', Message())
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    async def download_many(self, transfers: list, concurrency: int = 256) -> list:
+        """ Run (url, dest) transfers concurrently.
+
+        :return: per transfer the number of bytes or the exception
+        """
+        limit = asyncio.Semaphore(concurrency)
+
+        async def one(url, dest):
+            async with limit:
+                return await self.download(url, dest)
+
+        return await asyncio.gather(*(one(url, dest) for url, dest in transfers), return_exceptions=True)
+
+    # blocking interface for the worker threads of the download scripts
+
+    def start(self):
+        """ Run the event loop in a background thread """
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+            self.thread.start()
+        return self
+
+    def fetch(self, url: str, dest: str) -> int:
+        """ Blocking download of url into dest, on the shared event loop """
+        return asyncio.run_coroutine_threadsafe(self.download(url, dest), self.start().loop).result()
+
+    def close(self):
+        if self.loop is not None:
+            if self.pool is not None:
+                self.loop.call_soon_threadsafe(self.pool.close)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop = None
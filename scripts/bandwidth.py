@@ -0,0 +1,101 @@
+""" Process-wide bandwidth shaping for the download workers.
+
+    A token bucket shared by all the transfers of the process: every transfer charges the bytes
+    it received and waits until the bucket is back in credit, so the total rate stays under the
+    cap however many workers run. The bucket holds at most burst_s seconds of credit, an idle
+    period does not turn into a burst.
+
+    The cap follows a time-of-day schedule, e.g. '08:00-20:00=30%' keeps the downloads at 30% of
+    the cap during the day (leaving the link to the training jobs) and at full speed otherwise.
+    Ranges may wrap around midnight, hours outside every range run at 100%.
+
+    Transfers that read their own sockets (segmented_download, remote_zip, async_transfer) are
+    throttled while they run. hf_hub_download cannot be, its bytes are charged once it returns:
+    the average rate holds but every single file arrives at full speed.
+"""
+
+import time
+import asyncio
+import threading
+
+
+MB = 1024 ** 2
+
+
+def parse_schedule(schedule: str) -> list:
+    """ '08:00-20:00=30%,22:00-06:00=200%' -> [(480, 1200, 0.3), (1320, 360, 2.0)], minutes of the day """
+    ranges = []
+    for part in schedule.split(','):
+        if not part.strip():
+            continue
+        try:
+            span, factor = part.split('=')
+            start, end = span.split('-')
+            factor = float(factor.strip().rstrip('%')) / 100
+            start, end = (int(h) * 60 + int(m) for h, m in (t.strip().split(':') for t in (start, end)))
+        except ValueError:
+            raise ValueError(f"Cannot parse the schedule entry {part!r}, expected e.g. '08:00-20:00=30%'") from None
+        if factor <= 0:
+            raise ValueError(f'The rate of {part!r} must be positive')
+        ranges.append((start, end, factor))
+    return ranges
+
+
+def schedule_factor(schedule: list, t: float = None) -> float:
+    """ Fraction of the cap at local time t (default now), 1.0 outside the scheduled ranges """
+    lt = time.localtime(t)
+    minute = lt.tm_hour * 60 + lt.tm_min
+    for start, end, factor in schedule:
+        if start <= minute < end or (end < start and (minute >= start or minute < end)):
+            return factor
+    return 1.0
+
+
+class TokenBucket:
+    """ Thread-safe token bucket in bytes, with a scheduled rate """
+
+    def __init__(self, max_rate: float, schedule: list = None, burst_s: float = 1.0):
+        """
+        :param max_rate: cap in bytes per second
+        :param schedule: parse_schedule ranges scaling the cap by the time of day
+        :param burst_s: seconds of credit the bucket can hold
+        """
+        self.max_rate = max_rate
+        self.schedule = schedule or []
+        self.burst_s = burst_s
+        self.lock = threading.Lock()
+        self.tokens = 0.0
+        self.last = time.monotonic()
+        self.total = 0
+
+    def rate(self) -> float:
+        """ Current cap in bytes per second """
+        return self.max_rate * schedule_factor(self.schedule)
+
+    def reserve(self, nbytes: int) -> float:
+        """ Charge nbytes and return the seconds the caller has to wait (never blocks) """
+        with self.lock:
+            now = time.monotonic()
+            rate = self.rate()
+            self.tokens = min(self.tokens + (now - self.last) * rate, rate * self.burst_s)
+            self.last = now
+            self.tokens -= nbytes
+            self.total += nbytes
+            return max(0.0, -self.tokens / rate)
+
+    def consume(self, nbytes: int):
+        """ Charge nbytes, sleeping until the bucket is back in credit """
+        delay = self.reserve(nbytes)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def consume_async(self, nbytes: int):
+        """ consume() for the transfers running on an event loop """
+        delay = self.reserve(nbytes)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def describe(self) -> str:
+        ranges = ', '.join(f'{s // 60:02d}:{s % 60:02d}-{e // 60:02d}:{e % 60:02d} at {f:.0%}'
+                           for s, e, f in self.schedule)
+        return f'{self.max_rate / MB:.1f} MB/s' + (f' ({ranges}, now {self.rate() / MB:.1f} MB/s)' if ranges else '')
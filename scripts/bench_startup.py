@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Benchmark the startup time of the download scripts
+
+Runs a download script in --dry_run mode several times in fresh interpreters and reports the
+wall time. The output directory is seeded with the manifest from cache/DL3DV-valid.csv, so no
+network access is needed.
+
+Usage examples:
+  python scripts/bench_startup.py
+  python scripts/bench_startup.py --script scripts/download.py --runs 20 -- --subset 1K
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+MANIFEST = SCRIPT_DIR.parent / 'cache' / 'DL3DV-valid.csv'
+
+
+def time_run(cmd: list):
+    """Run cmd once and return its wall time in seconds"""
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup time of a download script')
+    parser.add_argument('--script', type=str, default=str(SCRIPT_DIR / '1_download_specific.py'),
+                        help='Download script to benchmark')
+    parser.add_argument('--runs', type=int, default=10, help='Number of timed runs')
+    parser.add_argument('extra', nargs='*', help='Extra arguments passed to the script (after --)')
+    args = parser.parse_args()
+
+    script = Path(args.script)
+    odir_flag = '--odir' if script.name == 'download.py' else '--output_dir'
+    extra = args.extra or ['--subset', '1K']
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        os.makedirs(os.path.join(output_dir, '.cache'))
+        shutil.copy(MANIFEST, os.path.join(output_dir, '.cache', 'DL3DV-valid.csv'))
+        cmd = [sys.executable, str(script), odir_flag, output_dir, '--resolution', '960P',
+               '--file_type', 'images+poses', '--dry_run'] + extra
+
+        baseline = [sys.executable, '-c', 'pass']
+        time_run(cmd)  # warm up, also builds the manifest index
+        interp = [time_run(baseline) for _ in range(args.runs)]
+        times = [time_run(cmd) for _ in range(args.runs)]
+
+    print(f"Script: {script.name} {' '.join(extra)}")
+    print(f"  Interpreter only: median {statistics.median(interp) * 1000:.1f} ms")
+    print(f"  Dry run:          median {statistics.median(times) * 1000:.1f} ms, "
+          f"min {min(times) * 1000:.1f} ms, max {max(times) * 1000:.1f} ms ({args.runs} runs)")
+
+
+if __name__ == "__main__":
+    main()
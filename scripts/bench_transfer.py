@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Benchmark the transfer backends on many small files
+
+Starts a local HTTP stand-in for the hub: /resolve/<i> redirects to /cdn/<i>, which serves the
+file. Connection setup (TCP + TLS handshake to the hub) and the round trip of every request
+are emulated with server-side delays. Then the same files are downloaded, with the same number
+of transfers in flight (--concurrency), by:
+
+  - per-file requests: a metadata HEAD and a GET per file, like hf_hub_download, from a pool of
+    threads sharing one keep-alive requests.Session (as huggingface_hub does);
+  - the asyncio engine (async_transfer): one GET per file over pooled keep-alive connections.
+
+Both reuse their connections, so the difference is the HEAD round trip saved per file and the
+per-request CPU cost (requests in threads vs the event loop), not connection pooling. The ratio
+printed at the end reports 'no gain' unless the engine is at least 10% faster. The stand-in
+server shares the machine with the clients, on few cores it can be the bottleneck of both.
+Requires requests (a dependency of huggingface_hub).
+
+Usage examples:
+  python scripts/bench_transfer.py
+  python scripts/bench_transfer.py --files 500 --size_kb 64 --connect_ms 30 --rtt_ms 10 --concurrency 128
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from async_transfer import AsyncTransferEngine
+
+
+def make_server(size: int, connect_ms: float, rtt_ms: float):
+    """ Local hub stand-in on a free port, counts the connections it accepts """
+    body = os.urandom(size)
+    stats = {'connections': 0, 'requests': 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            with lock:
+                stats['connections'] += 1
+            time.sleep(connect_ms / 1000)
+
+        def respond(self, send_body: bool):
+            with lock:
+                stats['requests'] += 1
+            time.sleep(rtt_ms / 1000)
+            if self.path.startswith('/resolve/'):
+                self.send_response(302)
+                self.send_header('Location', '/cdn/' + self.path[len('/resolve/'):])
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            elif self.path.startswith('/cdn/'):
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+            else:
+                self.send_error(404)
+
+        def do_GET(self):
+            self.respond(True)
+
+        def do_HEAD(self):
+            self.respond(False)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # the default backlog (5) drops the connections opened at once and their SYN retries
+        # (1 s, 3 s, ...) would dominate the timings
+        request_queue_size = 1024
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+def per_file_requests(base_url: str, n: int, odir: str, concurrency: int):
+    """ HEAD (metadata, redirect not followed) + GET per file from a thread pool sharing one keep-alive session """
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+
+    def fetch(i):
+        url = f'{base_url}/resolve/{i}'
+        head = session.head(url, allow_redirects=False)
+        if head.status_code != 302:
+            head.raise_for_status()
+        with session.get(url, stream=True) as resp, open(os.path.join(odir, f'{i}.bin'), 'wb') as f:
+            resp.raise_for_status()
+            for chunk in resp.iter_content(1024 * 1024):
+                f.write(chunk)
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(fetch, range(n)))
+    finally:
+        session.close()
+
+
+def async_engine(base_url: str, n: int, odir: str, concurrency: int):
+    engine = AsyncTransferEngine(max_per_host=concurrency)
+    transfers = [(f'{base_url}/resolve/{i}', os.path.join(odir, f'{i}.bin')) for i in range(n)]
+    results = asyncio.run(engine.download_many(transfers, concurrency))
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        raise errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the transfer backends on many small files')
+    parser.add_argument('--files', type=int, default=300, help='Number of files')
+    parser.add_argument('--size_kb', type=int, default=64, help='Size of every file (KB)')
+    parser.add_argument('--connect_ms', type=float, default=20, help='Emulated connection setup time (ms)')
+    parser.add_argument('--rtt_ms', type=float, default=5, help='Emulated round trip time per request (ms)')
+    parser.add_argument('--concurrency', type=int, default=64,
+                        help='Transfers in flight, threads of the per-file baseline and tasks of the asyncio engine')
+    args = parser.parse_args()
+
+    server, stats = make_server(args.size_kb * 1024, args.connect_ms, args.rtt_ms)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    mb = args.files * args.size_kb / 1024
+
+    print(f'{args.files} files of {args.size_kb} KB, connect {args.connect_ms:g} ms, rtt {args.rtt_ms:g} ms, '
+          f'{args.concurrency} in flight')
+    rates = []
+    for name, run in [('Per-file requests', per_file_requests), ('Asyncio engine', async_engine)]:
+        with tempfile.TemporaryDirectory() as odir:
+            before = dict(stats)
+            start = time.perf_counter()
+            run(base_url, args.files, odir, args.concurrency)
+            elapsed = time.perf_counter() - start
+            assert len(os.listdir(odir)) == args.files
+        rates.append(args.files / elapsed)
+        print(f'  {name:18s}: {elapsed:6.2f}s, {args.files / elapsed:7.1f} files/s, '
+              f'{mb / elapsed:6.1f} MB/s, {stats["connections"] - before["connections"]} connection(s), '
+              f'{stats["requests"] - before["requests"]} request(s)')
+    ratio = rates[1] / rates[0]
+    verdict = 'no gain' if ratio < 1.1 else 'faster'
+    print(f'  Asyncio engine / per-file requests: {ratio:.2f}x ({verdict})')
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+""" Shared content-addressed cache for downloaded files.
+
+    A blob is keyed by (repo, path in the repo, etag), so a file is downloaded once no matter how
+    many output directories use it, and a new revision on the hub (new etag) never hits a stale
+    blob. Blobs are materialized into the output directories with reflinks or hardlinks (see
+    file_links).
+
+    The cache holds the files as downloaded. For files used as-is (videos, zips kept with
+    --keep_zip) a repeated pull is free. Scene zips are still extracted into every output
+    directory: only the transfer is saved, not the extraction.
+
+    Layout:
+        root/blobs/ab/abcdef...     the blobs, named by sha256(repo, path, etag)
+        root/tmp/                   staging area for in-progress downloads
+        root/index.sqlite           key -> repo, path, etag, size, last use, and the pins
+
+    The total size is bounded by max_bytes, the least recently used blobs are evicted first.
+    Several processes can share the cache: sqlite serializes the index updates and blobs are
+    moved into place with an atomic rename. A blob between get()/put() and materialize() is
+    pinned in the index, so the eviction of another process skips it too. Pins expire after
+    PIN_TTL, a crashed process does not pin its blobs forever.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+from file_links import link_file
+
+
+PIN_TTL = 3600
+
+
+class BlobCache:
+    """ Content-addressed, LRU-bounded cache of downloaded files """
+
+    def __init__(self, root: str, max_bytes: int):
+        """
+        :param root: cache directory, can be shared by several output directories and processes
+        :param max_bytes: maximum total size of the blobs, least recently used ones are evicted first
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(root, 'blobs'), exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(root, 'index.sqlite'), timeout=60, check_same_thread=False,
+                                  isolation_level=None)
+        self.db.execute('CREATE TABLE IF NOT EXISTS blobs (key TEXT PRIMARY KEY, repo TEXT, path TEXT, etag TEXT, '
+                        'size INTEGER, last_used REAL)')
+        # blobs being materialized right now, by any process sharing the cache, never evicted
+        self.db.execute('CREATE TABLE IF NOT EXISTS pins (key TEXT, owner TEXT, expires REAL)')
+
+    @staticmethod
+    def owner() -> str:
+        """ Pin owner: get/put and materialize run in the same thread """
+        return f'{os.getpid()}-{threading.get_ident()}'
+
+    def pin(self, key: str):
+        self.db.execute('INSERT INTO pins VALUES (?, ?, ?)', (key, self.owner(), time.time() + PIN_TTL))
+
+    def unpin(self, key: str):
+        self.db.execute('DELETE FROM pins WHERE key = ? AND owner = ?', (key, self.owner()))
+
+    @property
+    def tmp_dir(self) -> str:
+        return os.path.join(self.root, 'tmp')
+
+    @staticmethod
+    def key(repo: str, path: str, etag: str) -> str:
+        return hashlib.sha256(f'{repo}\0{path}\0{etag}'.encode()).hexdigest()
+
+    def blob_path(self, key: str) -> str:
+        return os.path.join(self.root, 'blobs', key[:2], key)
+
+    def get(self, repo: str, path: str, etag: str):
+        """ Path of the cached blob, None on a cache miss. A hit is pinned until materialize. """
+        key = self.key(repo, path, etag)
+        blob = self.blob_path(key)
+        with self.lock:
+            if not os.path.exists(blob):
+                self.db.execute('DELETE FROM blobs WHERE key = ?', (key,))
+                return None
+            self.db.execute('UPDATE blobs SET last_used = ? WHERE key = ?', (time.time(), key))
+            self.pin(key)
+        return blob
+
+    def put(self, repo: str, path: str, etag: str, src_file: str) -> str:
+        """ Move a downloaded file into the cache. The blob is pinned until materialize.
+
+        :param src_file: the downloaded file, should live on the same filesystem (e.g. in tmp_dir)
+        :return: the blob path
+        """
+        key = self.key(repo, path, etag)
+        blob = self.blob_path(key)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        os.replace(src_file, blob)
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)',
+                            (key, repo, path, etag, os.path.getsize(blob), time.time()))
+            self.pin(key)
+        self.evict()
+        return blob
+
+    def materialize(self, blob: str, dst: str, mode: str = 'auto') -> str:
+        """ Link (or copy) a blob to dst and unpin it.
+
+        :return: the method used, see file_links.link_file
+        :raise FileNotFoundError: if the blob vanished (removed by hand, or evicted by an older version), fetch it again
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+        if os.path.lexists(dst):
+            os.remove(dst)
+        try:
+            return link_file(blob, dst, mode)
+        finally:
+            with self.lock:
+                self.unpin(os.path.basename(blob))
+
+    def total_bytes(self) -> int:
+        with self.lock:
+            return self.db.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+
+    def evict(self):
+        """ Remove least recently used blobs until the cache fits in max_bytes """
+        with self.lock:
+            total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            now = time.time()
+            self.db.execute('DELETE FROM pins WHERE expires < ?', (now,))
+            pinned = {key for key, in self.db.execute('SELECT key FROM pins')}
+            rows = self.db.execute('SELECT key, size FROM blobs ORDER BY last_used ASC').fetchall()
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                if key in pinned:
+                    continue
+                try:
+                    os.remove(self.blob_path(key))
+                except FileNotFoundError:
+                    pass
+                self.db.execute('DELETE FROM blobs WHERE key = ?', (key,))
+                total -= size
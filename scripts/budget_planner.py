@@ -0,0 +1,204 @@
+""" Fit a download into a byte budget (e.g. "2 TB of 2K frames") instead of a scene count.
+
+    - Size model: the size of a scene in a repo (a resolution / file type) is roughly
+      proportional to the length of its video. A line bytes = slope * duration + intercept is
+      fitted per repo on the sizes observed in the remote metadata cache (hub_metadata, filled by
+      --prefetch) against the durations of the manifest. Without observations the per-repo
+      default size of disk_admission is spread over the average duration. Scenes whose size is
+      known are counted with their real size.
+    - Selection: greedy. For the 'count' objective the smallest scenes first (which maximizes
+      the number of scenes), for 'duration' the best seconds-per-byte first. With strata (batch
+      or a scene attribute) the budget is split in proportion to the number of candidates of
+      every stratum, and what a stratum leaves unused is then filled from all the strata.
+    - ETA: predicted bytes over the per-stream throughput of the previous downloads
+      (download_metrics events) times the number of workers.
+"""
+
+import os
+import json
+import math
+
+from disk_admission import DEFAULT_ITEM_BYTES, GB
+from download_metrics import percentile
+
+
+MB = 1024 ** 2
+MIN_OBSERVATIONS = 3
+
+
+def scene_hash(rel_path: str) -> str:
+    """ '1K/<hash>.zip' or '1K/<hash>/video.mp4' -> '<hash>' """
+    return rel_path.split('/')[1].replace('.zip', '')
+
+
+class SizeModel:
+    """ Per-repo linear model of the scene size as a function of the video duration """
+
+    def __init__(self, mean_duration: float):
+        """
+        :param mean_duration: average video duration of the manifest, scales the default sizes
+        """
+        self.mean_duration = mean_duration if mean_duration > 0 else 60.0
+        self.observations = {}
+        self.coefs = {}
+
+    def observe(self, repo: str, duration: float, nbytes: int):
+        if duration > 0 and not math.isnan(duration) and nbytes > 0:
+            self.observations.setdefault(repo, []).append((duration, nbytes))
+
+    def fit(self):
+        """ Least squares per repo, a line through the origin when there are few or similar points """
+        for repo, points in self.observations.items():
+            n = len(points)
+            mean_d = sum(d for d, _ in points) / n
+            mean_b = sum(b for _, b in points) / n
+            var_d = sum((d - mean_d) ** 2 for d, _ in points)
+            if n >= MIN_OBSERVATIONS and var_d > 0:
+                slope = sum((d - mean_d) * (b - mean_b) for d, b in points) / var_d
+                intercept = mean_b - slope * mean_d
+                if slope > 0:
+                    self.coefs[repo] = (slope, intercept)
+                    continue
+            self.coefs[repo] = (sum(b for _, b in points) / sum(d for d, _ in points), 0.0)
+
+    def is_calibrated(self, repo: str) -> bool:
+        return repo in self.coefs
+
+    def predict(self, repo: str, duration: float) -> int:
+        if repo in self.coefs:
+            slope, intercept = self.coefs[repo]
+        else:
+            slope, intercept = DEFAULT_ITEM_BYTES.get(repo, GB) / self.mean_duration, 0.0
+        if math.isnan(duration) or duration <= 0:
+            duration = self.mean_duration
+        return max(1, int(slope * duration + intercept))
+
+
+def stream_rate(metrics_file: str):
+    """ Median per-stream throughput (bytes/s) of the successful downloads recorded in metrics_file """
+    if metrics_file is None or not os.path.exists(metrics_file):
+        return None
+    rates = []
+    with open(metrics_file, 'r') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if event.get('ok') and event.get('bytes', 0) > 0 and event.get('wall_s', 0) > 1:
+                rates.append(event['bytes'] / event['wall_s'])
+    return percentile(rates, 50) if rates else None
+
+
+def select_greedy(candidates: list, budget: int, objective: str) -> list:
+    """ Greedy pick of (item, nbytes, duration) under budget bytes """
+    if objective == 'count':
+        order = sorted(candidates, key=lambda c: c[1])
+    else:
+        order = sorted(candidates, key=lambda c: (c[2] if not math.isnan(c[2]) else 0) / c[1], reverse=True)
+    chosen, used = [], 0
+    for c in order:
+        if used + c[1] <= budget:
+            chosen.append(c)
+            used += c[1]
+    return chosen
+
+
+class BudgetPlan:
+    """ The scenes selected under a byte budget and the predicted transfer """
+
+    def __init__(self, selected: list, count: int, candidates: int, budget: int, known_bytes: int, predicted_bytes: int,
+                 duration: float, rate: float, workers: int, uncalibrated: list):
+        self.selected = selected
+        self.count = count
+        self.candidates = candidates
+        self.budget = budget
+        self.known_bytes = known_bytes
+        self.predicted_bytes = predicted_bytes
+        self.duration = duration
+        self.rate = rate
+        self.workers = workers
+        self.uncalibrated = uncalibrated
+
+    @property
+    def total_bytes(self) -> int:
+        return self.known_bytes + self.predicted_bytes
+
+    def eta_s(self):
+        if self.rate is None:
+            return None
+        return self.total_bytes / (self.rate * max(1, self.workers))
+
+    def print_summary(self):
+        print(f'Budget plan: {self.count}/{self.candidates} scene(s) within {self.budget / GB:.1f} GB, '
+              f'{self.total_bytes / GB:.2f} GB to download ({self.known_bytes / GB:.2f} GB known, '
+              f'{self.predicted_bytes / GB:.2f} GB predicted), {self.duration / 3600:.1f} h of video')
+        for repo in self.uncalibrated:
+            print(f'  {repo}: no observed sizes, using the default scene size (run with --prefetch to calibrate)')
+        eta = self.eta_s()
+        if eta is None:
+            print('  ETA: unknown (no previous downloads to measure the throughput)')
+        else:
+            print(f'  ETA: {eta / 3600:.1f} h at {self.rate / MB:.1f} MB/s per stream x {self.workers} worker(s)')
+
+
+def plan_budget(download_list: list, index, remote_meta, budget_bytes: int, objective: str = 'count',
+                strata: dict = None, metrics_file: str = None, workers: int = 1, skip: set = None) -> BudgetPlan:
+    """ Select the items of download_list that fit in budget_bytes.
+
+    :param download_list: candidate items, [{'repo', 'rel_path'}]
+    :param index: manifest_index.ManifestIndex, gives the durations
+    :param remote_meta: hub_metadata.RemoteMetadata, observed sizes (None to use the defaults only)
+    :param budget_bytes: bytes that may be downloaded
+    :param objective: 'count' to maximize the number of scenes, 'duration' the total video duration
+    :param strata: hash -> stratum (e.g. batch or attribute value), None for no stratification
+    :param metrics_file: download_metrics jsonl file of the previous runs, for the ETA
+    :param workers: number of concurrent downloads, for the ETA
+    :param skip: rel_paths already downloaded, they are kept and cost nothing
+    :return: the BudgetPlan, selected items (and the skipped ones) in download_list order
+    """
+    skip = skip or set()
+    model = SizeModel(sum(d for d in index.durations if not math.isnan(d)) / max(1, len(index)))
+    if remote_meta is not None:
+        for repo, files in remote_meta.files.items():
+            for rel_path, meta in files.items():
+                # scene files only ('<batch>/<hash>.zip' or '<batch>/<hash>/video.mp4')
+                if not (rel_path.endswith('.zip') or rel_path.endswith('/video.mp4')) or rel_path.count('/') < 1:
+                    continue
+                h = scene_hash(rel_path)
+                if h in index:
+                    model.observe(repo, index.duration(h), meta['size'])
+    model.fit()
+
+    candidates = []
+    for item in download_list:
+        if item['rel_path'] in skip:
+            continue
+        h = scene_hash(item['rel_path'])
+        duration = index.duration(h) if h in index else float('nan')
+        meta = remote_meta.get(item['repo'], item['rel_path']) if remote_meta is not None else None
+        nbytes = meta['size'] if meta is not None else model.predict(item['repo'], duration)
+        candidates.append((item, nbytes, duration, meta is not None))
+
+    if strata is None:
+        chosen = select_greedy(candidates, budget_bytes, objective)
+    else:
+        groups = {}
+        for c in candidates:
+            groups.setdefault(strata.get(scene_hash(c[0]['rel_path'])), []).append(c)
+        chosen = []
+        for group in groups.values():
+            chosen += select_greedy(group, budget_bytes * len(group) // max(1, len(candidates)), objective)
+        # fill what the strata left unused
+        used = sum(c[1] for c in chosen)
+        taken = {id(c) for c in chosen}
+        chosen += select_greedy([c for c in candidates if id(c) not in taken], budget_bytes - used, objective)
+
+    chosen_paths = {c[0]['rel_path'] for c in chosen}
+    selected = [item for item in download_list if item['rel_path'] in chosen_paths or item['rel_path'] in skip]
+    uncalibrated = sorted({c[0]['repo'] for c in chosen if not c[3] and not model.is_calibrated(c[0]['repo'])})
+    return BudgetPlan(selected, len(chosen), len(candidates), budget_bytes,
+                      known_bytes=sum(c[1] for c in chosen if c[3]),
+                      predicted_bytes=sum(c[1] for c in chosen if not c[3]),
+                      duration=sum(c[2] for c in chosen if not math.isnan(c[2])),
+                      rate=stream_rate(metrics_file), workers=workers, uncalibrated=uncalibrated)
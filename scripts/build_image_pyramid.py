@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""Build downsampled copies of the frames of reorganized scenes
+
+Instead of downloading the same scenes at 960P, 2K and 4K (2.8T + 11T + 44T), download the
+highest resolution once and derive the lower ones locally:
+
+    input_dir/hash_name/images/frame_00001.png
+    ->
+    input_dir/hash_name/images_2/frame_00001.png   (1/2 width and height)
+    input_dir/hash_name/images_4/frame_00001.png   (1/4)
+    input_dir/hash_name/images_8/frame_00001.png   (1/8)
+
+Every frame is decoded once and all its levels are produced from that decode. The output size
+is floor(size / factor). The default 'area' resampling averages the source pixels covered by
+each output pixel (PIL box filter), which does not alias. 'lanczos' is sharper and slower.
+
+Frames are spread over a pool of processes (decoding and PNG encoding are CPU bound). An output
+whose mtime is newer than its source is kept, so an interrupted run resumes where it stopped and
+a re-downloaded scene is processed again. Outputs are written to a temp file and renamed into
+place, a killed run never leaves a truncated frame that looks up to date.
+
+--benchmark runs a sample of frames into a temp folder with 1, 2, 4, ... --workers processes and
+reports the throughput in frames per second.
+
+Usage examples:
+  python scripts/build_image_pyramid.py --input_dir DL3DV-10K-colmap --factors 2,4,8 --workers 16
+  python scripts/build_image_pyramid.py --input_dir DL3DV-10K-colmap --benchmark --workers 16
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from tqdm import tqdm
+
+
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg')
+RESAMPLE = {
+    'area': Image.BOX,
+    'lanczos': Image.LANCZOS,
+}
+
+
+def parse_factors(factors: str) -> list:
+    """ '2,4,8' -> [2, 4, 8] """
+    values = sorted({int(f) for f in factors.split(',') if f.strip()})
+    if not values or values[0] < 2:
+        raise argparse.ArgumentTypeError('factors must be integers >= 2, e.g. 2,4,8')
+    return values
+
+
+def find_scenes(input_path: Path, scene_name: str = None) -> list:
+    """ Scene folders (hash_name) with an images folder """
+    if scene_name:
+        candidates = [input_path / scene_name]
+    else:
+        candidates = sorted(p for p in input_path.iterdir() if p.is_dir() and not p.name.startswith('.'))
+    return [p for p in candidates if (p / 'images').is_dir()]
+
+
+def is_fresh(output_file: str, source_mtime: int) -> bool:
+    try:
+        return os.stat(output_file).st_mtime_ns >= source_mtime
+    except FileNotFoundError:
+        return False
+
+
+def downsample_frame(source_file: str, outputs: list, resample: str = 'area', compress_level: int = 6) -> int:
+    """ Decode a frame once and write its downsampled levels
+
+    :param source_file: the full resolution frame
+    :param outputs: [(output file, factor)]
+    :param resample: key of RESAMPLE
+    :param compress_level: PNG compression level (0-9), lower is faster and larger
+    :return: number of outputs written
+    """
+    source_mtime = os.stat(source_file).st_mtime_ns
+    outputs = [(f, factor) for f, factor in outputs if not is_fresh(f, source_mtime)]
+    if not outputs:
+        return 0
+    with Image.open(source_file) as img:
+        img.load()
+        width, height = img.size
+        for output_file, factor in outputs:
+            size = (max(1, width // factor), max(1, height // factor))
+            level = img.resize(size, RESAMPLE[resample], reducing_gap=None if resample == 'area' else 3.0)
+            directory, name = os.path.split(output_file)
+            tmp_file = os.path.join(directory, f'.{name}.{os.getpid()}.tmp')
+            try:
+                if name.lower().endswith('.png'):
+                    level.save(tmp_file, format='PNG', compress_level=compress_level)
+                else:
+                    level.save(tmp_file, format='JPEG', quality=95)
+                os.replace(tmp_file, output_file)
+            finally:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+    return len(outputs)
+
+
+def downsample_task(task: tuple) -> tuple:
+    """ Process pool entry point, never raises: (source_file, written, error) """
+    source_file, outputs, resample, compress_level = task
+    try:
+        return source_file, downsample_frame(source_file, outputs, resample, compress_level), None
+    except Exception as e:
+        return source_file, 0, f'{type(e).__name__}: {e}'
+
+
+def plan_tasks(scenes: list, factors: list, resample: str, compress_level: int, output_root: Path = None) -> list:
+    """ One task per source frame, with the levels of that frame """
+    tasks = []
+    for scene in scenes:
+        out_scene = output_root / scene.name if output_root is not None else scene
+        for factor in factors:
+            (out_scene / f'images_{factor}').mkdir(parents=True, exist_ok=True)
+        with os.scandir(scene / 'images') as entries:
+            names = sorted(e.name for e in entries if e.name.lower().endswith(IMAGE_SUFFIXES))
+        for name in names:
+            outputs = [(str(out_scene / f'images_{factor}' / name), factor) for factor in factors]
+            tasks.append((str(scene / 'images' / name), outputs, resample, compress_level))
+    return tasks
+
+
+def run_tasks(tasks: list, workers: int, desc: str = None) -> dict:
+    """ Run the tasks on a process pool, return per scene [frames, frames decoded, outputs written, errors] """
+    stats = {}
+    chunksize = max(1, min(32, len(tasks) // (workers * 8) or 1))
+    with ProcessPoolExecutor(max_workers=workers) as executor, \
+            tqdm(total=len(tasks), desc=desc, disable=desc is None) as pbar:
+        for source_file, written, error in executor.map(downsample_task, tasks, chunksize=chunksize):
+            scene = Path(source_file).parent.parent.name
+            entry = stats.setdefault(scene, [0, 0, 0, []])
+            entry[0] += 1
+            entry[1] += written > 0
+            entry[2] += written
+            if error is not None:
+                entry[3].append(f'{Path(source_file).name}: {error}')
+            pbar.update(1)
+    return stats
+
+
+def build_pyramid(input_dir: str, factors: list, scene_name: str = None, workers: int = 4, resample: str = 'area',
+                  compress_level: int = 6):
+    """ Build the images_N levels of every scene
+
+    :param input_dir: COLMAP root containing hash_name/images folders
+    :param factors: downsampling factors, e.g. [2, 4, 8]
+    :param scene_name: optional scene name (hash)
+    :param workers: number of processes
+    :param resample: 'area' or 'lanczos'
+    :param compress_level: PNG compression level (0-9)
+    """
+    input_path = Path(input_dir)
+    scenes = find_scenes(input_path, scene_name)
+    if not scenes:
+        print(f"No scenes with an images folder found in {input_dir}")
+        return
+
+    tasks = plan_tasks(scenes, factors, resample, compress_level)
+    print(f"Found {len(scenes)} scene(s), {len(tasks)} frame(s), levels: {', '.join(f'images_{f}' for f in factors)}")
+
+    start = time.perf_counter()
+    stats = run_tasks(tasks, workers, desc='Downsampling')
+    elapsed = time.perf_counter() - start
+
+    success_count, skip_count, failed = 0, 0, []
+    for scene in sorted(stats):
+        frames, _, written, errors = stats[scene]
+        if errors:
+            failed.append(scene)
+            print(f"✗ Error processing {scene}: {len(errors)} frame(s) failed, first: {errors[0]}")
+        elif written == 0:
+            skip_count += 1
+        else:
+            success_count += 1
+            print(f"✓ {scene}: {frames} frames, {written} output(s)")
+
+    decoded = sum(s[1] for s in stats.values())
+    print(f"\nSummary:")
+    print(f"  Successfully processed: {success_count} scene(s)")
+    print(f"  Skipped (up to date): {skip_count} scene(s)")
+    print(f"  Failed: {len(failed)} scene(s)")
+    print(f"  Throughput: {decoded / elapsed:.1f} frames/s ({decoded} frame(s) in {elapsed:.1f}s, {workers} worker(s))")
+
+
+def benchmark(input_dir: str, factors: list, scene_name: str = None, workers: int = 4, resample: str = 'area',
+              compress_level: int = 6, frames: int = 64):
+    """ Downsample a sample of frames into a temp folder with 1, 2, 4, ... workers and print the frames/s """
+    scenes = find_scenes(Path(input_dir), scene_name)
+    if not scenes:
+        print(f"No scenes with an images folder found in {input_dir}")
+        return
+    counts = []
+    n = 1
+    while n < workers:
+        counts.append(n)
+        n *= 2
+    counts.append(workers)
+
+    tmp_root = Path(tempfile.mkdtemp(prefix='.pyramid-bench-', dir=input_dir))
+    try:
+        tasks = []
+        for scene in scenes:
+            tasks += plan_tasks([scene], factors, resample, compress_level, tmp_root)
+            if len(tasks) >= frames:
+                break
+        tasks = tasks[:frames]
+        with Image.open(tasks[0][0]) as img:
+            size = img.size
+        print(f"Benchmark: {len(tasks)} frame(s) of {size[0]}x{size[1]}, levels "
+              f"{', '.join(f'images_{f}' for f in factors)}, {resample} resampling, PNG level {compress_level}")
+        for n in counts:
+            # start every run from empty output folders
+            for _, outputs, _, _ in tasks:
+                for output_file, _ in outputs:
+                    if os.path.exists(output_file):
+                        os.remove(output_file)
+            start = time.perf_counter()
+            stats = run_tasks(tasks, n)
+            elapsed = time.perf_counter() - start
+            errors = [e for s in stats.values() for e in s[3]]
+            if errors:
+                print(f"  ✗ {errors[0]}")
+                return
+            print(f"  {n:3d} worker(s): {len(tasks) / elapsed:7.1f} frames/s")
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build downsampled copies (images_2/4/8) of the frames of reorganized scenes')
+    parser.add_argument('--input_dir', type=str, required=True,
+                        help='COLMAP root containing hash_name/images folders (output of 2_reorganize_to_colmap.py)')
+    parser.add_argument('--factors', type=parse_factors, default=[2, 4, 8],
+                        help='Comma-separated downsampling factors, one images_N folder each')
+    parser.add_argument('--scene', type=str, default=None,
+                        help='Optional: specific scene name (hash). If not specified, processes all scenes')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4,
+                        help='Number of processes (decode + resample + encode)')
+    parser.add_argument('--resample', choices=list(RESAMPLE), default='area',
+                        help='Resampling filter: area (box average) or lanczos')
+    parser.add_argument('--compress_level', type=int, default=6,
+                        help='PNG compression level (0-9), lower is faster and larger')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Measure the throughput on a sample of frames (written to a temp folder) instead of processing the scenes')
+    parser.add_argument('--bench_frames', type=int, default=64,
+                        help='Number of frames of the --benchmark sample')
+
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.input_dir, args.factors, args.scene, args.workers, args.resample, args.compress_level,
+                  args.bench_frames)
+    else:
+        build_pyramid(args.input_dir, args.factors, args.scene, args.workers, args.resample, args.compress_level)
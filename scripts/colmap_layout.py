@@ -0,0 +1,134 @@
+""" Mapping of the files of a downloaded scene to the COLMAP layout.
+
+    Same rules as 2_reorganize_to_colmap.py, applied to a list of relative paths instead of a
+    folder on disk, so a scene zip can be read (zip_scene) or extracted directly in the COLMAP
+    layout:
+
+        images_X/<frame>.png            -> images/<frame>.png, or images/<stem>_images_X.png when
+                                           an earlier images_X folder already used the name
+        transforms.json                 -> transforms.json
+        <colmap file>                   -> sparse/0/<colmap file>
+        <subdir>/<colmap file>          -> sparse/0/<colmap file>
+        <subdir>/sparse/0/<colmap file> -> sparse/0/<colmap file>
+
+    extract_zip_colmap writes a downloaded zip directly in that layout (download.py --colmap_dir),
+    which saves writing every frame twice and the whole 2_reorganize_to_colmap.py pass.
+"""
+
+import os
+import shutil
+import zipfile
+import threading
+import posixpath
+
+from disk_admission import check_members
+
+
+COLMAP_FILES = ['images.bin', 'images.txt', 'cameras.bin', 'cameras.txt',
+                'points3D.bin', 'points3D.txt', 'points3D.ply']
+
+
+def strip_scene_folder(names: list):
+    """ Remove the top-level folder shared by all the names (the scene hash in the zips)
+
+    :return: (prefix, list of relative names), prefix is '' if there is no shared folder
+    """
+    files = [n for n in names if not n.endswith('/')]
+    tops = {n.split('/', 1)[0] for n in files}
+    if len(tops) == 1 and all('/' in n for n in files):
+        prefix = tops.pop() + '/'
+        return prefix, [n[len(prefix):] for n in files]
+    return '', files
+
+
+def colmap_layout(names: list) -> dict:
+    """ Map scene-relative file names to their path in the COLMAP layout.
+
+    :param names: file names relative to the scene folder, '/' separated
+    :return: COLMAP relative path -> scene relative name (files that have no place are left out)
+    """
+    layout = {}
+    names = sorted(names)
+
+    # images: images_X folders in sorted order, first come first served on name collisions
+    image_dirs = sorted({n.split('/', 1)[0] for n in names if n.startswith('images_') and n.count('/') == 1})
+    by_dir = {}
+    for n in names:
+        top, _, rest = n.partition('/')
+        if top in image_dirs and '/' not in rest and rest.endswith('.png'):
+            by_dir.setdefault(top, []).append(rest)
+    for img_dir in image_dirs:
+        for file_name in by_dir.get(img_dir, []):
+            dest = f'images/{file_name}'
+            if dest in layout:
+                stem, suffix = posixpath.splitext(file_name)
+                dest = f'images/{stem}_{img_dir}{suffix}'
+            layout[dest] = f'{img_dir}/{file_name}'
+
+    if 'transforms.json' in names:
+        layout['transforms.json'] = 'transforms.json'
+
+    # COLMAP model: scene root first, then the subfolders (later ones win, like shutil.move)
+    for colmap_file in COLMAP_FILES:
+        if colmap_file in names:
+            layout[f'sparse/0/{colmap_file}'] = colmap_file
+    subdirs = sorted({n.split('/', 1)[0] for n in names if '/' in n and not n.startswith('images_')})
+    for subdir in subdirs:
+        for colmap_file in COLMAP_FILES:
+            for src in (f'{subdir}/{colmap_file}', f'{subdir}/sparse/0/{colmap_file}'):
+                if src in names:
+                    layout[f'sparse/0/{colmap_file}'] = src
+    return layout
+
+
+def extract_zip_colmap(zip_file: str, scene_folder: str, rest_dir: str = None):
+    """ Extract a scene zip straight into the COLMAP layout, without an intermediate tree.
+
+        The members are written into a hidden temp folder next to scene_folder, which is renamed
+        into place once complete. If scene_folder exists (another zip of the same scene, e.g.
+        images+poses then colmap_cache), the files are moved into it instead, replacing the
+        files of the same name. Members with no place in the layout are extracted into rest_dir
+        as a plain extraction would (dropped if rest_dir is None).
+
+    :param zip_file: the scene zip
+    :param scene_folder: the COLMAP scene folder, e.g. colmap_dir/<hash>
+    :param rest_dir: where the members outside the layout go, e.g. output_dir/<batch>
+    :return: number of extracted (uncompressed) bytes
+    """
+    parent, scene = os.path.split(os.path.abspath(scene_folder))
+    tmp_dir = os.path.join(parent, f'.{scene}.extracting-{os.getpid()}-{threading.get_ident()}')
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    extracted_bytes = 0
+    try:
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            check_members(zip_ref)
+            infos = {info.filename: info for info in zip_ref.infolist() if not info.is_dir()}
+            prefix, names = strip_scene_folder(list(infos))
+            layout = colmap_layout(names)
+            for dest, src in layout.items():
+                info = infos[prefix + src]
+                path = os.path.join(tmp_dir, *dest.split('/'))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with zip_ref.open(info) as fsrc, open(path, 'wb') as fdst:
+                    shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+                extracted_bytes += info.file_size
+            if rest_dir is not None:
+                mapped = {prefix + src for src in layout.values()}
+                for name, info in infos.items():
+                    if name not in mapped:
+                        zip_ref.extract(info, rest_dir)
+                        extracted_bytes += info.file_size
+        try:
+            os.rename(tmp_dir, scene_folder)
+        except OSError:
+            # the scene folder exists: merge
+            for root, _, files in os.walk(tmp_dir):
+                out_root = os.path.join(scene_folder, os.path.relpath(root, tmp_dir))
+                os.makedirs(out_root, exist_ok=True)
+                for name in files:
+                    os.replace(os.path.join(root, name), os.path.join(out_root, name))
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return extracted_bytes
@@ -0,0 +1,164 @@
+""" Disk-space-aware admission control for the download scripts.
+
+    Before a download starts we reserve the bytes it will need on the output volume: the
+    compressed file plus, for zips, the extracted scene (both exist while extracting). A new
+    download waits while the free space minus the bytes reserved by in-flight items would drop
+    below the watermark. If nothing is in flight and the item still does not fit, it fails
+    instead of waiting forever.
+
+    The compressed size comes from the remote metadata when available, otherwise from the
+    sizes observed so far in the run, otherwise from a per-repo default. The extracted size is
+    estimated with the extracted/compressed ratio observed on the zips extracted so far.
+"""
+
+import os
+import shutil
+import zipfile
+import threading
+
+from verify_scenes import zip_members, save_members
+
+
+GB = 1024 ** 3
+
+# rough average size of one item per repo (full dataset size / number of scenes)
+DEFAULT_ITEM_BYTES = {
+    'DL3DV/DL3DV-ALL-480P': int(0.1 * GB),
+    'DL3DV/DL3DV-ALL-960P': int(0.3 * GB),
+    'DL3DV/DL3DV-ALL-2K': int(1.1 * GB),
+    'DL3DV/DL3DV-ALL-4K': int(4.4 * GB),
+    'DL3DV/DL3DV-ALL-video': int(0.7 * GB),
+    'DL3DV/DL3DV-ALL-ColmapCache': int(0.05 * GB),
+}
+DEFAULT_EXTRACT_RATIO = 1.05
+
+
+class NotEnoughSpace(Exception):
+    pass
+
+
+class DiskAdmission:
+    """ Reserve disk space for in-flight downloads and extractions """
+
+    def __init__(self, path: str, watermark_bytes: int):
+        """
+        :param path: a path on the volume the data is written to
+        :param watermark_bytes: free space that must remain after all reservations
+        """
+        self.path = path
+        self.watermark = watermark_bytes
+        self.cond = threading.Condition()
+        self.reserved = {}
+        # observed sizes: repo -> [total compressed bytes, number of items]
+        self.compressed = {}
+        # observed extraction: [total extracted bytes, total compressed bytes]
+        self.extracted = [0, 0]
+
+    def free_bytes(self) -> int:
+        return shutil.disk_usage(self.path).free
+
+    def extract_ratio(self) -> float:
+        extracted, compressed = self.extracted
+        return extracted / compressed if compressed > 0 else DEFAULT_EXTRACT_RATIO
+
+    def estimate(self, repo: str, rel_path: str, remote_size: int = None) -> int:
+        """ Bytes needed on disk to download (and extract) an item """
+        if remote_size is None:
+            total, n = self.compressed.get(repo, (0, 0))
+            remote_size = total // n if n > 0 else DEFAULT_ITEM_BYTES.get(repo, GB)
+        if rel_path.endswith('.zip'):
+            return int(remote_size * (1 + self.extract_ratio()))
+        return int(remote_size)
+
+    def reserve(self, key: str, nbytes: int):
+        """ Block until nbytes fit under the watermark, then reserve them under key.
+
+        :raise NotEnoughSpace: if the item does not fit even with nothing else in flight
+        """
+        with self.cond:
+            while True:
+                available = self.free_bytes() - sum(self.reserved.values()) - self.watermark
+                if nbytes <= available:
+                    self.reserved[key] = nbytes
+                    return
+                if not self.reserved:
+                    raise NotEnoughSpace(f'{key} needs {nbytes / GB:.2f} GB, only {max(available, 0) / GB:.2f} GB '
+                                         f'available above the {self.watermark / GB:.2f} GB watermark')
+                # wait for another item to finish, re-check the free space periodically
+                self.cond.wait(timeout=30)
+
+    def resize(self, key: str, nbytes: int):
+        """ Replace the estimate of a reservation by a better one (e.g. once the zip is on disk) """
+        with self.cond:
+            if key in self.reserved:
+                self.reserved[key] = nbytes
+                self.cond.notify_all()
+
+    def release(self, key: str):
+        with self.cond:
+            if self.reserved.pop(key, None) is not None:
+                self.cond.notify_all()
+
+    def observe_download(self, repo: str, nbytes: int):
+        with self.cond:
+            total, n = self.compressed.get(repo, (0, 0))
+            self.compressed[repo] = (total + nbytes, n + 1)
+
+    def observe_extract(self, extracted_bytes: int, compressed_bytes: int):
+        with self.cond:
+            self.extracted[0] += extracted_bytes
+            self.extracted[1] += compressed_bytes
+
+
+def move_into_place(tmp_dir: str, odir: str):
+    """ Rename the top level entries of a completely written tmp_dir into odir """
+    for entry in os.listdir(tmp_dir):
+        target = os.path.join(odir, entry)
+        if os.path.isdir(target) and os.path.isdir(os.path.join(tmp_dir, entry)):
+            # a previous (complete) extraction of the same folder, replace it
+            shutil.rmtree(target)
+        os.replace(os.path.join(tmp_dir, entry), target)
+
+
+def is_safe_member(name: str) -> bool:
+    """ Whether a zip member name stays inside the extraction folder: not absolute, no '..' """
+    parts = name.replace('\\', '/').split('/')
+    return not (parts[0] == '' or ':' in parts[0] or '..' in parts)
+
+
+def check_members(zip_ref: zipfile.ZipFile):
+    """ Reject a zip with a member name escaping the extraction folder (see is_safe_member) """
+    for name in zip_ref.namelist():
+        if not is_safe_member(name):
+            raise zipfile.BadZipFile(f'Unsafe member name {name!r} in {zip_ref.filename}')
+
+
+def extract_zip_atomic(zip_file: str, odir: str, members_file: str = None):
+    """ Extract zip_file into odir without ever exposing a partially extracted folder.
+
+        The members are extracted into a hidden temp folder inside odir and the top level
+        entries are renamed into place once everything is written. On failure the temp folder
+        is removed, so the os.path.exists skip check never sees half a scene. A zip with an
+        absolute member name or one containing '..' is rejected before anything is written.
+
+    :param zip_file: the zip file to extract
+    :param odir: the directory to extract into
+    :param members_file: if set, record the name, size and crc32 of the members there (see verify_scenes)
+    :return: number of extracted (uncompressed) bytes
+    """
+    name = os.path.splitext(os.path.basename(zip_file))[0]
+    tmp_dir = os.path.join(odir, f'.{name}.extracting-{os.getpid()}-{threading.get_ident()}')
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    try:
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            check_members(zip_ref)
+            extracted_bytes = sum(info.file_size for info in zip_ref.infolist())
+            zip_ref.extractall(tmp_dir)
+            if members_file is not None:
+                save_members(members_file, zip_members(zip_ref))
+        move_into_place(tmp_dir, odir)
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return extracted_bytes
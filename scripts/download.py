@@ -15,17 +15,51 @@
 
 import os 
 from os.path import join
-import pandas as pd
 from tqdm import tqdm
-from huggingface_hub import HfApi 
 import argparse
 import traceback
 import shutil
-import urllib.request
-import zipfile
-from huggingface_hub import HfFileSystem
+import json
+import tempfile
+import time
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING
+from manifest_index import load_manifest_index
+from disk_admission import DiskAdmission, NotEnoughSpace, extract_zip_atomic, move_into_place, GB
+from download_metrics import DownloadMetrics, MB
+# the modules of the other features (remote_zip, work_claims, async_transfer, ...) are imported by
+# the code paths that use them, a run that does not ask for a feature does not need its module
+if TYPE_CHECKING:
+    from blob_cache import BlobCache
+    from work_claims import LeaseClaims
 
-api = HfApi()
+api = None
+# cached remote file metadata (hub_metadata.RemoteMetadata), set by download_dataset
+remote_meta = None
+# per-attempt download metrics (download_metrics.DownloadMetrics), set by download_dataset
+metrics = None
+# retry policy of hf_download_path and the circuit breaker shared by all download threads (retry_policy), see get_retry
+retry_policy = None
+breaker = None
+# glob patterns of the zip members to fetch (remote_zip), None to download whole zips
+member_patterns = None
+# async_transfer.AsyncTransferEngine replacing hf_hub_download (--backend async), None for huggingface_hub
+transfer_engine = None
+# parallel range requests per large file (segmented_download, --streams), 1 for a single stream
+segment_streams = 1
+# chunk size of the range requests, None for segmented_download.CHUNK_SIZE
+segment_chunk = None
+# bandwidth.TokenBucket shared by all the transfers of the process (--max_rate_mb), None for no limit
+bandwidth = None
+# keep the downloaded zips instead of extracting them (read them with zip_scene)
+keep_zip = False
+# extract the scene zips directly in the COLMAP layout of this folder (--colmap_dir) and its ledger, None for a plain extraction
+colmap_dir = None
+colmap_ledger = None
+colmap_lock = threading.Lock()
+ACCESS_TTL = 24 * 3600
 resolution2repo = {
     '480P': 'DL3DV/DL3DV-ALL-480P',
     '960P': 'DL3DV/DL3DV-ALL-960P',
@@ -33,48 +67,145 @@ resolution2repo = {
     '4K': 'DL3DV/DL3DV-ALL-4K'
 }
 
-def verify_access(repo: str):
+def get_api():
+    """ Create the HfApi on first use. huggingface_hub is slow to import, so planning-only runs
+        and runs where everything already exists locally never import it.
+    """
+    global api
+    if api is None:
+        from huggingface_hub import HfApi
+        api = HfApi()
+    return api
+
+
+def get_retry():
+    """ The retry policy and the circuit breaker, created with the defaults if download_dataset did not set them """
+    global retry_policy, breaker
+    if retry_policy is None or breaker is None:
+        from retry_policy import RetryPolicy, CircuitBreaker
+        retry_policy = retry_policy or RetryPolicy()
+        breaker = breaker or CircuitBreaker()
+    return retry_policy, breaker
+
+
+def parse_rate_schedule(schedule: str) -> list:
+    """ --rate_schedule argument, see bandwidth.parse_schedule """
+    from bandwidth import parse_schedule
+    return parse_schedule(schedule)
+
+
+def verify_access(repo: str, cache_dir: str = None, ttl: float = ACCESS_TTL):
     """ This function can be used to verify if the user has access to the repo. 
 
+        Listing the repo takes a round trip to the hub, so a successful check is remembered in
+        cache_dir/access.json for `ttl` seconds. Failed checks are never cached.
+
     :param repo: the repo name  
+    :param cache_dir: directory of the access cache, no caching if None
+    :param ttl: how long (seconds) a successful check stays valid
     :return: True if the user has access, False otherwise
     """    
+    cache_file = join(cache_dir, 'access.json') if cache_dir is not None else None
+    cached = {}
+    if cache_file is not None and os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'r') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+        if time.time() - cached.get(repo, 0) < ttl:
+            return True
+
+    from huggingface_hub import HfFileSystem
     fs = HfFileSystem()
     try:
         fs.ls(f'datasets/{repo}')
-        return True
     except BaseException as e:
         return False
 
+    if cache_file is not None:
+        cached[repo] = time.time()
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cache_file, 'w') as f:
+                json.dump(cached, f)
+        except OSError:
+            pass
+    return True
+
 
-def hf_download_path(repo: str, rel_path: str, odir: str, max_try: int = 5):
+def hf_download_path(repo: str, rel_path: str, odir: str, max_try: int = None):
     """ hf api is not reliable, retry when failed with max tries
 
+        Retries follow retry_policy: exponential backoff with jitter, Retry-After is honoured and
+        errors that cannot succeed on a retry (gated repo, missing file, 401/403/404) fail fast.
+        All attempts report to the process-wide circuit breaker, which pauses every download
+        while the hub is failing. With --backend async the transfer goes through the shared
+        transfer_engine instead of hf_hub_download. With --streams N, files of at least two
+        chunks are fetched with N parallel range requests, and a retry resumes the chunks that
+        are missing instead of starting over. All the transfers are charged to the shared
+        bandwidth bucket.
+
     :param repo: The huggingface dataset repo 
     :param rel_path: The relative path in the repo
     :param odir: output path 
-    :param max_try: As the downloading is not a reliable process, we will retry for max_try times
+    :param max_try: As the downloading is not a reliable process, we will retry for max_try times (default: retry_policy.max_try)
     """	
+    from retry_policy import is_fatal
+
+    policy, circuit = get_retry()
+    max_try = max_try if max_try is not None else policy.max_try
+    meta = None
+    if segment_streams > 1:
+        from segmented_download import download_segmented, CHUNK_SIZE
+        chunk_size = segment_chunk or CHUNK_SIZE
+        meta = remote_file_metadata(repo, rel_path)
     counter = 0
     while True:
         if counter >= max_try:
             print(f"ERROR: Download {repo}/{rel_path} failed.")
             return False
+        circuit.wait()
+        start = time.time()
         try:
-            api.hf_hub_download(repo_id=repo, 
-                                filename=rel_path, 
-                                repo_type='dataset', 
-                                local_dir=odir, 
-                                cache_dir=join(odir, '.cache'))
+            if meta is not None and meta['size'] >= 2 * chunk_size:
+                from huggingface_hub import hf_hub_url
+                from huggingface_hub.utils import build_hf_headers
+                path = join(odir, rel_path)
+                download_segmented(hf_hub_url(repo, rel_path, repo_type='dataset'), path, build_hf_headers(),
+                                   segment_streams, chunk_size, meta['etag'], limiter=bandwidth)
+            elif transfer_engine is not None:
+                from huggingface_hub import hf_hub_url
+                path = join(odir, rel_path)
+                transfer_engine.fetch(hf_hub_url(repo, rel_path, repo_type='dataset'), path)
+            else:
+                path = get_api().hf_hub_download(repo_id=repo, 
+                                                 filename=rel_path, 
+                                                 repo_type='dataset', 
+                                                 local_dir=odir, 
+                                                 cache_dir=join(odir, '.cache'))
+                if bandwidth is not None:
+                    # hf_hub_download cannot be throttled while it runs, charge its bytes afterwards
+                    bandwidth.consume(os.path.getsize(path))
+            if metrics is not None:
+                metrics.record(repo, rel_path, os.path.getsize(path), time.time() - start, counter)
+            circuit.record(True)
             return True
 
         except KeyboardInterrupt:
             print('Keyboard Interrupt. Exit.')
             exit()
         except BaseException as e:
+            if metrics is not None:
+                metrics.record(repo, rel_path, 0, time.time() - start, counter, e)
+            if is_fatal(e):
+                print(f"ERROR: Download {repo}/{rel_path} failed: {type(e).__name__}: {e}")
+                return False
+            circuit.record(False)
             traceback.print_exc()
             counter += 1
-            # print(f'Downloading summary {counter}')
+            if counter < max_try:
+                time.sleep(policy.delay(counter, e))
     
 
 def download_from_url(url: str, ofile: str):
@@ -84,6 +215,8 @@ def download_from_url(url: str, ofile: str):
     :param ofile: The output path 
     :return: True if download success, False otherwise
     """    
+    import urllib.request
+
     try:
         # Use urllib.request.urlretrieve to download the file from `url` and save it locally at `local_file_path`
         urllib.request.urlretrieve(url, ofile)
@@ -97,20 +230,32 @@ def clean_huggingface_cache(output_dir: str, repo: str):
     """ Huggingface cache may take too much space, we clean the cache to save space if necessary
 
         Current huggingface hub does not provide good practice to clean the space.  
-        We mannually clean the cache directory if necessary. 
+        We mannually clean the cache directory if necessary. Only the cache of the repo and the
+        download metadata are removed, the manifest and the other files in .cache are kept.
 
     :param output_dir: the current output directory 
-    :param output_dir: the huggingface repo 
+    :param repo: the huggingface repo 
     """    
     repo_cache_dir = repo.replace('/', '--')
-    # cur_cache_dir = join(output_dir, '.cache', f'datasets--{repo_cache_dir}')
-    cur_cache_dir = join(output_dir, '.cache')
+    cache_folder = join(output_dir, '.cache')
+    for cur_cache_dir in [join(cache_folder, f'datasets--{repo_cache_dir}'), join(cache_folder, 'huggingface')]:
+        if os.path.exists(cur_cache_dir):
+            shutil.rmtree(cur_cache_dir)
 
-    if os.path.exists(cur_cache_dir):
-        shutil.rmtree(cur_cache_dir)
-    
 
-def get_download_list(subset_opt: str, hash_name: str, reso_opt: str, file_type: str, output_dir: str):
+def scene_attributes_html(cache_folder: str):
+    """ The scene attribute table (visualize/index.html) of the repo checkout, downloaded if missing """
+    from scene_attributes import HTML_LINK
+
+    html_file = join(os.path.dirname(os.path.abspath(__file__)), '..', 'visualize', 'index.html')
+    if not os.path.exists(html_file):
+        html_file = join(cache_folder, 'visualize.html')
+        if not os.path.exists(html_file):
+            assert download_from_url(HTML_LINK, html_file), 'Download scene attribute table failed.'
+    return html_file
+
+
+def get_download_list(subset_opt: str, hash_name: str, reso_opt: str, file_type: str, output_dir: str, where: str = None):
     """ Get the download list based on the subset and hash name
 
         1. Get the meta file   
@@ -122,6 +267,7 @@ def get_download_list(subset_opt: str, hash_name: str, reso_opt: str, file_type:
     :param reso_opt: The resolution to download. 
     :param file_type: The file type to download: video | images+poses | colmap_cache  
     :param output_dir: The output directory. 
+    :param where: Query on the scene attributes (see scene_attributes), e.g. 'bound=unbd and duration<90'. If set, only the matching scenes of the subset are downloaded.
     """    
     def to_download_item(hash_name, reso, batch, file_type):
         if file_type == 'images+poses':
@@ -146,68 +292,642 @@ def get_download_list(subset_opt: str, hash_name: str, reso_opt: str, file_type:
     if not os.path.exists(meta_file):
         assert download_from_url(meta_link, meta_file), 'Download meta file failed.'
 
-    df = pd.read_csv(meta_file)
+    index = load_manifest_index(meta_file)
+
+    # if where is set, only keep the scenes whose attributes match the query
+    selected = None
+    if where:
+        from scene_attributes import load_scene_attributes
+        selected = load_scene_attributes(meta_file, scene_attributes_html(cache_folder)).select(where)
 
     # if hash is set, ignore the subset_opt
     if hash_name != '':
-        assert hash_name in df['hash'].values, f'Hash {hash_name} not found in the meta file.'
+        assert hash_name in index, f'Hash {hash_name} not found in the meta file.'
 
-        batch = df[df['hash'] == hash_name]['batch'].values[0]
+        batch = index.batch(hash_name)
         link = to_download_item(hash_name, reso_opt, batch, file_type)
         ret = [link]
         return ret
 
     # if hash not set, we download the whole subset
-    subdf = df[df['batch'] == subset_opt]
-    for i, r in subdf.iterrows():
-        hash_name = r['hash']
+    subset_hashes = index.batch_hashes(subset_opt)
+    if selected is not None:
+        selected = set(selected)
+        subset_hashes = [h for h in subset_hashes if h in selected]
+    for hash_name in subset_hashes:
         ret.append(to_download_item(hash_name, reso_opt, subset_opt, file_type))
 
     return ret
 
 
-def download(download_list: list, output_dir: str, is_clean_cache: bool):
+class CacheJanitor:
+    """ Clean the huggingface cache only when no download is in flight.
+
+        With several workers, removing the cache after one file would also remove
+        the partial data of the other transfers. The cleanup request is therefore
+        deferred until the last running download has finished.
+    """
+
+    def __init__(self, output_dir: str, enabled: bool):
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.pending = set()
+
+    def begin(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def end(self, repo: str = None):
+        with self.lock:
+            self.in_flight -= 1
+            if self.enabled and repo is not None:
+                self.pending.add(repo)
+            if self.in_flight == 0 and self.pending:
+                for r in self.pending:
+                    clean_huggingface_cache(self.output_dir, r)
+                self.pending.clear()
+
+
+def extract_item(output_dir: str, rel_path: str, admission: DiskAdmission = None):
+    """ Unzip a downloaded file next to it and remove the zip afterwards.
+
+        The zip is extracted into a temp folder first and moved into place when complete,
+        so a failed extraction never leaves a partial scene folder behind. With --colmap_dir the
+        members are written straight to colmap_dir/<hash> in the COLMAP layout instead.
+
+    :param output_dir: the output directory 
+    :param rel_path: the relative path of the zip file in the output directory
+    :param admission: disk admission control, its reservation for the item is released here
+    """
+    zip_file = join(output_dir, rel_path)
+    try:
+        compressed_bytes = os.path.getsize(zip_file)
+        ofile = join(output_dir, os.path.dirname(rel_path))
+        if colmap_dir is not None:
+            from colmap_layout import extract_zip_colmap
+            scene = os.path.basename(rel_path)[:-len('.zip')]
+            extracted_bytes = extract_zip_colmap(zip_file, join(colmap_dir, scene), ofile)
+            record_colmap_scene(scene, rel_path)
+        else:
+            from verify_scenes import members_file_path
+            extracted_bytes = extract_zip_atomic(zip_file, ofile, members_file_path(output_dir, rel_path))
+        os.remove(zip_file)
+        if admission is not None:
+            admission.observe_extract(extracted_bytes, compressed_bytes)
+    finally:
+        if admission is not None:
+            admission.release(rel_path)
+
+
+def record_colmap_scene(scene: str, rel_path: str):
+    """ Record a scene extracted into colmap_dir in its ledger (see scene_ledger), with the zips
+        it was built from as the source fingerprint
+    """
+    scene_folder = join(colmap_dir, scene)
+    has_sparse = any(os.path.exists(join(scene_folder, 'sparse', '0', f)) for f in ('images.bin', 'images.txt'))
+    try:
+        with os.scandir(join(scene_folder, 'images')) as entries:
+            frames = sum(1 for e in entries if e.name.endswith('.png'))
+    except FileNotFoundError:
+        frames = 0
+    with colmap_lock:
+        entry = colmap_ledger.get(scene)
+        sources = set(entry['fingerprint'].split(';')) if entry is not None and entry.get('fingerprint') else set()
+        sources.add(f'zip:{rel_path}')
+        colmap_ledger.record(scene, 'done' if frames > 0 and has_sparse else 'incomplete', frames, has_sparse,
+                             ';'.join(sorted(sources)))
+
+
+def local_output_path(output_dir: str, rel_path: str):
+    """ The local path of an item once downloaded (and extracted unless keep_zip) """
+    output_path = os.path.join(output_dir, rel_path)
+    if keep_zip:
+        return output_path
+    return output_path.replace('.zip', '')
+
+
+def item_exists(output_dir: str, item: dict):
+    """ Whether an item is already available locally.
+
+        Files that are not extracted (e.g. video.mp4) are also compared to the remote size from
+        the metadata cache, so a truncated or outdated copy is downloaded again. Zips extracted
+        into colmap_dir are looked up in its ledger: the zip is there if the scene records it as a
+        source, or if 2_reorganize_to_colmap.py finished the scene from its extracted batch/hash
+        folder. A zip of which only some members were fetched (--members) exists only for a run
+        asking for the same members.
+    """
+    if colmap_ledger is not None and item['rel_path'].endswith('.zip'):
+        from scene_ledger import fingerprint_sources
+        entry = colmap_ledger.get(os.path.basename(item['rel_path'])[:-len('.zip')])
+        if entry is None:
+            return False
+        sources = fingerprint_sources(entry.get('fingerprint'))
+        return f"zip:{item['rel_path']}" in sources or \
+            (entry['stage'] == 'done' and item['rel_path'][:-len('.zip')] in sources)
+    output_path = local_output_path(output_dir, item['rel_path'])
+    if not os.path.exists(output_path):
+        return False
+    if item['rel_path'].endswith('.zip') and not keep_zip:
+        from verify_scenes import fetched_patterns, covers
+        if not covers(fetched_patterns(output_dir, item['rel_path']), member_patterns):
+            return False
+    meta = remote_meta.get(item['repo'], item['rel_path']) if remote_meta is not None else None
+    if meta is not None and os.path.isfile(output_path):
+        return os.path.getsize(output_path) == meta['size']
+    return True
+
+
+def remote_file_metadata(repo: str, rel_path: str):
+    """ Size and etag of a file in the repo, None if the metadata cannot be fetched
+
+        The prefetched metadata cache is used when it knows the file, otherwise the hub is asked.
+
+    :return: {'size', 'etag'} or None
+    """
+    if remote_meta is not None:
+        meta = remote_meta.get(repo, rel_path)
+        if meta is not None:
+            return meta
+    try:
+        from huggingface_hub import get_hf_file_metadata, hf_hub_url
+        meta = get_hf_file_metadata(hf_hub_url(repo, rel_path, repo_type='dataset'))
+        return {'size': meta.size, 'etag': meta.etag}
+    except Exception:
+        return None
+
+
+def remote_file_size(repo: str, rel_path: str):
+    """ Size in bytes of a file in the repo, None if the metadata cannot be fetched """
+    meta = remote_file_metadata(repo, rel_path)
+    return meta['size'] if meta is not None else None
+
+
+def fetch_members(repo: str, rel_path: str, output_dir: str, patterns: list, max_try: int = None):
+    """ Fetch only the members of the zip repo/rel_path matching patterns, with HTTP range reads.
+
+        The members are written to a temp folder and moved into output_dir/batch once all of them
+        are there, like an extracted zip. Retries follow retry_policy, as in hf_download_path.
+
+    :param patterns: glob patterns relative to the scene folder, e.g. ['images_4/*', 'transforms.json']
+    :return: True if the members are available in the output directory
+    """
+    from huggingface_hub import hf_hub_url
+    from huggingface_hub.utils import build_hf_headers
+    from remote_zip import RemoteZip
+    from retry_policy import is_fatal
+    from verify_scenes import members_file_path, save_members
+
+    policy, circuit = get_retry()
+    max_try = max_try if max_try is not None else policy.max_try
+    odir = join(output_dir, os.path.dirname(rel_path))
+    os.makedirs(odir, exist_ok=True)
+    for counter in range(max_try):
+        circuit.wait()
+        start = time.time()
+        tmp_dir = tempfile.mkdtemp(prefix=f'.{os.path.basename(rel_path)}.members-', dir=odir)
+        try:
+            rz = RemoteZip(hf_hub_url(repo, rel_path, repo_type='dataset'), build_hf_headers(), limiter=bandwidth)
+            members = rz.extract(patterns, tmp_dir)
+            if not members:
+                print(f"ERROR: No member of {repo}/{rel_path} matches {','.join(patterns)}")
+                return False
+            save_members(members_file_path(output_dir, rel_path), {m.name: [m.file_size, m.crc] for m in members},
+                         patterns)
+            move_into_place(tmp_dir, odir)
+            if metrics is not None:
+                metrics.record(repo, rel_path, rz.bytes_fetched, time.time() - start, counter)
+            circuit.record(True)
+            return True
+        except KeyboardInterrupt:
+            print('Keyboard Interrupt. Exit.')
+            exit()
+        except BaseException as e:
+            if metrics is not None:
+                metrics.record(repo, rel_path, 0, time.time() - start, counter, e)
+            if is_fatal(e):
+                print(f"ERROR: Download {repo}/{rel_path} failed: {type(e).__name__}: {e}")
+                return False
+            circuit.record(False)
+            if counter == 0 or counter >= max_try - 1:
+                traceback.print_exc()
+            if counter < max_try - 1:
+                time.sleep(policy.delay(counter + 1, e))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    print(f"ERROR: Download {repo}/{rel_path} failed after {max_try} attempts.")
+    return False
+
+
+def fetch_file(repo: str, rel_path: str, output_dir: str, blob_cache: 'BlobCache' = None):
+    """ Download repo/rel_path to output_dir/rel_path, through the shared blob cache if given.
+
+        With a blob cache the file is looked up by (repo, rel_path, etag). On a miss it is
+        downloaded into the cache staging area and moved into the cache. Either way the blob is
+        then linked into the output directory, so files pulled before are not downloaded again
+        (a scene zip is still extracted afterwards, only its transfer is saved). A blob that
+        vanished before it was linked is fetched again.
+
+    :return: True if the file is available at output_dir/rel_path
+    """
+    if blob_cache is None:
+        return hf_download_path(repo, rel_path, output_dir)
+
+    meta = remote_file_metadata(repo, rel_path)
+    if meta is None or not meta['etag']:
+        # cannot address the content, do not cache it
+        return hf_download_path(repo, rel_path, output_dir)
+
+    for attempt in range(2):
+        blob = blob_cache.get(repo, rel_path, meta['etag'])
+        if blob is None:
+            staging = tempfile.mkdtemp(dir=blob_cache.tmp_dir)
+            try:
+                if not hf_download_path(repo, rel_path, staging):
+                    return False
+                blob = blob_cache.put(repo, rel_path, meta['etag'], join(staging, rel_path))
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+        try:
+            blob_cache.materialize(blob, join(output_dir, rel_path))
+            return True
+        except FileNotFoundError:
+            if attempt > 0:
+                raise
+            print(f'Cached {rel_path} vanished, fetching it again')
+
+
+def fetch_item(item: dict, output_dir: str, janitor: CacheJanitor, repo_slots: dict, admission: DiskAdmission = None,
+               blob_cache: 'BlobCache' = None):
+    """ Download a single item of the download list, without extracting it.
+
+        With admission control, the disk space for the download and the extraction is reserved
+        before the download starts. For zips the reservation is kept until extract_item.
+
+    :param item: the item to download, {'repo', 'rel_path'}
+    :param output_dir: the output directory 
+    :param janitor: shared cache janitor, cleans the huggingface cache if requested
+    :param repo_slots: repo -> semaphore, caps the concurrent downloads per repo 
+    :param admission: disk admission control, None to disable
+    :param blob_cache: shared blob cache, None to download straight into output_dir
+    :return: 'exists' if the item is already available locally, 'downloaded', 'extracted' (only
+             the selected zip members were fetched, see member_patterns) or 'failed'
+    """
+    repo = item['repo']
+    rel_path = item['rel_path']
+    members_only = member_patterns is not None and rel_path.endswith('.zip')
+
+    # skip if already exists locally
+    if item_exists(output_dir, item):
+        return 'exists'
+    if os.path.isfile(local_output_path(output_dir, rel_path)):
+        # stale local copy
+        os.remove(local_output_path(output_dir, rel_path))
+
+    if admission is not None:
+        try:
+            admission.reserve(rel_path, admission.estimate(repo, rel_path, remote_file_size(repo, rel_path)))
+        except NotEnoughSpace as e:
+            print(f'Download {rel_path} skipped: {e}')
+            return 'failed'
+
+    janitor.begin()
+    succ = False
+    try:
+        with repo_slots[repo]:
+            if members_only:
+                succ = fetch_members(repo, rel_path, output_dir, member_patterns)
+            else:
+                succ = fetch_file(repo, rel_path, output_dir, blob_cache)
+        if not succ:
+            print(f'Download {rel_path} failed')
+    finally:
+        janitor.end(repo if succ else None)
+        if admission is not None:
+            if succ and rel_path.endswith('.zip') and not members_only and not keep_zip:
+                # the zip is on disk now, keep the reservation for the extraction only
+                nbytes = os.path.getsize(join(output_dir, rel_path))
+                admission.observe_download(repo, nbytes)
+                admission.resize(rel_path, int(nbytes * admission.extract_ratio()))
+            else:
+                admission.release(rel_path)
+    if not succ:
+        return 'failed'
+    return 'extracted' if members_only else 'downloaded'
+
+
+def drop_lost_item(output_dir: str, rel_path: str, status: str, admission: DiskAdmission = None):
+    """ Remove what this node fetched for an item whose claim it lost while downloading.
+
+        A zip waiting for its extraction is deleted and its disk reservation released, the node
+        that took the item over writes its own. Files in their final form (videos, --keep_zip,
+        members moved into place) are complete and left alone.
+    """
+    if status != 'downloaded' or not rel_path.endswith('.zip') or keep_zip:
+        return
+    try:
+        os.remove(join(output_dir, rel_path))
+    except FileNotFoundError:
+        pass
+    if admission is not None:
+        admission.release(rel_path)
+
+
+def download_item(item: dict, output_dir: str, janitor: CacheJanitor, repo_slots: dict, admission: DiskAdmission = None,
+                  blob_cache: 'BlobCache' = None, claims: 'LeaseClaims' = None):
+    """ Download (and unzip) a single item of the download list.
+
+    :param item: the item to download, {'repo', 'rel_path'}
+    :param output_dir: the output directory 
+    :param janitor: shared cache janitor, cleans the huggingface cache if requested
+    :param repo_slots: repo -> semaphore, caps the concurrent downloads per repo 
+    :param admission: disk admission control, None to disable
+    :param blob_cache: shared blob cache, None to download straight into output_dir
+    :param claims: lease-based claims shared with the other nodes, None to download every item
+    :return: True if the item exists locally after the call, False otherwise, None if the item
+             is done or claimed by another node
+    """
+    if claims is not None and not claims.claim(item):
+        return None
+    succ = False
+    try:
+        status = fetch_item(item, output_dir, janitor, repo_slots, admission, blob_cache)
+        if status != 'failed' and claims is not None and not claims.holds(item):
+            # another node took the item over while we downloaded it, leave it to that node
+            print(f"Lost the claim on {item['rel_path']}, not extracting it")
+            drop_lost_item(output_dir, item['rel_path'], status, admission)
+            return None
+        if status == 'downloaded' and item['rel_path'].endswith('.zip') and not keep_zip:
+            try:
+                extract_item(output_dir, item['rel_path'], admission)
+            except Exception:
+                print(f"Extract {item['rel_path']} failed")
+                traceback.print_exc()
+                return False
+        succ = status != 'failed'
+        return succ
+    finally:
+        if claims is not None:
+            claims.release(item, succ)
+
+
+def download_pipelined(download_list: list, output_dir: str, janitor: CacheJanitor, repo_slots: dict,
+                       admission: DiskAdmission, blob_cache: 'BlobCache', workers: int, extract_workers: int, queue_depth: int, pbar,
+                       claims: 'LeaseClaims' = None):
+    """ Download and extract as a producer/consumer pipeline.
+
+        `workers` threads download the items and put the finished zip files on a bounded queue,
+        `extract_workers` threads drain the queue and unzip them. A download worker blocks when
+        the queue is full, so at most queue_depth + workers + extract_workers zip files sit on
+        the scratch disk at the same time.
+
+    :return: list of (item, result) with result as returned by download_item
+    """
+    zip_queue = queue.Queue(maxsize=max(1, queue_depth))
+    lock = threading.Lock()
+    results = []
+
+    def finish(item: dict, succ):
+        if claims is not None and succ is not None:
+            claims.release(item, succ)
+        with lock:
+            results.append((item, succ))
+            pbar.update(1)
+
+    def produce(item):
+        if claims is not None and not claims.claim(item):
+            finish(item, None)
+            return
+        try:
+            status = fetch_item(item, output_dir, janitor, repo_slots, admission, blob_cache)
+        except Exception:
+            print(f"Download {item['rel_path']} failed")
+            traceback.print_exc()
+            status = 'failed'
+        if status != 'failed' and claims is not None and not claims.holds(item):
+            # another node took the item over while we downloaded it, leave it to that node
+            print(f"Lost the claim on {item['rel_path']}, not extracting it")
+            drop_lost_item(output_dir, item['rel_path'], status, admission)
+            claims.release(item, False)
+            finish(item, None)
+            return
+        if status == 'downloaded' and item['rel_path'].endswith('.zip') and not keep_zip:
+            zip_queue.put(item)
+        else:
+            finish(item, status != 'failed')
+
+    def consume():
+        while True:
+            item = zip_queue.get()
+            if item is None:
+                break
+            try:
+                extract_item(output_dir, item['rel_path'], admission)
+                finish(item, True)
+            except Exception:
+                print(f"Extract {item['rel_path']} failed")
+                traceback.print_exc()
+                finish(item, False)
+
+    extractors = [threading.Thread(target=consume, daemon=True) for _ in range(max(1, extract_workers))]
+    for t in extractors:
+        t.start()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(produce, download_list))
+    for _ in extractors:
+        zip_queue.put(None)
+    for t in extractors:
+        t.join()
+    return results
+
+
+def download(download_list: list, output_dir: str, is_clean_cache: bool, workers: int = 1, max_per_repo: int = 4,
+             pipeline: bool = False, extract_workers: int = 1, queue_depth: int = 2, min_free_gb: float = None,
+             blob_cache_dir: str = None, blob_cache_gb: float = 500, claims: 'LeaseClaims' = None):
     """ Download the dataset based on the download_list and user options.
 
+        Items are downloaded by a bounded pool of `workers` threads. At most `max_per_repo`
+        downloads run against the same huggingface repo at a time to avoid rate limits.
+        In pipeline mode the extraction runs on its own pool, see download_pipelined.
+
+        With claims, only the items this node manages to claim are downloaded. The list is
+        scanned again until every item is done (here or on another node) or failed here, so the
+        items of a crashed node are taken over once their lease expires.
+
     :param download_list: the list of files to download, [{'repo', 'rel_path'}]
     :param output_dir: the output directory 
-    :param reso_opt: the resolution option 
     :param is_clean_cache: if set, will clean the huggingface cache to save space 
+    :param workers: number of concurrent downloads 
+    :param max_per_repo: maximum number of concurrent downloads per repo 
+    :param pipeline: if set, overlap downloading and extraction 
+    :param extract_workers: number of extraction threads in pipeline mode 
+    :param queue_depth: maximum number of downloaded zips waiting for extraction in pipeline mode 
+    :param min_free_gb: if set, delay new downloads while the free space would drop below this watermark 
+    :param blob_cache_dir: if set, download through the shared blob cache in this directory 
+    :param blob_cache_gb: maximum size of the shared blob cache 
+    :param claims: lease-based claims shared with the other nodes (work_claims.LeaseClaims), None to download every item 
     """	
     succ_count = 0
-    
-    for item in tqdm(download_list, desc='Downloading'):
-        repo = item['repo']
-        rel_path = item['rel_path']
-        
-        output_path = os.path.join(output_dir, rel_path)
-        output_path = output_path.replace('.zip', '')
-        # skip if already exists locally
-        if os.path.exists(output_path):
-            succ_count += 1
-            continue
-        succ = hf_download_path(repo, rel_path, output_dir)
-
-
-        if succ:
-            succ_count += 1
-            if is_clean_cache:
-                clean_huggingface_cache(output_dir, repo)
-            
-            # unzip the file 
-            if rel_path.endswith('.zip'):
-                zip_file = join(output_dir, rel_path)
-                with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-                    ofile = join(output_dir, os.path.dirname(rel_path))
-                    zip_ref.extractall(ofile)
-                os.remove(zip_file)
-        else:
-            print(f'Download {rel_path} failed')
+    workers = max(1, workers)
+    max_per_repo = max(1, max_per_repo)
+
+    janitor = CacheJanitor(output_dir, is_clean_cache)
+    repo_slots = {item['repo']: threading.BoundedSemaphore(max_per_repo) for item in download_list}
+    admission = DiskAdmission(output_dir, int(min_free_gb * GB)) if min_free_gb is not None else None
+    blob_cache = None
+    if blob_cache_dir is not None:
+        from blob_cache import BlobCache
+        blob_cache = BlobCache(blob_cache_dir, int(blob_cache_gb * GB))
+
+    failed = set()
+    items = download_list
+    while items:
+        results = []
+        with tqdm(total=len(items), desc='Downloading') as pbar:
+            if pipeline:
+                results = download_pipelined(items, output_dir, janitor, repo_slots, admission, blob_cache,
+                                             workers, extract_workers, queue_depth, pbar, claims)
+            elif workers == 1:
+                for item in items:
+                    results.append((item, download_item(item, output_dir, janitor, repo_slots, admission, blob_cache, claims)))
+                    pbar.update(1)
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = {executor.submit(download_item, item, output_dir, janitor, repo_slots, admission, blob_cache, claims): item
+                               for item in items}
+                    for future in as_completed(futures):
+                        try:
+                            results.append((futures[future], future.result()))
+                        except Exception:
+                            print(f"Download {futures[future]['rel_path']} failed")
+                            traceback.print_exc()
+                            results.append((futures[future], False))
+                        pbar.update(1)
+
+        succ_count += sum(1 for _, succ in results if succ)
+        if claims is None:
+            break
+        failed.update(item['rel_path'] for item, succ in results if succ is False)
+        # the items still claimed by other nodes: wait for them, take them over if their lease expires
+        items = [item for item in items if item['rel_path'] not in failed and not claims.is_done(item)]
+        if items:
+            print(f'{len(items)} item(s) claimed by other nodes, checking again in {claims.lease_s / 3:.0f}s')
+            time.sleep(claims.lease_s / 3)
+
+    if claims is not None:
+        claims.close()
+        others = len(download_list) - succ_count - len(failed)
+        print(f'Summary: {succ_count}/{len(download_list)} files downloaded successfully by this node, '
+              f'{others} by other nodes, {len(failed)} failed')
+        if metrics is not None:
+            metrics.print_summary()
+        return len(failed) == 0
 
     print(f'Summary: {succ_count}/{len(download_list)} files downloaded successfully')
+    if metrics is not None:
+        metrics.print_summary()
     return succ_count == len(download_list)
 
 
+def pending_items(download_list: list, output_dir: str):
+    """ The items of download_list that do not exist locally yet """
+    return [item for item in download_list if not item_exists(output_dir, item)]
+
+
+def prefetch_metadata(download_list: list):
+    """ List the batch directories needed by download_list once per repo into the metadata cache """
+    dirs = {}
+    for item in download_list:
+        dirs.setdefault(item['repo'], set()).add(item['rel_path'].split('/')[0])
+    for repo, repo_dirs in sorted(dirs.items()):
+        try:
+            n = remote_meta.prefetch(repo, sorted(repo_dirs), get_api())
+            if n > 0:
+                print(f'Prefetched the metadata of {n} folder(s) of {repo}')
+        except Exception as e:
+            print(f'WARNING: could not list {repo} ({e}), falling back to per-file metadata requests')
+
+
+def print_plan(download_list: list, output_dir: str):
+    """ Print what a download run would do, without touching the network.
+
+    :param download_list: the list of files to download, [{'repo', 'rel_path'}]
+    :param output_dir: the output directory 
+    :return: the items that still have to be downloaded
+    """
+    pending = pending_items(download_list, output_dir)
+    repos = {}
+    for item in pending:
+        repos[item['repo']] = repos.get(item['repo'], 0) + 1
+
+    sizes = [remote_meta.get(item['repo'], item['rel_path']) if remote_meta is not None else None for item in pending]
+    known = [meta['size'] for meta in sizes if meta is not None]
+
+    print(f'Plan: {len(download_list)} item(s), {len(download_list) - len(pending)} already downloaded, {len(pending)} to download')
+    for repo, n in sorted(repos.items()):
+        print(f'  {repo}: {n} item(s)')
+    if known:
+        unknown = f' ({len(pending) - len(known)} item(s) of unknown size)' if len(known) < len(pending) else ''
+        print(f'  Size to download: {sum(known) / GB:.2f} GB{unknown}')
+    return pending
+
+
+def fit_budget(download_list: list, output_dir: str, budget_gb: float, objective: str = 'count', stratify: str = None,
+               workers: int = 1):
+    """ Keep the items of download_list that fit in a download budget and print the prediction.
+
+    :param download_list: the candidate files, [{'repo', 'rel_path'}]
+    :param output_dir: the output directory 
+    :param budget_gb: GB that may be downloaded, the items already downloaded are kept for free 
+    :param objective: 'count' to maximize the number of scenes, 'duration' the total video duration 
+    :param stratify: if set, split the budget over the values of this column (batch or a scene attribute) 
+    :param workers: number of concurrent downloads, for the ETA 
+    :return: the selected items
+    """
+    from budget_planner import plan_budget
+
+    cache_folder = join(output_dir, '.cache')
+    meta_file = join(cache_folder, 'DL3DV-valid.csv')
+    index = load_manifest_index(meta_file)
+    strata = None
+    if stratify:
+        from scene_attributes import load_scene_attributes
+        attributes = load_scene_attributes(meta_file, scene_attributes_html(cache_folder))
+        assert stratify in attributes.columns, f"--stratify must be one of {', '.join(sorted(attributes.columns))}"
+        names, codes = attributes.columns[stratify]
+        strata = {h: names[c] for h, c in zip(index.hashes, codes)}
+    skip = {item['rel_path'] for item in download_list if item_exists(output_dir, item)}
+    plan = plan_budget(download_list, index, remote_meta, int(budget_gb * GB), objective, strata,
+                       metrics.jsonl_file if metrics is not None else None, workers, skip)
+    plan.print_summary()
+    return plan.selected
+
+
+def verify_download(download_list: list, output_dir: str, workers: int = None):
+    """ Verify the downloaded items against the recorded zip CRCs and the remote metadata.
+
+    :param download_list: the list of files to verify, [{'repo', 'rel_path'}]
+    :param output_dir: the output directory 
+    :param workers: number of verification processes, defaults to the number of cpus 
+    :return: True if no item failed
+    """
+    from verify_scenes import verify_items
+
+    with tqdm(total=len(download_list), desc='Verifying') as pbar:
+        results = verify_items(download_list, output_dir, remote_meta, workers, lambda: pbar.update(1),
+                               member_patterns)
+
+    counts = {'ok': 0, 'failed': 0, 'unknown': 0}
+    for item, status, message in results:
+        counts[status] += 1
+        if status != 'ok':
+            print(f"{'✗' if status == 'failed' else '?'} {item['rel_path']}: {message}")
+
+    print(f"Summary: {counts['ok']}/{len(download_list)} verified, {counts['failed']} failed, {counts['unknown']} unknown")
+    return counts['failed'] == 0
+
+
 def download_dataset(args):
     """ Download the dataset based on the user inputs.
 
@@ -220,11 +940,98 @@ def download_dataset(args):
     hash_name  = args.hash
     file_type  = args.file_type
     is_clean_cache = args.clean_cache
+    workers    = args.workers
+    max_per_repo = args.max_per_repo
+    pipeline   = args.pipeline
+    extract_workers = args.extract_workers
+    queue_depth = args.queue_depth
+    ttl        = args.access_ttl
+    min_free_gb = None if args.min_free_gb is None or args.min_free_gb < 0 else args.min_free_gb
+    blob_cache_dir = args.blob_cache
+    blob_cache_gb = args.blob_cache_gb
 
     os.makedirs(output_dir, exist_ok=True)
 
-    download_list = get_download_list(subset_opt, hash_name, reso_opt, file_type, output_dir)
-    return download(download_list, output_dir, is_clean_cache)
+    from retry_policy import RetryPolicy, CircuitBreaker
+    from hub_metadata import RemoteMetadata, METADATA_TTL
+
+    global remote_meta, metrics, retry_policy, breaker, member_patterns, keep_zip, transfer_engine, \
+        segment_streams, segment_chunk, bandwidth, colmap_dir, colmap_ledger
+    if args.members:
+        from remote_zip import parse_patterns
+        member_patterns = parse_patterns(args.members)
+    segment_streams, segment_chunk = args.streams, args.chunk_mb * MB if args.chunk_mb else None
+    if args.max_rate_mb is not None:
+        from bandwidth import TokenBucket
+        bandwidth = TokenBucket(args.max_rate_mb * MB, args.rate_schedule)
+        print(f'Download rate limited to {bandwidth.describe()}')
+    elif args.rate_schedule:
+        print('--rate_schedule is ignored without --max_rate_mb')
+    keep_zip = args.keep_zip and member_patterns is None
+    if args.keep_zip and not keep_zip:
+        print('--keep_zip is ignored with --members, the selected members are extracted')
+    if args.colmap_dir is not None:
+        if keep_zip or member_patterns is not None:
+            print('--colmap_dir is ignored with --keep_zip and --members')
+        else:
+            from scene_ledger import SceneLedger
+            colmap_dir = args.colmap_dir
+            os.makedirs(colmap_dir, exist_ok=True)
+            colmap_ledger = SceneLedger(colmap_dir)
+    retry_policy = RetryPolicy(args.max_try, args.backoff_base, args.backoff_max)
+    breaker = CircuitBreaker()
+    remote_meta = RemoteMetadata(join(output_dir, '.cache', 'remote_metadata.json'),
+                                 args.metadata_ttl if args.metadata_ttl is not None else METADATA_TTL)
+    metrics = DownloadMetrics(args.metrics_file or join(output_dir, '.cache', 'download_metrics.jsonl'))
+
+    download_list = get_download_list(subset_opt, hash_name, reso_opt, file_type, output_dir, args.where)
+    if args.budget_gb is not None:
+        if args.prefetch:
+            prefetch_metadata(download_list)
+        download_list = fit_budget(download_list, output_dir, args.budget_gb, args.objective, args.stratify, workers)
+    if args.num_shards > 1:
+        from work_claims import select_shard
+        # in claim mode the other shards are kept at the end of the list, to be stolen once ours is done
+        download_list = select_shard(download_list, args.shard_index, args.num_shards, keep_others=bool(args.claim_dir))
+    if args.verify and colmap_dir is not None:
+        print('--verify checks the extracted zips, it does not support --colmap_dir (see 2_reorganize_to_colmap.py --verify)')
+        return False
+    if args.verify:
+        if args.prefetch:
+            prefetch_metadata(download_list)
+        return verify_download(download_list, output_dir, args.verify_workers)
+
+    if args.dry_run:
+        if args.prefetch:
+            prefetch_metadata(download_list)
+        print_plan(download_list, output_dir)
+        return True
+
+    # nothing to do if everything exists locally, no need to contact the hub
+    pending = pending_items(download_list, output_dir)
+    for repo in sorted({item['repo'] for item in pending}):
+        if not verify_access(repo, join(output_dir, '.cache'), ttl):
+            print(f'You have not grant the access yet. Go to relevant huggingface repo (https://huggingface.co/datasets/{repo}) and apply for the access.')
+            exit(1)
+    if pending:
+        prefetch_metadata(pending)
+
+    claims = None
+    if args.claim_dir:
+        from work_claims import LeaseClaims, LEASE_S
+        claims = LeaseClaims(args.claim_dir, args.lease_s if args.lease_s is not None else LEASE_S, args.node_id)
+
+    if args.backend == 'async':
+        from huggingface_hub.utils import build_hf_headers
+        from async_transfer import AsyncTransferEngine
+        transfer_engine = AsyncTransferEngine(build_hf_headers(), max_per_host=workers, limiter=bandwidth).start()
+    try:
+        return download(download_list, output_dir, is_clean_cache, workers, max_per_repo,
+                        pipeline, extract_workers, queue_depth, min_free_gb,
+                        blob_cache_dir, blob_cache_gb, claims)
+    finally:
+        if transfer_engine is not None:
+            transfer_engine.close()
 
 
 if __name__ == '__main__':
@@ -234,21 +1041,46 @@ if __name__ == '__main__':
     parser.add_argument('--resolution', choices=['4K', '2K', '960P', '480P'], help='The resolution to donwnload', required=True)
     parser.add_argument('--file_type', choices=['images+poses', 'video', 'colmap_cache'], help='The file type to download', required=True, default='images+poses')
     parser.add_argument('--hash', type=str, help='If set subset=hash, this is the hash code of the scene to download', default='')
+    parser.add_argument('--where', type=str, help="Only download the scenes whose attributes match this query, e.g. \"bound=unbd and reflection!='abs nonreflection' and duration<90\" (columns: batch, label, duration, bound, reflection, transparency, lighting, poi, category, device)", default=None)
+    parser.add_argument('--budget_gb', type=float, help='Only download the scenes that fit in this many GB, sizes predicted from the scene durations (calibrated on the sizes listed with --prefetch)', default=None)
+    parser.add_argument('--objective', choices=['count', 'duration'], help='With --budget_gb, maximize the number of scenes or the total video duration', default='count')
+    parser.add_argument('--stratify', help='With --budget_gb, split the budget over the values of this column in proportion to their number of scenes (batch, label or a --where column)', default=None)
     parser.add_argument('--clean_cache', action='store_true', help='If set, will clean the huggingface cache to save space')
+    parser.add_argument('--workers', type=int, help='Number of scenes to download concurrently', default=1)
+    parser.add_argument('--max_per_repo', type=int, help='Maximum number of concurrent downloads per huggingface repo (avoid rate limits)', default=4)
+    parser.add_argument('--backend', choices=['hf', 'async'], help='Transfer backend: huggingface_hub (hf_hub_download), or an asyncio engine with pooled keep-alive connections and no per-file metadata request (faster for many small files, use a high --workers)', default='hf')
+    parser.add_argument('--streams', type=int, help='Parallel range requests per large file (at least two chunks, e.g. 4K zips and videos), an interrupted file resumes from its finished chunks', default=1)
+    parser.add_argument('--chunk_mb', type=int, help='Chunk size of --streams (MB), the unit of resume (default: 64)', default=None)
+    parser.add_argument('--max_rate_mb', type=float, help='Maximum total download rate of the process (MB/s), shared by all the workers', default=None)
+    parser.add_argument('--rate_schedule', type=parse_rate_schedule, help="Fraction of --max_rate_mb by local time of day, e.g. '08:00-20:00=30%%' (full rate outside the ranges)", default=None)
+    parser.add_argument('--pipeline', action='store_true', help='If set, overlap downloading and extraction (zips are extracted by a separate pool)')
+    parser.add_argument('--extract_workers', type=int, help='Number of extraction threads in --pipeline mode', default=2)
+    parser.add_argument('--queue_depth', type=int, help='Maximum number of downloaded zips waiting for extraction in --pipeline mode (bounds scratch disk use)', default=4)
+    parser.add_argument('--dry_run', '--plan', action='store_true', help='If set, only resolve the download list against the manifest and print the plan')
+    parser.add_argument('--access_ttl', type=float, help='Seconds a successful repo access check stays cached', default=ACCESS_TTL)
+    parser.add_argument('--prefetch', action='store_true', help='With --dry_run, --verify or --budget_gb, list the remote batch directories first (sizes and sha256 of the remote files)')
+    parser.add_argument('--metadata_ttl', type=float, help='Seconds a cached remote directory listing stays valid (default: one day)', default=None)
+    parser.add_argument('--verify', action='store_true', help='If set, verify the downloaded items (zip CRCs, LFS sha256) instead of downloading')
+    parser.add_argument('--verify_workers', type=int, help='Number of verification processes (default: number of cpus)', default=None)
+    parser.add_argument('--metrics_file', type=str, help='JSONL file receiving one event per download attempt (default: <output dir>/.cache/download_metrics.jsonl)', default=None)
+    parser.add_argument('--max_try', type=int, help='Maximum number of attempts per file', default=5)
+    parser.add_argument('--backoff_base', type=float, help='Delay (seconds) before the first retry, doubled for every further retry', default=2.0)
+    parser.add_argument('--backoff_max', type=float, help='Maximum delay (seconds) between two retries', default=120.0)
+    parser.add_argument('--members', type=str, help="Only fetch the zip members matching these comma-separated globs, with HTTP range reads (e.g. 'images_4/*,transforms.json')", default=None)
+    parser.add_argument('--colmap_dir', type=str, help='If set, extract the scene zips directly in the COLMAP layout of this folder (<hash>/images, <hash>/sparse/0), no 2_reorganize_to_colmap.py pass needed', default=None)
+    parser.add_argument('--keep_zip', action='store_true', help='If set, keep the downloaded scene zips instead of extracting them (read them in place with zip_scene.py)')
+    parser.add_argument('--min_free_gb', type=float, help='If set, free disk space (GB) to keep on the output volume (e.g. 10), downloads wait while in-flight items would go below it. Disabled by default', default=None)
+    parser.add_argument('--blob_cache', type=str, help='Shared download cache directory. Downloaded files are stored once per (repo, path, etag) and hardlinked/reflinked into the output directory (zips are still extracted, only the transfer is saved)', default=None)
+    parser.add_argument('--blob_cache_gb', type=float, help='Maximum size (GB) of the shared download cache, least recently used files are evicted first', default=500)
+    parser.add_argument('--shard_index', type=int, help='Index of this node in [0, --num_shards), selects a deterministic share of the download list', default=0)
+    parser.add_argument('--num_shards', type=int, help='Number of nodes sharing the download list', default=1)
+    parser.add_argument('--claim_dir', type=str, help='Directory on a filesystem shared by the nodes. If set, items are claimed with lease files so each one is downloaded by one node, and idle nodes take over unclaimed or expired items', default=None)
+    parser.add_argument('--lease_s', type=float, help='Seconds after which the claim of a node that stopped refreshing it can be taken over (default: 600)', default=None)
+    parser.add_argument('--node_id', type=str, help='Name of this node in the claim files (default: <hostname>-<pid>)', default=None)
     params = parser.parse_args()
 
     assert params.file_type in ['images+poses', 'video', 'colmap_cache'], 'Check the file_type input.'
-
-    if params.file_type == 'images+poses':
-        repo = resolution2repo[params.resolution]
-    elif params.file_type == 'video':
-        repo = 'DL3DV/DL3DV-ALL-video'
-    elif params.file_type == 'colmap_cache':
-        repo = 'DL3DV/DL3DV-ALL-ColmapCache'
-
-    if not verify_access(repo):
-        print(f'You have not grant the access yet. Go to relevant huggingface repo (https://huggingface.co/datasets/{repo}) and apply for the access.')
-        exit(1)
+    assert 0 <= params.shard_index < params.num_shards, 'Check the shard_index and num_shards inputs.'
 
     if download_dataset(params):
         print('Download Done. Refer to', params.odir)
@@ -0,0 +1,106 @@
+""" Per-attempt download metrics.
+
+    Every download attempt is recorded as one json line:
+        {"time": ..., "repo": ..., "rel_path": ..., "bytes": ..., "wall_s": ..., "mb_s": ...,
+         "retry": 0, "ok": true, "error": null}
+    where retry is the index of the attempt for that file (0 for the first try) and error the
+    exception class of a failed attempt. The end-of-run summary reports the per-file latency
+    percentiles (from the start of the first attempt of a file to the end of its successful one,
+    failed attempts and retry backoff included), the per-attempt ones and the aggregate
+    throughput, to tune the concurrency and spot slow mirrors.
+"""
+
+import os
+import json
+import math
+import time
+import threading
+
+
+MB = 1024 ** 2
+
+
+def percentile(values: list, q: float) -> float:
+    """ Nearest-rank percentile, q in [0, 100] """
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, math.ceil(q / 100 * len(values)) - 1))
+    return values[rank]
+
+
+class DownloadMetrics:
+    """ Collects the download attempts of a run, optionally appending them to a jsonl file """
+
+    def __init__(self, jsonl_file: str = None):
+        self.jsonl_file = jsonl_file
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.events = []
+        if jsonl_file is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(jsonl_file)), exist_ok=True)
+
+    def record(self, repo: str, rel_path: str, nbytes: int, wall_s: float, retry: int, error: BaseException = None):
+        """ Record one download attempt """
+        event = {
+            'time': time.time(),
+            'repo': repo,
+            'rel_path': rel_path,
+            'bytes': nbytes,
+            'wall_s': round(wall_s, 4),
+            'mb_s': round(nbytes / MB / wall_s, 3) if wall_s > 0 else None,
+            'retry': retry,
+            'ok': error is None,
+            'error': type(error).__name__ if error is not None else None,
+        }
+        with self.lock:
+            self.events.append(event)
+            if self.jsonl_file is not None:
+                with open(self.jsonl_file, 'a') as f:
+                    f.write(json.dumps(event) + '\n')
+
+    def summary(self) -> dict:
+        with self.lock:
+            events = list(self.events)
+        ok = [e for e in events if e['ok']]
+        total_bytes = sum(e['bytes'] for e in ok)
+        elapsed = time.time() - self.start
+        attempt_latencies = [e['wall_s'] for e in ok]
+        first_start = {}
+        for e in events:
+            key = (e['repo'], e['rel_path'])
+            first_start[key] = min(first_start.get(key, math.inf), e['time'] - e['wall_s'])
+        file_latencies = [e['time'] - first_start[(e['repo'], e['rel_path'])] for e in ok]
+        return {
+            'attempts': len(events),
+            'files': len(ok),
+            'failed_attempts': len(events) - len(ok),
+            'retries': sum(1 for e in events if e['retry'] > 0),
+            'bytes': total_bytes,
+            'elapsed_s': elapsed,
+            'p50_s': percentile(file_latencies, 50),
+            'p95_s': percentile(file_latencies, 95),
+            'attempt_p50_s': percentile(attempt_latencies, 50),
+            'attempt_p95_s': percentile(attempt_latencies, 95),
+            'mb_s': total_bytes / MB / elapsed if elapsed > 0 else 0.0,
+            'per_repo_mb_s': {
+                repo: sum(e['bytes'] for e in ok if e['repo'] == repo) / MB /
+                max(sum(e['wall_s'] for e in ok if e['repo'] == repo), 1e-9)
+                for repo in sorted({e['repo'] for e in ok})
+            },
+        }
+
+    def print_summary(self):
+        s = self.summary()
+        if s['attempts'] == 0:
+            return
+        print(f"Transfer: {s['files']} file(s), {s['bytes'] / MB:.1f} MB in {s['elapsed_s']:.1f}s "
+              f"({s['mb_s']:.2f} MB/s aggregate), {s['retries']} retried attempt(s), "
+              f"{s['failed_attempts']} failed attempt(s)")
+        if s['files'] > 0:
+            print(f"  Per-file latency: p50 {s['p50_s']:.2f}s, p95 {s['p95_s']:.2f}s (retries and backoff included)")
+            print(f"  Per-attempt latency: p50 {s['attempt_p50_s']:.2f}s, p95 {s['attempt_p95_s']:.2f}s")
+            for repo, mb_s in s['per_repo_mb_s'].items():
+                print(f"  {repo}: {mb_s:.2f} MB/s per stream")
+        if self.jsonl_file is not None:
+            print(f"  Events: {self.jsonl_file}")
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""Extract frames from downloaded DL3DV videos
+
+The `video` file type (~7T for all the 4K videos) is much smaller than the 4K frames (~44T).
+This script turns the downloaded videos into the frame layout of the images+poses download, so
+2_reorganize_to_colmap.py can be run on it:
+
+    input_dir/batch/hash_name/video.mp4
+    ->
+    output_dir/batch/hash_name/images_X/
+        ├── frame_00001.png
+        └── ...
+
+where X is the downscale factor of the resolution (4K: 1, 2K: 2, 960P: 4, 480P: 8).
+
+The frames are decoded and PNG-encoded by ffmpeg (must be on the PATH). Every video is cut into
+segments of a fixed number of frames, and the segments of all the videos are processed by a
+pool of ffmpeg processes, so decoding and encoding run in parallel even for a single scene.
+The segments are submitted scene after scene, a few more than the workers at a time. The frames
+of a scene are written into a hidden .images_X.extracting folder next to images_X, created when
+its first segment is submitted, and moved into place once complete. A temp folder left by an
+interrupted run is replaced by the next run.
+
+Usage example:
+  python scripts/extract_video_frames.py --input_dir DL3DV-10K --resolution 960P --fps 10 --workers 8
+"""
+
+import os
+import json
+import math
+import shutil
+import argparse
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from tqdm import tqdm
+
+
+resolution2width = {
+    '4K': 3840,
+    '2K': 1920,
+    '960P': 960,
+    '480P': 480,
+}
+
+
+def parse_rate(rate: str):
+    """ ffprobe frame rate '30000/1001' -> 29.97, None for an unknown rate ('0/0') """
+    num, _, den = (rate or '').partition('/')
+    try:
+        num, den = float(num), float(den or 1)
+    except ValueError:
+        return None
+    return num / den if num > 0 and den > 0 else None
+
+
+def probe_video(video_file: Path):
+    """ Duration (seconds) and frame rate of a video, with ffprobe
+
+        The frame rate is the average one, or the base rate of the stream when ffprobe does not
+        know the average (it reports '0/0' for some streams).
+
+    :return: (duration, fps), fps is None if the video does not tell its frame rate
+    """
+    cmd = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'stream=avg_frame_rate,r_frame_rate,duration:format=duration',
+        '-of', 'json', str(video_file)
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    info = json.loads(result.stdout)
+    stream = info['streams'][0]
+    fps = parse_rate(stream.get('avg_frame_rate')) or parse_rate(stream.get('r_frame_rate'))
+    duration = float(stream.get('duration') or info['format']['duration'])
+    return duration, fps
+
+
+def plan_segments(duration: float, fps: float, start: float = 0.0, end: float = None, segment_frames: int = 300):
+    """ Cut the time window [start, end) of a video into segments of segment_frames frames
+
+    :return: list of (start time, first frame index, number of frames), frame indices are 0-based
+    """
+    end = duration if end is None else min(end, duration)
+    num_frames = max(0, math.floor((end - start) * fps + 1e-6))
+    return [(start + first / fps, first, min(segment_frames, num_frames - first))
+            for first in range(0, num_frames, segment_frames)]
+
+
+def extract_segment(video_file: Path, odir: Path, seg_start: float, first: int, count: int,
+                    fps: float, width: int, threads: int = 1):
+    """ Decode `count` frames at `fps` from seg_start and write them as odir/frame_XXXXX.png
+
+        Frames are numbered from 1 like the images+poses download, frame `first` (0-based in
+        the extracted sequence) is written as frame_{first + 1}.
+    """
+    filters = [f'fps={fps}']
+    if width is not None:
+        filters.append(f'scale={width}:-2:flags=area')
+    cmd = [
+        'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error', '-y',
+        # before -i, -threads sets the decoder threads (after it, the encoder ones)
+        '-threads', str(threads),
+        '-ss', f'{seg_start:.6f}', '-i', str(video_file),
+        '-vf', ','.join(filters),
+        '-frames:v', str(count),
+        '-start_number', str(first + 1),
+        str(odir / 'frame_%05d.png')
+    ]
+    subprocess.run(cmd, capture_output=True, text=True, check=True)
+
+
+def find_videos(input_dir: Path, batch_name: str = None, scene_name: str = None, video_name: str = 'video.mp4'):
+    """ (batch, scene, video file) of the downloaded videos """
+    batch_folders = [input_dir / batch_name] if batch_name else sorted(b for b in input_dir.iterdir() if b.is_dir())
+    videos = []
+    for batch_folder in batch_folders:
+        if not batch_folder.is_dir():
+            continue
+        for scene_folder in sorted(batch_folder.iterdir()):
+            if scene_name and scene_folder.name != scene_name:
+                continue
+            video_file = scene_folder / video_name
+            if video_file.is_file():
+                videos.append((batch_folder.name, scene_folder.name, video_file))
+    return videos
+
+
+def is_extracted(images_dir: Path, video_file: Path):
+    """ Frames already extracted from the current version of the video """
+    return images_dir.is_dir() and any(images_dir.glob('*.png')) and \
+        images_dir.stat().st_mtime >= video_file.stat().st_mtime
+
+
+def extract_frames(input_dir: str, output_dir: str = None, resolution: str = '960P', fps: float = None,
+                   start: float = 0.0, end: float = None, batch_name: str = None, scene_name: str = None,
+                   workers: int = 4, segment_frames: int = 300, threads: int = 1):
+    """ Extract the frames of all the downloaded videos
+
+    :param input_dir: download directory containing batch folders
+    :param output_dir: root of the frame layout, defaults to input_dir
+    :param resolution: target resolution (frame width), None to keep the video resolution
+    :param fps: target frame rate, None for the frame rate of the video
+    :param start: start of the time window (seconds)
+    :param end: end of the time window (seconds), None for the end of the video
+    :param batch_name: optional batch name (e.g. '1K')
+    :param scene_name: optional scene name (hash)
+    :param workers: number of concurrent ffmpeg processes
+    :param segment_frames: number of frames decoded by one ffmpeg process
+    :param threads: decoding threads per ffmpeg process
+    """
+    input_path = Path(input_dir)
+    output_path = Path(output_dir) if output_dir else input_path
+    width = resolution2width[resolution] if resolution else None
+    images_name = f"images_{resolution2width['4K'] // width}" if width else 'images_1'
+
+    videos = find_videos(input_path, batch_name, scene_name)
+    if not videos:
+        print(f"No videos found in {input_dir}")
+        return
+
+    skip_count = 0
+    scenes = {}
+    for batch, scene, video_file in videos:
+        images_dir = output_path / batch / scene / images_name
+        if is_extracted(images_dir, video_file):
+            skip_count += 1
+            continue
+        try:
+            duration, video_fps = probe_video(video_file)
+        except (subprocess.CalledProcessError, KeyError, IndexError, ValueError) as e:
+            print(f"✗ Error probing {scene}: {getattr(e, 'stderr', None) or e}")
+            continue
+        target_fps = fps or video_fps
+        if not target_fps:
+            print(f"✗ Error probing {scene}: unknown frame rate, set --fps")
+            continue
+        segments = plan_segments(duration, target_fps, start, end, segment_frames)
+        tmp_dir = images_dir.parent / f'.{images_name}.extracting'
+        scenes[scene] = {'video': video_file, 'images_dir': images_dir, 'tmp_dir': tmp_dir, 'fps': target_fps,
+                         'segments': segments, 'pending': len(segments), 'error': None}
+
+    print(f"Found {len(videos)} video(s), {len(scenes)} to extract, {skip_count} already extracted")
+
+    success_count = 0
+    fail_count = 0
+
+    def finish(scene, info):
+        nonlocal success_count, fail_count
+        if info['error'] is None:
+            frames = len(list(info['tmp_dir'].glob('*.png')))
+            if info['images_dir'].exists():
+                shutil.rmtree(info['images_dir'])
+            os.replace(info['tmp_dir'], info['images_dir'])
+            success_count += 1
+            print(f"✓ {scene}: {frames} frames at {info['fps']:g} fps -> {info['images_dir']}")
+        else:
+            shutil.rmtree(info['tmp_dir'], ignore_errors=True)
+            fail_count += 1
+            print(f"✗ Error extracting {scene}: {info['error']}")
+
+    def scene_segments():
+        """ (scene, segment) in submission order, the temp folder of a scene is created with its first segment """
+        for scene, info in scenes.items():
+            if not info['segments']:
+                info['error'] = 'empty time window'
+                finish(scene, info)
+                continue
+            if info['tmp_dir'].exists():
+                shutil.rmtree(info['tmp_dir'])
+            info['tmp_dir'].mkdir(parents=True)
+            for segment in info['segments']:
+                yield scene, segment
+
+    total = sum(len(info['segments']) for info in scenes.values())
+    with ThreadPoolExecutor(max_workers=workers) as executor, tqdm(total=total, desc='Extracting') as pbar:
+        pending = scene_segments()
+        futures = {}
+
+        def submit(n):
+            for scene, (seg_start, first, count) in pending:
+                info = scenes[scene]
+                future = executor.submit(extract_segment, info['video'], info['tmp_dir'], seg_start, first, count,
+                                         info['fps'], width, threads)
+                futures[future] = scene
+                n -= 1
+                if n == 0:
+                    return
+
+        submit(2 * workers)
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                scene = futures.pop(future)
+                info = scenes[scene]
+                try:
+                    future.result()
+                except subprocess.CalledProcessError as e:
+                    info['error'] = info['error'] or (e.stderr.strip() or f'ffmpeg exited with {e.returncode}')
+                except Exception as e:
+                    info['error'] = info['error'] or str(e)
+                info['pending'] -= 1
+                pbar.update(1)
+                if info['pending'] == 0:
+                    finish(scene, info)
+            submit(len(done))
+
+    print(f"\nSummary:")
+    print(f"  Successfully extracted: {success_count} scene(s)")
+    print(f"  Failed: {fail_count} scene(s)")
+    print(f"  Skipped (already extracted): {skip_count} scene(s)")
+    print(f"  Output directory: {output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Extract frames from downloaded DL3DV videos')
+    parser.add_argument('--input_dir', type=str, required=True,
+                        help='Download directory containing batch folders with <hash>/video.mp4')
+    parser.add_argument('--output_dir', type=str, default=None,
+                        help='Root of the extracted frames (batch/hash/images_X), defaults to input_dir')
+    parser.add_argument('--resolution', choices=list(resolution2width), default='960P',
+                        help='Target resolution of the frames')
+    parser.add_argument('--fps', type=float, default=None,
+                        help='Target frame rate. If not specified, every frame of the video is extracted')
+    parser.add_argument('--start', type=float, default=0.0,
+                        help='Start of the time window (seconds)')
+    parser.add_argument('--end', type=float, default=None,
+                        help='End of the time window (seconds). If not specified, until the end of the video')
+    parser.add_argument('--batch', type=str, default=None,
+                        help='Optional: specific batch name (e.g., 1K). If not specified, processes all batches')
+    parser.add_argument('--scene', type=str, default=None,
+                        help='Optional: specific scene name (hash). If not specified, processes all scenes')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Number of concurrent ffmpeg processes (decode + encode)')
+    parser.add_argument('--segment_frames', type=int, default=300,
+                        help='Number of frames extracted by one ffmpeg process')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='Decoding threads per ffmpeg process')
+
+    args = parser.parse_args()
+
+    extract_frames(args.input_dir, args.output_dir, args.resolution, args.fps, args.start, args.end,
+                   args.batch, args.scene, args.workers, args.segment_frames, args.threads)
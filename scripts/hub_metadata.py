@@ -0,0 +1,110 @@
+""" Local cache of the remote file metadata (size, etag, LFS sha256) of the DL3DV repos.
+
+    Instead of learning about a file only when hf_hub_download fetches it, each needed `{batch}/`
+    directory is listed once per repo with the hub file-listing API and the result is kept in
+    a json file. Planning, skip checks and verification then read the cache, without one round
+    trip per file.
+
+    The hub endpoint follows huggingface_hub (HF_ENDPOINT), so a local mock hub can stand in for
+    the real one.
+
+    Cache format:
+        {
+            "listed": {"<repo>": {"<dir>": <unix time of the listing>}},
+            "files": {"<repo>": {"<rel_path>": {"size": int, "etag": str, "sha256": str or null}}}
+        }
+"""
+
+import os
+import json
+import time
+import threading
+
+
+METADATA_TTL = 24 * 3600
+
+
+class RemoteMetadata:
+    """ Cached listing of the repo directories """
+
+    def __init__(self, cache_file: str, ttl: float = METADATA_TTL):
+        """
+        :param cache_file: json file holding the cache
+        :param ttl: seconds after which a directory listing is refreshed
+        """
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.listed = {}
+        self.files = {}
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'r') as f:
+                    data = json.load(f)
+                self.listed = data.get('listed', {})
+                self.files = data.get('files', {})
+            except (OSError, ValueError):
+                pass
+
+    def get(self, repo: str, rel_path: str):
+        """ {'size', 'etag', 'sha256'} of a file, None if unknown """
+        return self.files.get(repo, {}).get(rel_path)
+
+    def is_fresh(self, repo: str, dir_path: str) -> bool:
+        return time.time() - self.listed.get(repo, {}).get(dir_path, 0) < self.ttl
+
+    def prefetch(self, repo: str, dirs: list, api=None):
+        """ List every stale directory of dirs once and cache the metadata of its files.
+
+        :param repo: the huggingface dataset repo
+        :param dirs: directories in the repo, e.g. ['1K', '2K']
+        :param api: the HfApi to use, created if None
+        :return: number of directories listed
+        """
+        stale = [d for d in sorted(set(dirs)) if not self.is_fresh(repo, d)]
+        if not stale:
+            return 0
+        if api is None:
+            from huggingface_hub import HfApi
+            api = HfApi()
+
+        for dir_path in stale:
+            entries = {}
+            for entry in api.list_repo_tree(repo, path_in_repo=dir_path, repo_type='dataset', recursive=True):
+                if not hasattr(entry, 'size') or getattr(entry, 'blob_id', None) is None:
+                    continue  # a folder
+                lfs = getattr(entry, 'lfs', None)
+                sha256 = lfs_sha256(lfs)
+                entries[entry.path] = {
+                    'size': entry.size,
+                    # the hub etag of an LFS file is its sha256, otherwise the git blob id
+                    'etag': sha256 if sha256 is not None else entry.blob_id,
+                    'sha256': sha256,
+                }
+            with self.lock:
+                repo_files = self.files.setdefault(repo, {})
+                prefix = dir_path.rstrip('/') + '/'
+                for path in [p for p in repo_files if p.startswith(prefix)]:
+                    del repo_files[path]
+                repo_files.update(entries)
+                self.listed.setdefault(repo, {})[dir_path] = time.time()
+        self.save()
+        return len(stale)
+
+    def save(self):
+        with self.lock:
+            data = {'listed': self.listed, 'files': self.files}
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+            tmp_file = f'{self.cache_file}.{os.getpid()}.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.cache_file)
+
+
+def lfs_sha256(lfs):
+    """ sha256 of an LFS pointer, as returned by the different huggingface_hub versions """
+    if lfs is None:
+        return None
+    if isinstance(lfs, dict):
+        return lfs.get('sha256') or lfs.get('oid')
+    return getattr(lfs, 'sha256', None)
@@ -0,0 +1,134 @@
+""" Index over the DL3DV-valid.csv manifest.
+
+    The manifest has ~10K rows (hash, sensibility label, batch, duration). Looking a hash up by
+    scanning the csv for every requested scene makes planning large hash lists quadratic, so we
+    build the index once and keep a compact binary copy next to the csv:
+
+        - hash -> row (dict), giving the batch, duration and sensibility label of a scene in O(1)
+        - batch -> ordered hashes, in the same order as the csv, so subsets and offset/count
+          selections are plain slices
+
+    The binary copy is keyed by the size and mtime of the csv and rebuilt when the csv changes.
+"""
+
+import os
+import csv
+import pickle
+from array import array
+
+
+INDEX_VERSION = 1
+
+
+class ManifestIndex:
+    """ O(1) lookups over the DL3DV-valid.csv manifest """
+
+    def __init__(self, hashes: list, batch_names: list, batch_ids: array, label_names: list, label_ids: array,
+                 durations: array):
+        """
+        :param hashes: scene hashes, in csv order
+        :param batch_names: distinct batch names, batch_ids index into it
+        :param batch_ids: per-row batch id
+        :param label_names: distinct sensibility labels, label_ids index into it
+        :param label_ids: per-row sensibility label id
+        :param durations: per-row video duration in seconds
+        """
+        self.hashes = hashes
+        self.batch_names = batch_names
+        self.batch_ids = batch_ids
+        self.label_names = label_names
+        self.label_ids = label_ids
+        self.durations = durations
+
+        self.row = {h: i for i, h in enumerate(hashes)}
+        self.batches = {b: [] for b in batch_names}
+        for h, b in zip(hashes, batch_ids):
+            self.batches[batch_names[b]].append(h)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __contains__(self, hash_name: str):
+        return hash_name in self.row
+
+    def batch(self, hash_name: str) -> str:
+        return self.batch_names[self.batch_ids[self.row[hash_name]]]
+
+    def duration(self, hash_name: str) -> float:
+        return self.durations[self.row[hash_name]]
+
+    def label(self, hash_name: str) -> str:
+        return self.label_names[self.label_ids[self.row[hash_name]]]
+
+    def batch_hashes(self, batch: str) -> list:
+        """ Hashes of a batch in manifest order (empty if the batch is unknown) """
+        return self.batches.get(batch, [])
+
+    @classmethod
+    def from_csv(cls, meta_file: str):
+        """ Parse the manifest csv """
+        hashes, batch_ids, label_ids = [], array('B'), array('B')
+        durations = array('d')
+        batch_names, label_names = {}, {}
+        with open(meta_file, newline='') as f:
+            for r in csv.DictReader(f):
+                hashes.append(r['hash'].strip())
+                batch_ids.append(batch_names.setdefault(r['batch'].strip(), len(batch_names)))
+                label_ids.append(label_names.setdefault(r['sensibility label'].strip(), len(label_names)))
+                try:
+                    durations.append(float(r['duration']))
+                except (TypeError, ValueError):
+                    durations.append(float('nan'))
+        return cls(hashes, list(batch_names), batch_ids, list(label_names), label_ids, durations)
+
+    def to_bytes(self, key: tuple) -> bytes:
+        # hashes are hex sha256 strings, store them as 32 raw bytes each
+        packed_hashes = b''.join(bytes.fromhex(h) for h in self.hashes)
+        payload = (INDEX_VERSION, key, packed_hashes, self.batch_names, self.batch_ids.tobytes(),
+                   self.label_names, self.label_ids.tobytes(), self.durations.tobytes())
+        return pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, key: tuple):
+        """ Restore an index written by to_bytes, None if it is stale or from another version """
+        version, cached_key, packed_hashes, batch_names, batch_ids, label_names, label_ids, durations = pickle.loads(data)
+        if version != INDEX_VERSION or tuple(cached_key) != tuple(key):
+            return None
+        hashes = [packed_hashes[i:i + 32].hex() for i in range(0, len(packed_hashes), 32)]
+        return cls(hashes, batch_names, array('B', batch_ids), label_names, array('B', label_ids),
+                   array('d', durations))
+
+
+def load_manifest_index(meta_file: str, index_file: str = None) -> ManifestIndex:
+    """ Load the manifest index, building and caching it if the cached copy is missing or stale.
+
+    :param meta_file: path to DL3DV-valid.csv
+    :param index_file: path of the binary cache, defaults to the csv path with an .index suffix
+    :return: the ManifestIndex
+    """
+    if index_file is None:
+        index_file = os.path.splitext(meta_file)[0] + '.index'
+    st = os.stat(meta_file)
+    key = (st.st_size, st.st_mtime_ns)
+
+    if os.path.exists(index_file):
+        try:
+            with open(index_file, 'rb') as f:
+                index = ManifestIndex.from_bytes(f.read(), key)
+            if index is not None:
+                return index
+        except Exception:
+            pass  # corrupted cache, rebuild below
+
+    index = ManifestIndex.from_csv(meta_file)
+
+    tmp_file = f'{index_file}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_file, 'wb') as f:
+            f.write(index.to_bytes(key))
+        os.replace(tmp_file, index_file)
+    except (OSError, ValueError):
+        # ValueError: a non-hex hash cannot be packed, keep the index uncached
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return index
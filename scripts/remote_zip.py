@@ -0,0 +1,271 @@
+""" Read selected members of a remote zip with HTTP range requests.
+
+    Only the end of the file (end of central directory record), the central directory and the
+    byte ranges of the wanted members are fetched. For a pose-only or low-resolution workflow
+    (e.g. 'transforms.json' or 'images_4/*') this is a small fraction of the scene zip.
+
+    Members stored next to each other in the zip are fetched with a single range request.
+    Stored and deflated members are supported, the CRC32 of every member is checked.
+
+Usage example:
+  python scripts/remote_zip.py --url http://localhost:8000/1K/<hash>.zip --members 'images_4/*,transforms.json' --output_dir out
+"""
+
+import os
+import zlib
+import struct
+import fnmatch
+import argparse
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from disk_admission import is_safe_member
+
+
+EOCD_SIG = 0x06054b50
+ZIP64_LOCATOR_SIG = 0x07064b50
+ZIP64_EOCD_SIG = 0x06064b50
+CENTRAL_SIG = 0x02014b50
+LOCAL_SIG = 0x04034b50
+# EOCD (22 bytes) + maximum comment length
+TAIL_SIZE = 22 + 0xFFFF
+
+STORED = 0
+DEFLATED = 8
+
+
+class RemoteZipError(Exception):
+    pass
+
+
+class ZipMember:
+    __slots__ = ('name', 'method', 'crc', 'compressed_size', 'file_size', 'header_offset', 'end_offset')
+
+    def __init__(self, name, method, crc, compressed_size, file_size, header_offset):
+        self.name = name
+        self.method = method
+        self.crc = crc
+        self.compressed_size = compressed_size
+        self.file_size = file_size
+        self.header_offset = header_offset
+        # offset of the next member (or of the central directory), set by RemoteZip
+        self.end_offset = None
+
+    def is_dir(self):
+        return self.name.endswith('/')
+
+
+def parse_patterns(members: str) -> list:
+    """ 'images_4/*,transforms.json' -> ['images_4/*', 'transforms.json'] """
+    return [p.strip() for p in members.split(',') if p.strip()]
+
+
+def match_member(name: str, patterns: list) -> bool:
+    """ Match a member name, with or without its top-level folder (the scene hash) """
+    stripped = name.split('/', 1)[1] if '/' in name else name
+    return any(fnmatch.fnmatchcase(name, p) or fnmatch.fnmatchcase(stripped, p) for p in patterns)
+
+
+class RemoteZip:
+    """ Random access to a zip file served over HTTP(S) with Range support """
+
+    def __init__(self, url: str, headers: dict = None, merge_gap: int = 1024 * 1024,
+                 max_request: int = 64 * 1024 * 1024, timeout: float = 60, limiter=None):
+        """
+        :param url: url of the zip file, redirects are resolved once
+        :param headers: extra request headers (e.g. authorization for the first request)
+        :param merge_gap: members separated by less than this many bytes are fetched in one request
+        :param max_request: maximum number of bytes fetched by one request
+        :param limiter: bandwidth.TokenBucket shared with the other transfers, None for no limit
+        """
+        self.headers = dict(headers or {})
+        self.merge_gap = merge_gap
+        self.max_request = max_request
+        self.timeout = timeout
+        self.limiter = limiter
+        self.url = self.resolve(url)
+        self.bytes_fetched = 0
+        self.requests = 0
+        self.members = self.read_central_directory()
+
+    def resolve(self, url: str) -> str:
+        """ Follow the redirects once (e.g. hub -> CDN) so the range requests go to the final url """
+        url, self.size, self.headers = resolve_url(url, self.headers, self.timeout)
+        return url
+
+    def read_range(self, start: int, end: int) -> bytes:
+        """ Bytes [start, end) of the remote file """
+        if end <= start:
+            return b''
+        headers = dict(self.headers, Range=f'bytes={start}-{end - 1}')
+        req = urllib.request.Request(self.url, headers=headers)
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            if resp.status != 206:
+                raise RemoteZipError(f'Server ignored the range request (HTTP {resp.status})')
+            data = resp.read()
+        if len(data) != end - start:
+            raise RemoteZipError(f'Short read: {len(data)} of {end - start} bytes')
+        self.bytes_fetched += len(data)
+        self.requests += 1
+        if self.limiter is not None:
+            self.limiter.consume(len(data))
+        return data
+
+    def read_central_directory(self) -> list:
+        tail_start = max(0, self.size - TAIL_SIZE)
+        tail = self.read_range(tail_start, self.size)
+        pos = tail.rfind(struct.pack('<I', EOCD_SIG))
+        if pos < 0:
+            raise RemoteZipError('End of central directory not found, not a zip file?')
+        _, _, _, _, count, cd_size, cd_offset, _ = struct.unpack('<IHHHHIIH', tail[pos:pos + 22])
+
+        if count == 0xFFFF or cd_size == 0xFFFFFFFF or cd_offset == 0xFFFFFFFF:
+            # zip64: the locator is right before the EOCD
+            loc = pos - 20
+            sig, _, eocd64_offset, _ = struct.unpack('<IIQI', tail[loc:loc + 20])
+            if sig != ZIP64_LOCATOR_SIG:
+                raise RemoteZipError('Zip64 locator not found')
+            rec = self.read_range(eocd64_offset, eocd64_offset + 56)
+            fields = struct.unpack('<IQHHIIQQQQ', rec)
+            if fields[0] != ZIP64_EOCD_SIG:
+                raise RemoteZipError('Zip64 end of central directory not found')
+            count, cd_size, cd_offset = fields[7], fields[8], fields[9]
+
+        if cd_offset >= tail_start:
+            cd = tail[cd_offset - tail_start:cd_offset - tail_start + cd_size]
+        else:
+            cd = self.read_range(cd_offset, cd_offset + cd_size)
+
+        members = []
+        p = 0
+        for _ in range(count):
+            (sig, _, _, flags, method, _, _, crc, csize, usize, name_len, extra_len, comment_len,
+             _, _, _, offset) = struct.unpack('<IHHHHHHIIIHHHHHII', cd[p:p + 46])
+            if sig != CENTRAL_SIG:
+                raise RemoteZipError('Corrupted central directory')
+            raw_name = cd[p + 46:p + 46 + name_len]
+            name = raw_name.decode('utf-8' if flags & 0x800 else 'cp437')
+            extra = cd[p + 46 + name_len:p + 46 + name_len + extra_len]
+            usize, csize, offset = parse_zip64_extra(extra, usize, csize, offset)
+            members.append(ZipMember(name, method, crc, csize, usize, offset))
+            p += 46 + name_len + extra_len + comment_len
+
+        by_offset = sorted(members, key=lambda m: m.header_offset)
+        for cur, nxt in zip(by_offset, by_offset[1:] + [None]):
+            cur.end_offset = nxt.header_offset if nxt is not None else cd_offset
+        return members
+
+    def select(self, patterns: list) -> list:
+        return [m for m in self.members if not m.is_dir() and match_member(m.name, patterns)]
+
+    def iter_member_data(self, members: list):
+        """ Yield (member, uncompressed bytes), fetching neighbouring members together """
+        members = sorted(members, key=lambda m: m.header_offset)
+        group = []
+        for m in members:
+            if group and (m.header_offset - group[-1].end_offset > self.merge_gap
+                          or m.end_offset - group[0].header_offset > self.max_request):
+                yield from self.read_group(group)
+                group = []
+            group.append(m)
+        if group:
+            yield from self.read_group(group)
+
+    def read_group(self, group: list):
+        base = group[0].header_offset
+        buf = self.read_range(base, group[-1].end_offset)
+        for m in group:
+            p = m.header_offset - base
+            sig, _, _, _, _, _, _, _, _, name_len, extra_len = struct.unpack('<IHHHHHIIIHH', buf[p:p + 30])
+            if sig != LOCAL_SIG:
+                raise RemoteZipError(f'Bad local header for {m.name}')
+            start = p + 30 + name_len + extra_len
+            raw = buf[start:start + m.compressed_size]
+            if m.method == STORED:
+                data = raw
+            elif m.method == DEFLATED:
+                data = zlib.decompressobj(-15).decompress(raw)
+            else:
+                raise RemoteZipError(f'Unsupported compression method {m.method} for {m.name}')
+            if zlib.crc32(data) != m.crc or len(data) != m.file_size:
+                raise RemoteZipError(f'CRC mismatch for {m.name}')
+            yield m, data
+
+    def extract(self, patterns: list, odir: str) -> list:
+        """ Extract the members matching patterns into odir, keeping their path in the zip.
+            A member name that is absolute or contains '..' is rejected before anything is fetched.
+
+        :return: the extracted members
+        """
+        selected = self.select(patterns)
+        for m in selected:
+            if not is_safe_member(m.name):
+                raise RemoteZipError(f'Unsafe member name {m.name!r}')
+        for m, data in self.iter_member_data(selected):
+            path = os.path.join(odir, *m.name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+        return selected
+
+
+def resolve_url(url: str, headers: dict = None, timeout: float = 60):
+    """ Follow the redirects of url with HEAD requests, Authorization is dropped when leaving the host
+
+    :return: (final url, size in bytes, headers to use for the final url)
+    """
+
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    headers = dict(headers or {})
+    opener = urllib.request.build_opener(NoRedirect)
+    for _ in range(10):
+        req = urllib.request.Request(url, headers=headers, method='HEAD')
+        try:
+            with opener.open(req, timeout=timeout) as resp:
+                return url, int(resp.headers['Content-Length']), headers
+        except urllib.error.HTTPError as e:
+            if e.code not in (301, 302, 303, 307, 308):
+                raise
+            location = urllib.parse.urljoin(url, e.headers['Location'])
+            if urllib.parse.urlsplit(location).netloc != urllib.parse.urlsplit(url).netloc:
+                # do not send the credentials to another host (signed CDN url)
+                headers.pop('Authorization', None)
+            url = location
+    raise RemoteZipError(f'Too many redirects for {url}')
+
+
+def parse_zip64_extra(extra: bytes, usize: int, csize: int, offset: int):
+    """ Replace the 0xFFFFFFFF sizes/offset by the values of the zip64 extra field """
+    p = 0
+    while p + 4 <= len(extra):
+        tag, size = struct.unpack('<HH', extra[p:p + 4])
+        if tag == 0x0001:
+            q = p + 4
+            if usize == 0xFFFFFFFF:
+                usize, = struct.unpack('<Q', extra[q:q + 8])
+                q += 8
+            if csize == 0xFFFFFFFF:
+                csize, = struct.unpack('<Q', extra[q:q + 8])
+                q += 8
+            if offset == 0xFFFFFFFF:
+                offset, = struct.unpack('<Q', extra[q:q + 8])
+            break
+        p += 4 + size
+    return usize, csize, offset
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract selected members of a remote zip with HTTP range requests')
+    parser.add_argument('--url', type=str, required=True, help='URL of the zip file')
+    parser.add_argument('--members', type=str, required=True, help="Comma-separated glob patterns, e.g. 'images_4/*,transforms.json'")
+    parser.add_argument('--output_dir', type=str, required=True, help='Output directory')
+    args = parser.parse_args()
+
+    rz = RemoteZip(args.url)
+    extracted = rz.extract(parse_patterns(args.members), args.output_dir)
+    print(f'Extracted {len(extracted)} member(s), fetched {rz.bytes_fetched / 1024 ** 2:.1f} of '
+          f'{rz.size / 1024 ** 2:.1f} MB in {rz.requests} request(s)')
@@ -0,0 +1,120 @@
+""" Retry policy and circuit breaker for the hub downloads.
+
+    - RetryPolicy: exponential backoff with jitter, honours the Retry-After header of a 429/503
+      response, and classifies errors so that the ones that cannot succeed on a retry (gated
+      repo, missing repo/file, 401/403/404) fail fast.
+    - CircuitBreaker: shared by all workers of the process. When the error rate over the recent
+      attempts spikes (e.g. a hub outage), it opens and every new attempt waits for the cooldown
+      instead of burning the retries of all scenes within seconds.
+
+    Errors are recognized by class name and HTTP status, so huggingface_hub does not need to be
+    imported here.
+"""
+
+import time
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+
+FATAL_ERRORS = {'GatedRepoError', 'RepositoryNotFoundError', 'RevisionNotFoundError', 'EntryNotFoundError',
+                'RemoteEntryNotFoundError', 'DisabledRepoError'}
+FATAL_STATUS = {400, 401, 403, 404, 410}
+
+
+def status_code(exc: BaseException):
+    """ HTTP status of a requests (huggingface_hub) or urllib error, None otherwise """
+    response = getattr(exc, 'response', None)
+    if response is not None:
+        return getattr(response, 'status_code', None)
+    code = getattr(exc, 'code', None)
+    return code if isinstance(code, int) else None
+
+
+def retry_after(exc: BaseException):
+    """ Seconds requested by the Retry-After header of the error response, None if absent """
+    response = getattr(exc, 'response', None)
+    headers = getattr(response if response is not None else exc, 'headers', None) or {}
+    value = headers.get('Retry-After') if hasattr(headers, 'get') else None
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_fatal(exc: BaseException) -> bool:
+    """ Whether retrying cannot help (access denied, missing repo or file) """
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    if names & FATAL_ERRORS:
+        return True
+    return status_code(exc) in FATAL_STATUS
+
+
+class RetryPolicy:
+    """ Exponential backoff with full jitter """
+
+    def __init__(self, max_try: int = 5, base_delay: float = 2.0, max_delay: float = 120.0, jitter: float = 0.5):
+        """
+        :param max_try: maximum number of attempts per file
+        :param base_delay: delay before the first retry (seconds), doubled for every retry
+        :param max_delay: upper bound of the delay
+        :param jitter: fraction of the delay that is randomized, spreads the retries of the workers
+        """
+        self.max_try = max_try
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, attempt: int, exc: BaseException = None) -> float:
+        """ Seconds to wait before retry number `attempt` (1 for the first retry) """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = delay * (1 - self.jitter) + random.uniform(0, delay * self.jitter)
+        requested = retry_after(exc) if exc is not None else None
+        if requested is not None:
+            delay = max(delay, min(requested, self.max_delay * 5))
+        return delay
+
+
+class CircuitBreaker:
+    """ Pause all downloads of the process when the recent error rate is too high """
+
+    def __init__(self, window: int = 20, threshold: float = 0.5, cooldown: float = 60.0):
+        """
+        :param window: number of recent attempts the error rate is computed on
+        :param threshold: error rate opening the breaker (needs a full window)
+        :param cooldown: seconds the breaker stays open
+        """
+        self.window = window
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.results = deque(maxlen=window)
+        self.open_until = 0.0
+
+    def record(self, ok: bool):
+        with self.lock:
+            self.results.append(ok)
+            if len(self.results) < self.window or time.time() < self.open_until:
+                return
+            error_rate = self.results.count(False) / len(self.results)
+            if error_rate >= self.threshold:
+                self.open_until = time.time() + self.cooldown
+                self.results.clear()
+                print(f'WARNING: {error_rate:.0%} of the recent downloads failed, pausing all downloads for '
+                      f'{self.cooldown:.0f}s')
+
+    def wait(self):
+        """ Block while the breaker is open """
+        while True:
+            with self.lock:
+                remaining = self.open_until - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 5.0))
@@ -0,0 +1,328 @@
+""" Columnar index of the scene attributes and query-based scene selection.
+
+    The attributes of the scenes are only published in visualize/index.html, one table row per
+    scene (batch, bounded/unbounded, reflection, transparency, lighting, POI, category, device).
+    The cells after the figcaption are mapped to the columns by position: the order of a <th>
+    header row when the table has one, HTML_COLUMNS otherwise. A colspan cell fills several
+    positions, an empty cell is a missing value, and a row whose cell count differs from the
+    header is skipped. Device cells that repeat the POI or hold a capture folder name (both
+    occur in the published table) are cleaned up, see clean_devices.
+    The html is parsed once and its columns are stored as dictionary-encoded arrays aligned with
+    the rows of the manifest index (manifest_index), which provides the csv columns
+    (sensibility label, batch, duration). The encoded columns are cached next to the csv with an
+    .attributes suffix, keyed by the size and mtime of the csv and of the html.
+
+    Queries are conjunctions/disjunctions of comparisons, 'and' binds tighter than 'or':
+
+        bound=unbd and reflection!='abs nonreflection' and duration<90
+        lighting=hlight or category='Parks and Recreation'
+
+    Categorical values are compared ignoring case and '-' vs ' ' (the table mixes both). Values
+    containing ' and ' / ' or ' must be quoted. Scenes without attributes (not in the table)
+    match neither '=' nor '!='.
+
+Usage example:
+  python scripts/scene_attributes.py --meta cache/DL3DV-valid.csv --html visualize/index.html --where "bound=unbd and duration<90"
+"""
+
+import os
+import re
+import time
+import pickle
+import argparse
+import operator
+from array import array
+from html.parser import HTMLParser
+
+from manifest_index import load_manifest_index
+
+
+ATTRIBUTES_VERSION = 2
+HTML_LINK = 'https://raw.githubusercontent.com/DL3DV-10K/Dataset/main/visualize/index.html'
+# table cells after the figcaption, in order, when the table has no header row. The batch is
+# taken from the manifest.
+HTML_COLUMNS = ['html_batch', 'bound', 'reflection', 'transparency', 'lighting', 'poi', 'category', 'device']
+# normalized header text -> column
+HEADER_NAMES = {'batch': 'html_batch', 'bound': 'bound', 'bounded': 'bound', 'reflection': 'reflection',
+                'transparency': 'transparency', 'lighting': 'lighting', 'light': 'lighting', 'poi': 'poi',
+                'category': 'category', 'scene category': 'category', 'device': 'device'}
+# header of the figcaption column, not an attribute
+SCENE_HEADERS = {'', 'scene', 'hash', 'image', 'preview'}
+MISSING = {'', 'nan', 'none'}
+
+HASH = re.compile(r'[0-9a-fA-F]+')
+CONDITION = re.compile(r"""\s*(\w+)\s*(!=|<=|>=|=|<|>)\s*('[^']*'|"[^"]*"|.+?)\s*(?:\s(and|or)\s|$)""", re.I)
+OPS = {'=': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+
+def normalize(value: str) -> str:
+    """ 'abs-nonreflection' / 'Abs nonreflection' -> 'abs nonreflection' """
+    return ' '.join(value.replace('-', ' ').split()).casefold()
+
+
+class TableParser(HTMLParser):
+    """ Rows of the attribute table: the <th> header and, per scene, its figcaption and the cells after it.
+
+        The scene cells of the published table are nested in the <td> holding the figcaption,
+        which an html tree builder would reorder. This parser only follows the tags, so a cell
+        is any <td> opened after the figcaption of its row.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.header = None
+        self.rows = []
+        self.row = None
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            self.row = {'caption': None, 'cells': [], 'header': []}
+        elif self.row is None:
+            return
+        elif tag in ('td', 'th', 'figcaption'):
+            try:
+                span = max(1, int(dict(attrs).get('colspan') or 1))
+            except ValueError:
+                span = 1
+            self.cell = {'tag': tag, 'text': [], 'span': span}
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell['text'].append(data)
+
+    def handle_endtag(self, tag):
+        if self.row is None:
+            return
+        if tag == 'tr':
+            if self.row['header']:
+                self.header = self.row['header']
+            elif self.row['caption'] is not None:
+                self.rows.append((self.row['caption'], self.row['cells']))
+            self.row = None
+        elif self.cell is not None and tag == self.cell['tag']:
+            text = ' '.join(''.join(self.cell['text']).split())
+            if tag == 'figcaption':
+                self.row['caption'] = text
+            elif tag == 'th':
+                self.row['header'].extend([text] * self.cell['span'])
+            elif self.row['caption'] is not None:
+                self.row['cells'].extend([text] * self.cell['span'])
+            self.cell = None
+
+
+def header_columns(header: list) -> list:
+    """ Column of each cell after the figcaption, from the <th> texts (None for an unknown header) """
+    if header and normalize(header[0]) in SCENE_HEADERS:
+        header = header[1:]
+    return [HEADER_NAMES.get(normalize(h)) for h in header]
+
+
+def clean_devices(rows: dict):
+    """ Repair the device column in place.
+
+        A device equal to the POI of its row is a copy of the POI, it is dropped. A capture
+        folder name (e.g. 'scene\\unbd-...-pixel6a-yzx(1)') is replaced by the device it names,
+        if any, out of the devices of the other rows.
+    """
+    def is_folder(value):
+        return '\\' in value or '/' in value
+
+    known = {normalize(r['device']): r['device'] for r in rows.values()
+             if r.get('device') is not None and not is_folder(r['device'])
+             and normalize(r['device']) != normalize(r.get('poi') or '')}
+    for r in rows.values():
+        device = r.get('device')
+        if device is None:
+            continue
+        if is_folder(device):
+            tokens = re.split(r'[-\\/_ ]', device)
+            r['device'] = next((known[normalize(t)] for t in tokens if normalize(t) in known), None)
+        elif r.get('poi') is not None and normalize(device) == normalize(r['poi']):
+            r['device'] = None
+
+
+def parse_visualize_html(html_file: str) -> dict:
+    """ hash -> {column: value} of the attribute table, values are None when missing """
+    parser = TableParser()
+    with open(html_file, 'r', encoding='utf-8') as f:
+        parser.feed(f.read())
+    parser.close()
+    columns = header_columns(parser.header) if parser.header else HTML_COLUMNS
+    rows, skipped = {}, 0
+    for caption, cells in parser.rows:
+        if not HASH.fullmatch(caption) or len(cells) != len(columns):
+            skipped += 1
+            continue
+        rows[caption.lower()] = {name: (None if value.lower() in MISSING else value)
+                                 for name, value in zip(columns, cells) if name is not None}
+    if skipped:
+        print(f'Skipped {skipped} malformed row(s) of {html_file}')
+    clean_devices(rows)
+    return rows
+
+
+def parse_where(where: str) -> list:
+    """ 'a=1 and b<2 or c!=x' -> [[('a', '=', '1'), ('b', '<', '2')], [('c', '!=', 'x')]] """
+    groups, group, pos = [], [], 0
+    where = where.strip()
+    while pos < len(where):
+        m = CONDITION.match(where, pos)
+        if m is None:
+            raise ValueError(f'Cannot parse the query at: {where[pos:]!r}')
+        column, op, value, joiner = m.groups()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in '\'"':
+            value = value[1:-1]
+        group.append((column.lower(), op, value))
+        if joiner is None or joiner.lower() == 'or':
+            groups.append(group)
+            group = []
+        pos = m.end()
+    if group:
+        groups.append(group)
+    if not groups:
+        raise ValueError('Empty query')
+    return groups
+
+
+class SceneAttributes:
+    """ Columnar scene attributes, aligned with the rows of a ManifestIndex """
+
+    def __init__(self, index, columns: dict):
+        """
+        :param index: the manifest_index.ManifestIndex the columns are aligned with
+        :param columns: name -> (names, codes): names[0] is None (missing value), codes has one
+                        entry per manifest row indexing into names
+        """
+        self.index = index
+        self.columns = dict(columns)
+        self.columns['batch'] = (index.batch_names, index.batch_ids)
+        self.columns['label'] = (index.label_names, index.label_ids)
+
+    @classmethod
+    def from_html(cls, index, html_file: str):
+        rows = parse_visualize_html(html_file)
+        columns = {}
+        for name in HTML_COLUMNS[1:]:
+            names, codes, lookup = [None], array('H'), {}
+            for h in index.hashes:
+                value = rows.get(h, {}).get(name)
+                if value is None:
+                    codes.append(0)
+                    continue
+                key = normalize(value)
+                if key not in lookup:
+                    lookup[key] = len(names)
+                    names.append(value.replace('-', ' '))
+                codes.append(lookup[key])
+            columns[name] = (names, codes)
+        return cls(index, columns)
+
+    def column_names(self) -> list:
+        return sorted(self.columns) + ['duration']
+
+    def values(self, column: str) -> list:
+        """ Distinct values of a categorical column """
+        return [v for v in self.columns[column][0] if v is not None]
+
+    def mask(self, column: str, op: str, value: str) -> list:
+        """ Per-row result of one comparison """
+        if column == 'duration':
+            try:
+                threshold = float(value)
+            except ValueError:
+                raise ValueError(f'duration needs a number, got {value!r}') from None
+            compare = OPS[op]
+            return [compare(d, threshold) for d in self.index.durations]
+        if column not in self.columns:
+            raise ValueError(f"Unknown column {column!r}, available: {', '.join(self.column_names())}")
+        if op not in ('=', '!='):
+            raise ValueError(f'{column} is categorical, only = and != are supported')
+        names, codes = self.columns[column]
+        wanted = {code for code, name in enumerate(names) if name is not None and normalize(name) == normalize(value)}
+        if not wanted:
+            raise ValueError(f"Unknown value {value!r} for {column}, available: {', '.join(self.values(column))}")
+        if op == '!=':
+            wanted = set(range(1, len(names))) - wanted
+        return [c in wanted for c in codes]
+
+    def select(self, where: str) -> list:
+        """ Hashes of the scenes matching the query, in manifest order """
+        selected = [False] * len(self.index)
+        for group in parse_where(where):
+            matched = [True] * len(self.index)
+            for column, op, value in group:
+                matched = [a and b for a, b in zip(matched, self.mask(column, op, value))]
+            selected = [a or b for a, b in zip(selected, matched)]
+        return [h for h, keep in zip(self.index.hashes, selected) if keep]
+
+    def to_bytes(self, key: tuple) -> bytes:
+        payload = (ATTRIBUTES_VERSION, key,
+                   {name: (names, codes.tobytes()) for name, (names, codes) in self.columns.items()
+                    if name not in ('batch', 'label')})
+        return pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def from_bytes(cls, index, data: bytes, key: tuple):
+        """ Restore the columns written by to_bytes, None if they are stale or from another version """
+        version, cached_key, columns = pickle.loads(data)
+        if version != ATTRIBUTES_VERSION or tuple(cached_key) != tuple(key):
+            return None
+        return cls(index, {name: (names, array('H', codes)) for name, (names, codes) in columns.items()})
+
+
+def load_scene_attributes(meta_file: str, html_file: str, attributes_file: str = None) -> SceneAttributes:
+    """ Load the scene attributes, parsing the html and caching the columns if needed.
+
+    :param meta_file: path to DL3DV-valid.csv
+    :param html_file: path to visualize/index.html
+    :param attributes_file: path of the binary cache, defaults to the csv path with an .attributes suffix
+    :return: the SceneAttributes
+    """
+    if attributes_file is None:
+        attributes_file = os.path.splitext(meta_file)[0] + '.attributes'
+    index = load_manifest_index(meta_file)
+    meta_st, html_st = os.stat(meta_file), os.stat(html_file)
+    key = (meta_st.st_size, meta_st.st_mtime_ns, html_st.st_size, html_st.st_mtime_ns)
+
+    if os.path.exists(attributes_file):
+        try:
+            with open(attributes_file, 'rb') as f:
+                attributes = SceneAttributes.from_bytes(index, f.read(), key)
+            if attributes is not None:
+                return attributes
+        except Exception:
+            pass  # corrupted cache, rebuild below
+
+    attributes = SceneAttributes.from_html(index, html_file)
+
+    tmp_file = f'{attributes_file}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_file, 'wb') as f:
+            f.write(attributes.to_bytes(key))
+        os.replace(tmp_file, attributes_file)
+    except OSError:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return attributes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query the DL3DV scene attributes')
+    parser.add_argument('--meta', type=str, help='Path to DL3DV-valid.csv', default='cache/DL3DV-valid.csv')
+    parser.add_argument('--html', type=str, help='Path to visualize/index.html', default='visualize/index.html')
+    parser.add_argument('--where', type=str, help='Query, e.g. "bound=unbd and duration<90"', default=None)
+    args = parser.parse_args()
+
+    attributes = load_scene_attributes(args.meta, args.html)
+    if args.where is None:
+        for column in attributes.column_names():
+            values = 'number' if column == 'duration' else ', '.join(attributes.values(column))
+            print(f'{column}: {values}')
+    else:
+        start = time.perf_counter()
+        hashes = attributes.select(args.where)
+        elapsed = time.perf_counter() - start
+        for h in hashes:
+            print(h)
+        print(f'{len(hashes)} scene(s) match, resolved in {elapsed * 1000:.1f} ms')
@@ -0,0 +1,120 @@
+""" Per-scene completion ledger of a COLMAP output directory.
+
+    Deciding whether a scene is already reorganized used to list its images folder (thousands of
+    frames) for every scene of every run. The ledger records, per scene, the stage it reached,
+    its frame count and a fingerprint of the source it was built from, so a resume is one dict
+    lookup per scene.
+
+    The ledger is an append-only json lines file in the output root (safe on NFS, unlike sqlite
+    locking), the last line of a scene wins:
+        {"scene": ..., "stage": "done", "frames": 312, "colmap": true, "fingerprint": ..., "time": ...}
+    It is compacted on load once most of its lines are superseded. Stages are 'done',
+    'incomplete' (processed but images or sparse files are missing) and 'error'. A null stage
+    forgets the scene.
+"""
+
+import os
+import json
+import time
+import threading
+
+
+LEDGER_FILE = '.scene_ledger.jsonl'
+
+
+def source_fingerprint(scene_folders: list) -> str:
+    """ 'batch/hash@mtime_ns' of the extracted folders of a scene, changes when a scene is extracted again """
+    parts = []
+    for folder in scene_folders:
+        folder = str(folder)
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+        except OSError:
+            mtime = 0
+        parts.append(f'{os.path.basename(os.path.dirname(folder))}/{os.path.basename(folder)}@{mtime}')
+    return ';'.join(sorted(parts))
+
+
+def fingerprint_sources(fingerprint: str) -> set:
+    """ The sources named by a fingerprint, without their mtime: 'batch/hash' for the extracted
+        folders of source_fingerprint, 'zip:batch/hash.zip' for the zips download.py --colmap_dir
+        extracts straight into the output directory
+    """
+    return {part.split('@')[0] for part in (fingerprint or '').split(';') if part}
+
+
+class SceneLedger:
+    """ Latest state of every scene of an output directory, shared by the worker threads """
+
+    def __init__(self, root: str, file_name: str = LEDGER_FILE):
+        """
+        :param root: output directory the ledger describes
+        :param file_name: name of the ledger file in root
+        """
+        self.path = os.path.join(root, file_name)
+        self.lock = threading.Lock()
+        self.entries = {}
+        lines = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line of an interrupted run
+                    lines += 1
+                    if entry.get('stage') is None:
+                        self.entries.pop(entry['scene'], None)
+                    else:
+                        self.entries[entry['scene']] = entry
+        if lines > 1000 and lines > 2 * len(self.entries):
+            self.compact()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, scene: str):
+        """ Latest entry of the scene, None if the ledger does not know it """
+        return self.entries.get(scene)
+
+    def append(self, entry: dict):
+        with self.lock:
+            if entry['stage'] is None:
+                self.entries.pop(entry['scene'], None)
+            else:
+                self.entries[entry['scene']] = entry
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def record(self, scene: str, stage: str, frames: int = 0, colmap: bool = False, fingerprint: str = None,
+               error: str = None):
+        """ Record the state a scene reached """
+        entry = {'scene': scene, 'stage': stage, 'frames': frames, 'colmap': colmap,
+                 'fingerprint': fingerprint, 'time': time.time()}
+        if error is not None:
+            entry['error'] = error
+        self.append(entry)
+
+    def forget(self, scene: str):
+        if scene in self.entries:
+            self.append({'scene': scene, 'stage': None, 'time': time.time()})
+
+    def is_done(self, scene: str, fingerprint: str = None) -> bool:
+        """ Whether the scene is done, from the same source if a fingerprint is given """
+        entry = self.entries.get(scene)
+        if entry is None or entry['stage'] != 'done':
+            return False
+        return fingerprint is None or entry.get('fingerprint') == fingerprint
+
+    def compact(self):
+        """ Rewrite the ledger with one line per scene """
+        with self.lock:
+            tmp_file = f'{self.path}.{os.getpid()}.tmp'
+            try:
+                with open(tmp_file, 'w') as f:
+                    for entry in self.entries.values():
+                        f.write(json.dumps(entry) + '\n')
+                os.replace(tmp_file, self.path)
+            except OSError:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
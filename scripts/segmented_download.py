@@ -0,0 +1,226 @@
+""" Multi-stream download of one large file with HTTP range requests, resumable per chunk.
+
+    A 4K scene zip or video is several GB and a single TCP stream to the hub is far below the
+    link speed. The file is split into chunks of chunk_size bytes that `streams` threads fetch in
+    parallel with range requests, each writing its bytes at their offset in a preallocated
+    dest.part file.
+
+    Next to it, dest.part.chunks holds a small header (file size, chunk size, etag) and a bitmap
+    with one bit per finished chunk. A bit is set only after the chunk data is flushed to disk,
+    so an interrupted transfer (failed request, expired CDN url, killed process) resumes with
+    the missing chunks instead of restarting from byte 0. The state is discarded when the size,
+    chunk size or etag of the remote file changed. Once all the chunks are there, dest.part is
+    renamed to dest.
+
+Usage example:
+  python scripts/segmented_download.py --url http://localhost:8000/4K/<hash>.zip --output out/<hash>.zip --streams 8
+"""
+
+import os
+import time
+import errno
+import struct
+import hashlib
+import argparse
+import threading
+import urllib.request
+
+from remote_zip import resolve_url
+
+
+MB = 1024 ** 2
+CHUNK_SIZE = 64 * MB
+READ_SIZE = MB
+STATE_MAGIC = b'DL3DVSEG'
+# magic, version, file size, chunk size, sha256 of the etag
+STATE_HEADER = struct.Struct('<8sIQQ32s')
+STATE_VERSION = 1
+
+
+class SegmentedDownloadError(Exception):
+    pass
+
+
+class ChunkState:
+    """ Completion bitmap of the chunks of one transfer, persisted in <part>.chunks """
+
+    def __init__(self, path: str, size: int, chunk_size: int, etag: str = None):
+        self.path = path
+        self.count = (size + chunk_size - 1) // chunk_size
+        self.header = STATE_HEADER.pack(STATE_MAGIC, STATE_VERSION, size, chunk_size,
+                                        hashlib.sha256((etag or '').encode()).digest())
+        self.lock = threading.Lock()
+        self.bits = bytearray((self.count + 7) // 8)
+        self.resumed = False
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if data[:STATE_HEADER.size] == self.header and len(data) == STATE_HEADER.size + len(self.bits):
+                self.bits[:] = data[STATE_HEADER.size:]
+                self.resumed = True
+        except OSError:
+            pass
+        self.fd = None
+
+    def open(self):
+        """ Open the state file for updates, rewriting it unless an existing state was loaded """
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if not self.resumed:
+            os.ftruncate(self.fd, 0)
+            os.pwrite(self.fd, self.header + bytes(self.bits), 0)
+        return self
+
+    def is_done(self, i: int) -> bool:
+        return bool(self.bits[i >> 3] & (1 << (i & 7)))
+
+    def mark_done(self, i: int):
+        with self.lock:
+            self.bits[i >> 3] |= 1 << (i & 7)
+            os.pwrite(self.fd, bytes((self.bits[i >> 3],)), STATE_HEADER.size + (i >> 3))
+
+    def missing(self) -> list:
+        return [i for i in range(self.count) if not self.is_done(i)]
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class SegmentedDownload:
+    """ Fetch one file over several parallel range requests into a preallocated file """
+
+    def __init__(self, url: str, dest: str, headers: dict = None, streams: int = 8, chunk_size: int = CHUNK_SIZE,
+                 etag: str = None, timeout: float = 60, limiter=None):
+        """
+        :param url: url of the file, redirects (hub -> CDN) are resolved on every run
+        :param dest: output path, the transfer state lives in dest.part and dest.part.chunks
+        :param headers: request headers (e.g. the hub authorization)
+        :param streams: number of parallel range requests
+        :param chunk_size: bytes per range request, the unit of resume
+        :param etag: etag of the remote file, a changed etag invalidates a partial transfer
+        :param limiter: bandwidth.TokenBucket shared with the other transfers, None for no limit
+        """
+        self.url = url
+        self.dest = dest
+        self.headers = dict(headers or {})
+        self.streams = max(1, streams)
+        self.chunk_size = chunk_size
+        self.etag = etag
+        self.timeout = timeout
+        self.limiter = limiter
+        self.part_file = dest + '.part'
+        self.state_file = self.part_file + '.chunks'
+        self.size = None
+        self.bytes_fetched = 0
+        self.bytes_resumed = 0
+
+    def fetch_chunk(self, url: str, headers: dict, fd: int, state: ChunkState, i: int, stop: threading.Event):
+        start = i * self.chunk_size
+        end = min(start + self.chunk_size, self.size)
+        req = urllib.request.Request(url, headers=dict(headers, Range=f'bytes={start}-{end - 1}'))
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            if resp.status != 206:
+                raise SegmentedDownloadError(f'Server ignored the range request (HTTP {resp.status})')
+            offset = start
+            while offset < end:
+                if stop.is_set():
+                    return
+                data = resp.read(min(READ_SIZE, end - offset))
+                if not data:
+                    raise SegmentedDownloadError(f'Short read in chunk {i}: {offset - start} of {end - start} bytes')
+                os.pwrite(fd, data, offset)
+                offset += len(data)
+                with state.lock:
+                    self.bytes_fetched += len(data)
+                if self.limiter is not None:
+                    self.limiter.consume(len(data))
+        # the bit is only set once the chunk is on disk
+        getattr(os, 'fdatasync', os.fsync)(fd)
+        state.mark_done(i)
+
+    def run(self) -> int:
+        """ Download the missing chunks, then move the file into place.
+
+        :return: the size of the file
+        """
+        url, self.size, headers = resolve_url(self.url, self.headers, self.timeout)
+        os.makedirs(os.path.dirname(os.path.abspath(self.dest)), exist_ok=True)
+        state = ChunkState(self.state_file, self.size, self.chunk_size, self.etag)
+        fd = os.open(self.part_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # a new transfer, or a state without its part file
+            if not state.resumed or os.fstat(fd).st_size != self.size:
+                state.resumed = False
+                state.bits = bytearray(len(state.bits))
+                os.ftruncate(fd, 0)
+                try:
+                    # reserve the blocks up front, a full disk fails now rather than mid-transfer
+                    os.posix_fallocate(fd, 0, self.size)
+                except (AttributeError, OSError) as e:
+                    if getattr(e, 'errno', None) == errno.ENOSPC:
+                        raise
+                    # not supported by the filesystem: sparse file
+                    os.ftruncate(fd, self.size)
+            state.open()
+            missing = state.missing()
+            self.bytes_resumed = self.size - sum(min(self.chunk_size, self.size - i * self.chunk_size) for i in missing)
+
+            stop = threading.Event()
+            errors = []
+            pending = list(reversed(missing))
+            pending_lock = threading.Lock()
+
+            def worker():
+                while not stop.is_set():
+                    with pending_lock:
+                        if not pending:
+                            return
+                        i = pending.pop()
+                    try:
+                        self.fetch_chunk(url, headers, fd, state, i, stop)
+                    except BaseException as e:
+                        errors.append(e)
+                        stop.set()
+
+            threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(self.streams, len(missing)))]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            if errors:
+                raise errors[0]
+            if state.missing():
+                raise SegmentedDownloadError(f'{len(state.missing())} chunk(s) of {self.dest} missing')
+        finally:
+            os.close(fd)
+            state.close()
+
+        os.replace(self.part_file, self.dest)
+        os.remove(self.state_file)
+        return self.size
+
+
+def download_segmented(url: str, dest: str, headers: dict = None, streams: int = 8, chunk_size: int = CHUNK_SIZE,
+                       etag: str = None, limiter=None) -> int:
+    """ Download url to dest with streams parallel range requests, resuming a previous partial transfer
+
+    :return: the size of the file
+    """
+    return SegmentedDownload(url, dest, headers, streams, chunk_size, etag, limiter=limiter).run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download a large file with parallel range requests, resumable per chunk')
+    parser.add_argument('--url', type=str, required=True, help='URL of the file')
+    parser.add_argument('--output', type=str, required=True, help='Output file')
+    parser.add_argument('--streams', type=int, default=8, help='Number of parallel range requests')
+    parser.add_argument('--chunk_mb', type=int, default=CHUNK_SIZE // MB, help='Chunk size (MB), the unit of resume')
+    args = parser.parse_args()
+
+    download = SegmentedDownload(args.url, args.output, streams=args.streams, chunk_size=args.chunk_mb * MB)
+    start = time.perf_counter()
+    download.run()
+    elapsed = time.perf_counter() - start
+    print(f'Downloaded {download.size / MB:.1f} MB ({download.bytes_resumed / MB:.1f} MB resumed) in {elapsed:.1f}s, '
+          f'{download.bytes_fetched / MB / max(elapsed, 1e-9):.1f} MB/s with {download.streams} stream(s)')
@@ -0,0 +1,225 @@
+""" Integrity verification of downloaded scenes.
+
+    - Extracted zips: when a zip is extracted, the name, size and CRC32 of its members are
+      recorded in .cache/zip_members/<rel_path>.json. Verification checks that every member
+      exists with the right size and CRC32, which catches truncated and half-extracted scenes.
+    - Zips of which only some members were fetched (download.py --members) record the patterns
+      they were fetched with next to the members. Such a scene is incomplete for a run that does
+      not ask for (a subset of) the same patterns.
+    - Single files (e.g. video.mp4, or zips kept with --keep_zip): compared to the LFS sha256
+      (or at least the size) from the remote metadata cache, see hub_metadata.
+
+    The scenes are checked by a process pool. Results are kept in a ledger
+    (.cache/verify.sqlite) with the size and mtime of every checked file, so verifying again
+    only hashes the files that changed since the last run.
+"""
+
+import os
+import json
+import zlib
+import hashlib
+
+
+CHUNK = 8 * 1024 * 1024
+
+
+def members_file_path(output_dir: str, rel_path: str) -> str:
+    """ Where the member list of the zip rel_path is recorded """
+    return os.path.join(output_dir, '.cache', 'zip_members', rel_path + '.json')
+
+
+def zip_members(zip_ref) -> dict:
+    """ name -> [size, crc32] of the files in an open zipfile.ZipFile """
+    return {info.filename: [info.file_size, info.CRC] for info in zip_ref.infolist() if not info.is_dir()}
+
+
+def save_members(members_file: str, members: dict, patterns: list = None):
+    """ Record the members of an extracted zip
+
+    :param patterns: the --members patterns if only the matching members were fetched, None for the whole zip
+    """
+    os.makedirs(os.path.dirname(members_file), exist_ok=True)
+    tmp_file = f'{members_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(members if patterns is None else {'patterns': list(patterns), 'members': members}, f)
+    os.replace(tmp_file, members_file)
+
+
+def load_members(members_file: str):
+    """ (members, patterns) recorded by save_members, patterns is None for a whole zip """
+    with open(members_file, 'r') as f:
+        record = json.load(f)
+    if isinstance(record.get('patterns'), list) and isinstance(record.get('members'), dict):
+        return record['members'], record['patterns']
+    return record, None
+
+
+def fetched_patterns(output_dir: str, rel_path: str):
+    """ The patterns the zip rel_path was partially fetched with, None if it was extracted whole (or not recorded) """
+    try:
+        return load_members(members_file_path(output_dir, rel_path))[1]
+    except (OSError, ValueError):
+        return None
+
+
+def covers(fetched: list, requested: list = None) -> bool:
+    """ Whether the members fetched with the patterns `fetched` satisfy a run requesting `requested`
+        (None for the whole zip)
+    """
+    return fetched is None or (requested is not None and set(requested) <= set(fetched))
+
+
+def file_crc32(path: str) -> int:
+    crc = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK)
+            if not chunk:
+                return crc
+            crc = zlib.crc32(chunk, crc)
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK)
+            if not chunk:
+                return h.hexdigest()
+            h.update(chunk)
+
+
+def verify_item(output_dir: str, item: dict, remote: dict, known: dict, patterns: list = None):
+    """ Verify one item of the download list. Runs in a worker process.
+
+    :param output_dir: the output directory
+    :param item: {'repo', 'rel_path'}
+    :param remote: remote metadata of the item {'size', 'etag', 'sha256'}, or None
+    :param known: path -> (size, mtime_ns) of the files verified ok in a previous run
+    :param patterns: the --members patterns of the run, None if whole zips are expected
+    :return: (status, message, records) with status 'ok', 'failed' or 'unknown' and
+             records a list of (path, size, mtime_ns, ok) for the ledger
+    """
+    rel_path = item['rel_path']
+    records = []
+
+    def unchanged(path, st):
+        return known.get(path) == (st.st_size, st.st_mtime_ns)
+
+    # zips kept as downloaded (download.py --keep_zip) are checked like single files
+    if rel_path.endswith('.zip') and not os.path.isfile(os.path.join(output_dir, rel_path)):
+        if not os.path.exists(os.path.join(output_dir, rel_path[:-len('.zip')])):
+            return 'failed', 'missing', records
+        members_file = members_file_path(output_dir, rel_path)
+        if not os.path.exists(members_file):
+            return 'unknown', 'no member record (extracted by an older version)', records
+        members, fetched = load_members(members_file)
+        if not covers(fetched, patterns):
+            return 'failed', f"partial, only {','.join(fetched)} fetched (--members)", records
+        odir = os.path.join(output_dir, os.path.dirname(rel_path))
+        errors = []
+        for name, (size, crc) in members.items():
+            path = os.path.join(odir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                errors.append(f'missing {name}')
+                continue
+            if st.st_size != size:
+                errors.append(f'size mismatch {name}')
+                records.append((path, st.st_size, st.st_mtime_ns, False))
+                continue
+            if unchanged(path, st):
+                continue
+            ok = file_crc32(path) == crc
+            if not ok:
+                errors.append(f'crc mismatch {name}')
+            records.append((path, st.st_size, st.st_mtime_ns, ok))
+        if errors:
+            more = f' (+{len(errors) - 3} more)' if len(errors) > 3 else ''
+            return 'failed', ', '.join(errors[:3]) + more, records
+        return 'ok', f'{len(members)} files', records
+
+    path = os.path.join(output_dir, rel_path)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return 'failed', 'missing', records
+    if remote is None:
+        return 'unknown', 'no remote metadata', records
+    if st.st_size != remote['size']:
+        records.append((path, st.st_size, st.st_mtime_ns, False))
+        return 'failed', f"size {st.st_size} != {remote['size']}", records
+    if remote.get('sha256') is None or unchanged(path, st):
+        return 'ok', 'size matches', records
+    ok = file_sha256(path) == remote['sha256']
+    records.append((path, st.st_size, st.st_mtime_ns, ok))
+    return ('ok', 'sha256 matches', records) if ok else ('failed', 'sha256 mismatch', records)
+
+
+class VerifyLedger:
+    """ path -> (size, mtime_ns, ok) of the verified files """
+
+    def __init__(self, ledger_file: str):
+        import sqlite3
+
+        os.makedirs(os.path.dirname(os.path.abspath(ledger_file)), exist_ok=True)
+        self.db = sqlite3.connect(ledger_file)
+        self.db.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+                        'ok INTEGER)')
+
+    def known_ok(self, prefix: str) -> dict:
+        """ path -> (size, mtime_ns) of the files under prefix that were verified ok """
+        rows = self.db.execute('SELECT path, size, mtime_ns FROM files WHERE ok = 1 AND path >= ? AND path < ?',
+                               (prefix, prefix + '\uffff'))
+        return {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+    def update(self, records: list):
+        self.db.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                            [(path, size, mtime_ns, int(ok)) for path, size, mtime_ns, ok in records])
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+def verify_items(download_list: list, output_dir: str, remote_meta=None, workers: int = None, progress=None,
+                 patterns: list = None):
+    """ Verify the items of download_list with a process pool.
+
+    :param download_list: [{'repo', 'rel_path'}]
+    :param output_dir: the output directory
+    :param remote_meta: hub_metadata.RemoteMetadata, or None
+    :param workers: number of worker processes, defaults to the number of cpus
+    :param progress: optional callable invoked once per verified item
+    :param patterns: the --members patterns of the run, None if whole zips are expected
+    :return: list of (item, status, message)
+    """
+    # the download scripts import this module for the member records, the pool is only needed here
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    ledger = VerifyLedger(os.path.join(output_dir, '.cache', 'verify.sqlite'))
+    results = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for item in download_list:
+                remote = remote_meta.get(item['repo'], item['rel_path']) if remote_meta is not None else None
+                prefix = os.path.join(output_dir, item['rel_path'].replace('.zip', ''))
+                known = ledger.known_ok(prefix)
+                futures[executor.submit(verify_item, output_dir, item, remote, known, patterns)] = item
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    status, message, records = future.result()
+                except Exception as e:
+                    status, message, records = 'failed', f'{type(e).__name__}: {e}', []
+                ledger.update(records)
+                results.append((item, status, message))
+                if progress is not None:
+                    progress()
+    finally:
+        ledger.close()
+    order = {item['rel_path']: i for i, item in enumerate(download_list)}
+    results.sort(key=lambda r: order[r[0]['rel_path']])
+    return results
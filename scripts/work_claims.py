@@ -0,0 +1,182 @@
+""" Spreading a download over several nodes.
+
+    - Sharding: every item belongs to shard crc32(rel_path) % num_shards. The partition only
+      depends on the item itself, so all the nodes agree on it whatever subset, offset or count
+      they resolved, and no per-node offsets have to be computed by hand.
+    - Lease-based claims on a shared filesystem: before downloading an item a node creates
+      <claim_dir>/<repo>/<rel_path>.lock with O_EXCL and keeps its mtime fresh while it works on
+      it. A finished item gets a .done marker. A lock that has not been refreshed for a lease is
+      considered abandoned (crashed node) and can be taken over by any node, so idle nodes steal
+      the unclaimed and expired items.
+
+    An item is normally downloaded by one node at a time. Breaking an expired lock is a rename
+    followed, if the lock turned out to be fresh, by giving it back, and another node can claim
+    the item in between. The node that lost its lock this way keeps downloading until its next
+    check (holds(), before the extraction), then drops the item without extracting or marking it
+    done. So a race can cost a duplicate transfer, never two extractions of the same item by
+    nodes that both believe they own it.
+
+    The leases rely on the mtimes set by the shared filesystem, keep the lease well above the
+    clock skew between the nodes and the heartbeat interval (lease / 3).
+"""
+
+import os
+import json
+import time
+import zlib
+import socket
+import threading
+
+
+LEASE_S = 600
+
+
+def shard_of(rel_path: str, num_shards: int) -> int:
+    """ Shard of an item, stable across runs, processes and nodes """
+    return zlib.crc32(rel_path.encode('utf-8')) % num_shards
+
+
+def select_shard(download_list: list, shard_index: int, num_shards: int, keep_others: bool = False) -> list:
+    """ The items of shard shard_index.
+
+    :param keep_others: if set, keep the items of the other shards after the ones of this shard,
+                        to steal them once this shard is done (claim mode)
+    """
+    mine = [item for item in download_list if shard_of(item['rel_path'], num_shards) == shard_index]
+    if not keep_others:
+        return mine
+    return mine + [item for item in download_list if shard_of(item['rel_path'], num_shards) != shard_index]
+
+
+class LeaseClaims:
+    """ Exclusive, expiring claims on the items of a download list, shared by several nodes """
+
+    def __init__(self, claim_dir: str, lease_s: float = LEASE_S, node_id: str = None):
+        """
+        :param claim_dir: directory on a filesystem shared by all the nodes
+        :param lease_s: seconds after which the claim of a silent node can be taken over
+        :param node_id: name of this node in the lock files, defaults to <hostname>-<pid>
+        """
+        self.claim_dir = claim_dir
+        self.lease_s = lease_s
+        self.node_id = node_id or f'{socket.gethostname()}-{os.getpid()}'
+        self.lock = threading.Lock()
+        # lock file -> token written in it, for the claims held by this process
+        self.held = {}
+        self.stop = threading.Event()
+        self.heartbeat = threading.Thread(target=self.renew_loop, daemon=True)
+        self.heartbeat.start()
+
+    def path(self, item: dict, suffix: str) -> str:
+        return os.path.join(self.claim_dir, item['repo'], item['rel_path'] + suffix)
+
+    def is_done(self, item: dict) -> bool:
+        return os.path.exists(self.path(item, '.done'))
+
+    def claim(self, item: dict) -> bool:
+        """ Try to claim an item, False if it is done or claimed by a live node """
+        if self.is_done(item):
+            return False
+        lock_file = self.path(item, '.lock')
+        os.makedirs(os.path.dirname(lock_file), exist_ok=True)
+        token = f'{self.node_id}-{threading.get_ident()}-{time.time_ns()}'
+        for _ in range(2):
+            try:
+                fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self.break_expired(lock_file, token):
+                    return False
+                continue
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'node': self.node_id, 'token': token, 'claimed': time.time()}, f)
+            with self.lock:
+                self.held[lock_file] = token
+            # finished by another node between the done check and the claim
+            if self.is_done(item):
+                self.release(item, False)
+                return False
+            return True
+        return False
+
+    def break_expired(self, lock_file: str, token: str) -> bool:
+        """ Remove lock_file if its lease expired. Only one of the competing nodes succeeds. """
+        try:
+            st = os.stat(lock_file)
+        except FileNotFoundError:
+            return True
+        if time.time() - st.st_mtime < self.lease_s:
+            return False
+        owner = self.owner_token(lock_file)
+        # renewed or re-claimed since the stat: the lease is not expired anymore
+        try:
+            current = os.stat(lock_file)
+        except FileNotFoundError:
+            return True
+        if (current.st_ino, current.st_mtime_ns) != (st.st_ino, st.st_mtime_ns):
+            return False
+        # renaming is atomic: only one node moves the expired lock aside
+        stale_file = f'{lock_file}.stale-{token}'
+        try:
+            os.rename(lock_file, stale_file)
+        except FileNotFoundError:
+            return False
+        moved = os.stat(stale_file)
+        if (moved.st_ino, moved.st_mtime_ns) != (st.st_ino, st.st_mtime_ns) or self.owner_token(stale_file) != owner:
+            # another node broke the lock and claimed the item in between, give its lock back
+            try:
+                os.link(stale_file, lock_file)
+            except FileExistsError:
+                # a third node claimed the item in the gap, the owner sees it in holds() and drops it
+                pass
+            os.remove(stale_file)
+            return False
+        os.remove(stale_file)
+        print(f'Taking over the expired claim {lock_file}')
+        return True
+
+    def release(self, item: dict, done: bool):
+        """ Release the claim of an item, marking it done on success """
+        lock_file = self.path(item, '.lock')
+        if done:
+            with open(self.path(item, '.done'), 'w') as f:
+                json.dump({'node': self.node_id, 'time': time.time()}, f)
+        with self.lock:
+            token = self.held.pop(lock_file, None)
+        if token is not None and self.owner_token(lock_file) == token:
+            try:
+                os.remove(lock_file)
+            except FileNotFoundError:
+                pass
+
+    def holds(self, item: dict) -> bool:
+        """ Whether this process still owns its claim on the item, checked before extracting it """
+        lock_file = self.path(item, '.lock')
+        with self.lock:
+            token = self.held.get(lock_file)
+        return token is not None and self.owner_token(lock_file) == token
+
+    def owner_token(self, lock_file: str):
+        try:
+            with open(lock_file, 'r') as f:
+                return json.load(f).get('token')
+        except (OSError, ValueError):
+            return None
+
+    def renew_loop(self):
+        """ Refresh the mtime of the held locks, so that they do not expire while we work """
+        while not self.stop.wait(self.lease_s / 3):
+            with self.lock:
+                held = dict(self.held)
+            for lock_file, token in held.items():
+                if self.owner_token(lock_file) != token:
+                    print(f'WARNING: lost the claim {lock_file}, the item is dropped at its next check')
+                    with self.lock:
+                        self.held.pop(lock_file, None)
+                    continue
+                try:
+                    os.utime(lock_file)
+                except FileNotFoundError:
+                    pass
+
+    def close(self):
+        self.stop.set()
@@ -0,0 +1,224 @@
+""" Random access to a downloaded scene zip, without extracting it.
+
+    A downloaded {hash}.zip (see download.py --keep_zip) is presented as the COLMAP folder that
+    2_reorganize_to_colmap.py would produce from it:
+
+        images/<frame>.png
+        sparse/0/{cameras,images,points3D}.{bin,txt}
+        transforms.json
+
+    - The member offsets (start of the data, sizes, method, crc) are read once and cached in
+      <zip>.index, keyed by the size and mtime of the zip.
+    - The zip is memory mapped. The PNG frames are STORED in the scene zips, so read() returns a
+      memoryview of the mapping: no copy and no decompression. Deflated members are inflated.
+    - A small LRU of mapped zips is shared by all the readers of the process, so iterating over
+      many scenes does not exhaust the file descriptors.
+
+Usage example:
+  python scripts/zip_scene.py --zip DL3DV-10K/1K/<hash>.zip --list images
+"""
+
+import os
+import sys
+import zlib
+import mmap
+import struct
+import pickle
+import zipfile
+import argparse
+import threading
+from collections import OrderedDict
+
+from colmap_layout import colmap_layout, strip_scene_folder
+
+
+INDEX_VERSION = 1
+LOCAL_HEADER_SIZE = 30
+LOCAL_SIG = b'PK\x03\x04'
+
+
+class ZipHandles:
+    """ LRU of memory mapped zip files """
+
+    def __init__(self, max_open: int = 16):
+        self.max_open = max_open
+        self.lock = threading.Lock()
+        self.maps = OrderedDict()
+
+    def get(self, path: str) -> mmap.mmap:
+        path = os.path.abspath(path)
+        with self.lock:
+            mm = self.maps.get(path)
+            if mm is not None:
+                self.maps.move_to_end(path)
+                return mm
+            with open(path, 'rb') as f:
+                # the mapping keeps its own descriptor, the file can be closed right away
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[path] = mm
+            while len(self.maps) > self.max_open:
+                _, old = self.maps.popitem(last=False)
+                close_map(old)
+            return mm
+
+    def close(self, path: str = None):
+        """ Unmap one zip (e.g. before deleting it), or all of them """
+        with self.lock:
+            paths = [os.path.abspath(path)] if path is not None else list(self.maps)
+            for p in paths:
+                mm = self.maps.pop(p, None)
+                if mm is not None:
+                    close_map(mm)
+
+
+def close_map(mm: mmap.mmap):
+    try:
+        mm.close()
+    except BufferError:
+        # memoryviews of the mapping are still alive, it is unmapped when they are released
+        pass
+
+
+handles = ZipHandles()
+
+
+def build_index(zip_path: str, mm: mmap.mmap) -> dict:
+    """ member name -> (data offset, compressed size, file size, method, crc) """
+    index = {}
+    with zipfile.ZipFile(zip_path) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            p = info.header_offset
+            if mm[p:p + 4] != LOCAL_SIG:
+                raise zipfile.BadZipFile(f'Bad local header for {info.filename} in {zip_path}')
+            name_len, extra_len = struct.unpack_from('<HH', mm, p + 26)
+            start = p + LOCAL_HEADER_SIZE + name_len + extra_len
+            index[info.filename] = (start, info.compress_size, info.file_size, info.compress_type, info.CRC)
+    return index
+
+
+def load_index(zip_path: str, mm: mmap.mmap, index_file: str = None) -> dict:
+    """ Member index of a zip, read from index_file (default: <zip>.index) or built and cached """
+    index_file = index_file or zip_path + '.index'
+    st = os.stat(zip_path)
+    key = (st.st_size, st.st_mtime_ns)
+    try:
+        with open(index_file, 'rb') as f:
+            version, cached_key, index = pickle.load(f)
+        if version == INDEX_VERSION and tuple(cached_key) == key:
+            return index
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+
+    index = build_index(zip_path, mm)
+    tmp_file = f'{index_file}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_file, 'wb') as f:
+            pickle.dump((INDEX_VERSION, key, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, index_file)
+    except OSError:
+        # read-only dataset, the index is rebuilt next time
+        pass
+    return index
+
+
+class ZipScene:
+    """ Read-only COLMAP view of a scene zip """
+
+    def __init__(self, zip_path: str, index_file: str = None, check_crc: bool = False):
+        """
+        :param zip_path: path to the downloaded {hash}.zip
+        :param index_file: where the member index is cached, defaults to <zip>.index
+        :param check_crc: verify the CRC32 of every member read (costs a pass over the data)
+        """
+        self.zip_path = zip_path
+        self.check_crc = check_crc
+        self.index = load_index(zip_path, handles.get(zip_path), index_file)
+        self.prefix, names = strip_scene_folder(list(self.index))
+        # COLMAP relative path -> member name
+        self.layout = {path: self.prefix + name for path, name in colmap_layout(names).items()}
+
+    def names(self) -> list:
+        """ COLMAP relative paths of all the files of the scene """
+        return sorted(self.layout)
+
+    def listdir(self, rel_dir: str = '') -> list:
+        """ Entries of a folder of the COLMAP view, like os.listdir """
+        rel_dir = rel_dir.strip('/')
+        prefix = rel_dir + '/' if rel_dir else ''
+        entries = {path[len(prefix):].split('/', 1)[0] for path in self.layout if path.startswith(prefix)}
+        if not entries and rel_dir:
+            raise FileNotFoundError(f'{rel_dir} not in {self.zip_path}')
+        return sorted(entries)
+
+    def frames(self) -> list:
+        """ COLMAP relative paths of the frames, e.g. 'images/frame_00001.png' """
+        return [path for path in self.names() if path.startswith('images/')]
+
+    def exists(self, rel_path: str) -> bool:
+        return rel_path in self.layout
+
+    def member_name(self, rel_path: str) -> str:
+        try:
+            return self.layout[rel_path]
+        except KeyError:
+            raise FileNotFoundError(f'{rel_path} not in {self.zip_path}') from None
+
+    def size(self, rel_path: str) -> int:
+        return self.index[self.member_name(rel_path)][2]
+
+    def read(self, rel_path: str):
+        """ Content of a file of the COLMAP view.
+
+        :return: a memoryview of the mapped zip for stored members (zero copy, valid until the zip
+                 is unmapped), bytes for deflated members
+        """
+        return self.read_member(self.member_name(rel_path))
+
+    def read_member(self, name: str):
+        """ Content of a member, by its name in the zip """
+        start, csize, usize, method, crc = self.index[name]
+        mm = handles.get(self.zip_path)
+        if method == zipfile.ZIP_STORED:
+            data = memoryview(mm)[start:start + usize]
+        elif method == zipfile.ZIP_DEFLATED:
+            data = zlib.decompressobj(-15).decompress(mm[start:start + csize])
+        else:
+            raise NotImplementedError(f'Compression method {method} of {name} is not supported')
+        if self.check_crc and zlib.crc32(data) != crc:
+            raise zipfile.BadZipFile(f'CRC mismatch for {name} in {self.zip_path}')
+        return data
+
+    def extract(self, rel_path: str, ofile: str):
+        """ Write one file of the COLMAP view to ofile """
+        os.makedirs(os.path.dirname(os.path.abspath(ofile)), exist_ok=True)
+        with open(ofile, 'wb') as f:
+            f.write(self.read(rel_path))
+
+
+def open_scene(path: str, check_crc: bool = False) -> ZipScene:
+    """ Open a scene by the path of its zip, or by the path of the folder it would extract to """
+    if not path.endswith('.zip') and os.path.exists(path + '.zip'):
+        path = path + '.zip'
+    return ZipScene(path, check_crc=check_crc)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Read a downloaded scene zip as a COLMAP folder, without extracting it')
+    parser.add_argument('--zip', type=str, required=True, help='Path to the scene zip ({hash}.zip)')
+    parser.add_argument('--list', type=str, help="List a folder of the COLMAP view, e.g. 'images' or 'sparse/0'", default=None)
+    parser.add_argument('--cat', type=str, help="Write a file of the COLMAP view to stdout, e.g. 'transforms.json'", default=None)
+    parser.add_argument('--check_crc', action='store_true', help='If set, verify the CRC32 of the files read')
+    args = parser.parse_args()
+
+    scene = open_scene(args.zip, args.check_crc)
+    if args.cat is not None:
+        sys.stdout.buffer.write(scene.read(args.cat))
+    elif args.list is not None:
+        for entry in scene.listdir(args.list):
+            print(entry)
+    else:
+        sparse = scene.listdir('sparse/0') if any(n.startswith('sparse/0/') for n in scene.names()) else []
+        print(f'{scene.zip_path}: {len(scene.frames())} frame(s), sparse/0: {", ".join(sparse) or "missing"}, '
+              f"transforms.json: {'yes' if scene.exists('transforms.json') else 'missing'}")
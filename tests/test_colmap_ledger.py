@@ -0,0 +1,34 @@
+import pytest
+
+import download
+from scene_ledger import SceneLedger, fingerprint_sources
+
+SCENE = 'ab' * 32
+ITEM = {'repo': 'DL3DV/DL3DV-ALL-480P', 'rel_path': f'1K/{SCENE}.zip'}
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    ledger = SceneLedger(str(tmp_path))
+    monkeypatch.setattr(download, 'colmap_ledger', ledger)
+    return ledger
+
+
+def test_fingerprint_sources():
+    assert fingerprint_sources(f'1K/{SCENE}@123;zip:1K/{SCENE}.zip') == {f'1K/{SCENE}', f'zip:1K/{SCENE}.zip'}
+    assert fingerprint_sources(None) == set()
+
+
+def test_zip_recorded_by_download(ledger, tmp_path):
+    assert not download.item_exists(str(tmp_path), ITEM)
+    ledger.record(SCENE, 'incomplete', 0, True, f'zip:1K/{SCENE}.zip')
+    assert download.item_exists(str(tmp_path), ITEM)
+    assert not download.item_exists(str(tmp_path), {'repo': ITEM['repo'], 'rel_path': f'2K/{SCENE}.zip'})
+
+
+def test_scene_finished_by_reorganize(ledger, tmp_path):
+    # 2_reorganize_to_colmap.py records the extracted folders, batch/hash@mtime
+    ledger.record(SCENE, 'done', 300, True, f'1K/{SCENE}@1700000000000000000')
+    assert download.item_exists(str(tmp_path), ITEM)
+    ledger.record(SCENE, 'incomplete', 0, False, f'1K/{SCENE}@1700000000000000000')
+    assert not download.item_exists(str(tmp_path), ITEM)
@@ -0,0 +1,53 @@
+import shutil
+import subprocess
+
+import pytest
+
+from extract_video_frames import extract_frames, plan_segments, probe_video
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None,
+                                reason='ffmpeg and ffprobe are needed')
+
+
+def test_plan_segments():
+    assert plan_segments(3.0, 10, segment_frames=12) == [(0.0, 0, 12), (1.2, 12, 12), (2.4, 24, 6)]
+    assert sum(count for _, _, count in plan_segments(3.0, 5, start=1.0, end=2.5, segment_frames=4)) == 7
+    assert plan_segments(3.0, 10, start=3.0) == []
+
+
+@pytest.fixture
+def videos(tmp_path):
+    """ Two scenes with a 3 s, 10 fps test clip """
+    input_dir = tmp_path / 'videos'
+    for scene in ['scene_a', 'scene_b']:
+        (input_dir / '1K' / scene).mkdir(parents=True)
+        subprocess.run(['ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error', '-y',
+                        '-f', 'lavfi', '-i', 'testsrc=size=640x360:rate=10', '-t', '3', '-pix_fmt', 'yuv420p',
+                        str(input_dir / '1K' / scene / 'video.mp4')], check=True)
+    return input_dir
+
+
+@needs_ffmpeg
+def test_extract_frames(videos, tmp_path):
+    duration, fps = probe_video(videos / '1K' / 'scene_a' / 'video.mp4')
+    assert fps == pytest.approx(10)
+    assert plan_segments(duration, fps, segment_frames=12) == [(0.0, 0, 12), (1.2, 12, 12), (2.4, 24, 6)]
+
+    output_dir = tmp_path / 'frames'
+    # a temp folder left by an interrupted run is replaced
+    stale = output_dir / '1K' / 'scene_a' / '.images_8.extracting'
+    stale.mkdir(parents=True)
+    (stale / 'frame_00099.png').write_bytes(b'')
+
+    extract_frames(str(videos), str(output_dir), '480P', None, 0.0, None, workers=2, segment_frames=12)
+    for scene in ['scene_a', 'scene_b']:
+        frames = sorted(p.name for p in (output_dir / '1K' / scene / 'images_8').iterdir())
+        # numbered from 1 across the segments, like the images+poses download
+        assert frames == [f'frame_{i:05d}.png' for i in range(1, 31)]
+        assert [p.name for p in (output_dir / '1K' / scene).iterdir()] == ['images_8']
+
+    # a time window at a lower frame rate
+    extract_frames(str(videos), str(tmp_path / 'window'), '480P', 5, 1.0, 2.5, scene_name='scene_b',
+                   segment_frames=4)
+    frames = sorted(p.name for p in (tmp_path / 'window' / '1K' / 'scene_b' / 'images_8').iterdir())
+    assert frames == [f'frame_{i:05d}.png' for i in range(1, 8)]
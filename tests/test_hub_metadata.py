@@ -0,0 +1,98 @@
+import json
+import os
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from hub_metadata import RemoteMetadata
+
+constants = pytest.importorskip('huggingface_hub.constants')
+
+REPO = 'DL3DV/DL3DV-ALL-video'
+LFS_SHA = 'a' * 64
+
+
+def make_hub(listing: dict, calls: list):
+    """ A mock hub serving the tree listing API: {dir: [entries]} """
+
+    class Hub(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            prefix = f'/api/datasets/{REPO}/tree/main/'
+            path = self.path.split('?')[0]
+            if not path.startswith(prefix) or path[len(prefix):] not in listing:
+                self.send_error(404)
+                return
+            calls.append(self.path)
+            body = json.dumps(listing[path[len(prefix):]]).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Hub
+
+
+@pytest.fixture
+def hub(serve, monkeypatch):
+    listing = {'1K': [
+        {'type': 'directory', 'oid': 'd' * 40, 'path': '1K/scene'},
+        {'type': 'file', 'oid': 'b' * 40, 'size': 1000, 'path': '1K/scene/video.mp4',
+         'lfs': {'oid': LFS_SHA, 'size': 1000, 'pointerSize': 130}},
+        {'type': 'file', 'oid': 'c' * 40, 'size': 12, 'path': '1K/notes.txt'},
+    ]}
+    calls = []
+    endpoint = serve(make_hub(listing, calls))
+    monkeypatch.setenv('HF_ENDPOINT', endpoint)
+    # huggingface_hub reads HF_ENDPOINT once, at import
+    monkeypatch.setattr(constants, 'ENDPOINT', endpoint)
+    return listing, calls
+
+
+def test_prefetch_round_trip(hub, tmp_path):
+    listing, calls = hub
+    cache_file = str(tmp_path / 'metadata.json')
+    meta = RemoteMetadata(cache_file)
+    assert meta.prefetch(REPO, ['1K', '1K']) == 1
+    assert len(calls) == 1
+    # the etag of an LFS file is its sha256, otherwise the git blob id; folders are skipped
+    assert meta.get(REPO, '1K/scene/video.mp4') == {'size': 1000, 'etag': LFS_SHA, 'sha256': LFS_SHA}
+    assert meta.get(REPO, '1K/notes.txt') == {'size': 12, 'etag': 'c' * 40, 'sha256': None}
+    assert meta.get(REPO, '1K/scene') is None
+    assert meta.prefetch(REPO, ['1K']) == 0
+
+    # a fresh listing is read back from the cache file, without asking the hub
+    reloaded = RemoteMetadata(cache_file)
+    assert reloaded.prefetch(REPO, ['1K']) == 0
+    assert len(calls) == 1
+    assert reloaded.get(REPO, '1K/scene/video.mp4') == meta.get(REPO, '1K/scene/video.mp4')
+
+    # a stale listing is listed again and forgets the files removed from the repo
+    del listing['1K'][2]
+    stale = RemoteMetadata(cache_file, ttl=0)
+    assert stale.prefetch(REPO, ['1K']) == 1
+    assert len(calls) == 2
+    assert stale.get(REPO, '1K/notes.txt') is None
+
+
+def test_item_exists_compares_remote_size(hub, tmp_path, monkeypatch):
+    import download
+
+    meta = RemoteMetadata(str(tmp_path / 'metadata.json'))
+    meta.prefetch(REPO, ['1K'])
+    monkeypatch.setattr(download, 'remote_meta', meta)
+    output_dir = str(tmp_path / 'out')
+    item = {'repo': REPO, 'rel_path': '1K/scene/video.mp4'}
+    assert not download.item_exists(output_dir, item)
+
+    os.makedirs(os.path.join(output_dir, '1K', 'scene'))
+    with open(os.path.join(output_dir, item['rel_path']), 'wb') as f:
+        f.write(b'v' * 999)
+    assert not download.item_exists(output_dir, item)  # truncated
+    with open(os.path.join(output_dir, item['rel_path']), 'ab') as f:
+        f.write(b'v')
+    assert download.item_exists(output_dir, item)
+    assert download.remote_file_metadata(REPO, item['rel_path'])['etag'] == LFS_SHA
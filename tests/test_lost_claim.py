@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+import download
+from disk_admission import DiskAdmission
+
+
+class LostClaims:
+    """ Claims taken over by another node while the item downloads """
+
+    def __init__(self):
+        self.released = []
+
+    def claim(self, item):
+        return True
+
+    def holds(self, item):
+        return False
+
+    def release(self, item, succ):
+        self.released.append((item['rel_path'], succ))
+
+
+@pytest.fixture
+def fetched_zip(tmp_path, monkeypatch):
+    """ fetch_item stub: the zip is downloaded and its extraction reserved """
+    output_dir = str(tmp_path)
+    rel_path = '1K/scene.zip'
+
+    def fetch_item(item, output_dir, janitor, repo_slots, admission, blob_cache):
+        os.makedirs(os.path.join(output_dir, '1K'), exist_ok=True)
+        with open(os.path.join(output_dir, rel_path), 'wb') as f:
+            f.write(b'zip')
+        admission.reserve(rel_path, 1)
+        return 'downloaded'
+
+    monkeypatch.setattr(download, 'fetch_item', fetch_item)
+    admission = DiskAdmission(output_dir, 0)
+    return output_dir, {'repo': 'DL3DV/DL3DV-ALL-480P', 'rel_path': rel_path}, admission
+
+
+def test_download_item_drops_zip_of_lost_claim(fetched_zip):
+    output_dir, item, admission = fetched_zip
+    claims = LostClaims()
+    assert download.download_item(item, output_dir, None, {}, admission, claims=claims) is None
+    assert not os.path.exists(os.path.join(output_dir, item['rel_path']))
+    assert not admission.reserved
+    assert claims.released == [(item['rel_path'], False)]
+
+
+def test_pipeline_drops_zip_of_lost_claim(fetched_zip):
+    output_dir, item, admission = fetched_zip
+
+    class Progress:
+        def update(self, n):
+            pass
+
+    results = download.download_pipelined([item], output_dir, None, {}, admission, None, 1, 1, 1, Progress(),
+                                           claims=LostClaims())
+    assert results == [(item, None)]
+    assert not os.path.exists(os.path.join(output_dir, item['rel_path']))
+    assert not admission.reserved
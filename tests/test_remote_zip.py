@@ -0,0 +1,173 @@
+import io
+import os
+import re
+import zipfile
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from disk_admission import extract_zip_atomic
+from remote_zip import RemoteZip, RemoteZipError, resolve_url
+
+MEMBER_SIZE = 40 * 1024
+
+
+def make_zip(members: dict, comment: bytes = b'') -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        for name, (data, method) in members.items():
+            zf.writestr(zipfile.ZipInfo(name), data, compress_type=method)
+        zf.comment = comment
+    return buf.getvalue()
+
+
+def make_file_server(files: dict, seen: list, redirects: dict = None):
+    """ Serve files {path: bytes} with HEAD and single Range requests, record the request headers.
+        redirects maps a path to the Location it is redirected to.
+    """
+
+    class FileServer(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_HEAD(self):
+            self.respond(head=True)
+
+        def do_GET(self):
+            self.respond(head=False)
+
+        def respond(self, head):
+            seen.append((self.command, self.path, dict(self.headers)))
+            if redirects and self.path in redirects:
+                self.send_response(302)
+                self.send_header('Location', redirects[self.path])
+                self.end_headers()
+                return
+            data = files.get(self.path)
+            if data is None:
+                self.send_error(404)
+                return
+            m = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+            if m:
+                start, end = int(m.group(1)), int(m.group(2)) + 1
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end - 1}/{len(data)}')
+                data = data[start:end]
+            else:
+                self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            if not head:
+                self.wfile.write(data)
+
+    return FileServer
+
+
+def make_redirect(target: str):
+    class Redirect(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_HEAD(self):
+            self.send_response(302)
+            self.send_header('Location', target + self.path)
+            self.end_headers()
+
+    return Redirect
+
+
+@pytest.fixture
+def scene():
+    members = {
+        f'scene/images_4/frame_{i:05d}.png': (os.urandom(MEMBER_SIZE), zipfile.ZIP_STORED) for i in range(4)
+    }
+    members['scene/transforms.json'] = (b'{"frames": []}' * 100, zipfile.ZIP_DEFLATED)
+    members['scene/images_8/frame_00000.png'] = (os.urandom(MEMBER_SIZE), zipfile.ZIP_STORED)
+    # larger than the tail read, with a comment before the end of central directory record
+    return members, make_zip(members, comment=b'DL3DV' * 20)
+
+
+def test_central_directory_and_extract(serve, scene, tmp_path):
+    members, data = scene
+    seen = []
+    url = serve(make_file_server({'/scene.zip': data}, seen)) + '/scene.zip'
+    rz = RemoteZip(url)
+    assert rz.size == len(data)
+    assert sorted(m.name for m in rz.members) == sorted(members)
+
+    extracted = rz.extract(['images_4/*', 'transforms.json'], str(tmp_path))
+    assert len(extracted) == 5
+    for m in extracted:
+        with open(os.path.join(tmp_path, m.name), 'rb') as f:
+            assert f.read() == members[m.name][0]
+    assert not os.path.exists(tmp_path / 'scene' / 'images_8')
+    assert rz.bytes_fetched < len(data) + 22 + 0xFFFF
+
+
+def test_neighbouring_members_are_merged(serve, scene):
+    members, data = scene
+    url = serve(make_file_server({'/scene.zip': data}, [])) + '/scene.zip'
+    rz = RemoteZip(url, merge_gap=0)
+    frames = sorted(rz.select(['images_4/*']), key=lambda m: m.header_offset)
+
+    before = rz.requests
+    assert [m.name for m, _ in rz.iter_member_data(frames[:2])] == [m.name for m in frames[:2]]
+    assert rz.requests - before == 1
+
+    before = rz.requests
+    list(rz.iter_member_data([frames[0], frames[2]]))
+    assert rz.requests - before == 2
+
+    # a gap smaller than merge_gap is fetched along
+    rz.merge_gap = MEMBER_SIZE * 2
+    before = rz.requests
+    list(rz.iter_member_data([frames[0], frames[2]]))
+    assert rz.requests - before == 1
+
+
+def test_crc_mismatch(serve, scene, tmp_path):
+    members, data = scene
+    name = 'scene/images_4/frame_00001.png'
+    pos = data.index(members[name][0])
+    corrupted = data[:pos] + bytes([data[pos] ^ 0xFF]) + data[pos + 1:]
+    url = serve(make_file_server({'/scene.zip': corrupted}, [])) + '/scene.zip'
+    with pytest.raises(RemoteZipError, match='CRC mismatch'):
+        RemoteZip(url).extract(['images_4/frame_00001.png'], str(tmp_path))
+
+
+def test_redirect_drops_authorization_across_hosts(serve, scene):
+    _, data = scene
+    seen = []
+    cdn = serve(make_file_server({'/scene.zip': data}, seen))
+    hub = serve(make_redirect(cdn))
+    url, size, headers = resolve_url(hub + '/scene.zip', {'Authorization': 'Bearer secret'})
+    assert url == cdn + '/scene.zip'
+    assert size == len(data)
+    assert 'Authorization' not in headers
+    assert all('Authorization' not in h for _, _, h in seen)
+
+    # a redirect within the host keeps the credentials
+    seen.clear()
+    same = serve(make_file_server({'/scene.zip': data}, seen, redirects={'/old.zip': '/scene.zip'}))
+    url, _, headers = resolve_url(same + '/old.zip', {'Authorization': 'Bearer secret'})
+    assert url == same + '/scene.zip'
+    assert headers['Authorization'] == 'Bearer secret'
+    assert [(path, h.get('Authorization')) for _, path, h in seen] == [
+        ('/old.zip', 'Bearer secret'), ('/scene.zip', 'Bearer secret')]
+
+
+@pytest.mark.parametrize('name', ['../evil.txt', 'scene/../../evil.txt', '/abs/evil.txt'])
+def test_unsafe_member_names(serve, tmp_path, name):
+    data = make_zip({name: (b'evil', zipfile.ZIP_STORED), 'scene/transforms.json': (b'{}', zipfile.ZIP_STORED)})
+    url = serve(make_file_server({'/scene.zip': data}, [])) + '/scene.zip'
+    odir = tmp_path / 'out'
+    with pytest.raises(RemoteZipError, match='Unsafe member name'):
+        RemoteZip(url).extract(['*'], str(odir))
+
+    zip_file = tmp_path / 'scene.zip'
+    zip_file.write_bytes(data)
+    odir.mkdir(exist_ok=True)
+    with pytest.raises(zipfile.BadZipFile, match='Unsafe member name'):
+        extract_zip_atomic(str(zip_file), str(odir))
+    assert os.listdir(odir) == []
+    assert not os.path.exists(tmp_path / 'evil.txt')
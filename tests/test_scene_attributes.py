@@ -0,0 +1,73 @@
+import os
+import shutil
+
+from scene_attributes import HTML_COLUMNS, load_scene_attributes, parse_visualize_html
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HASHES = ['aa' * 32, 'bb' * 32, 'cc' * 32, 'dd' * 32]
+
+
+def scene_row(h: str, cells: str) -> str:
+    return f'<tr><td><figcaption>{h}</figcaption><img src="imgs/{h}.jpg">{cells}</td></tr>'
+
+
+def write_html(path, rows: list, header: str = '') -> str:
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'<html><body><table>{header}{"".join(rows)}</table></body></html>')
+    return str(path)
+
+
+def test_cells_by_position(tmp_path):
+    html_file = write_html(tmp_path / 'index.html', [
+        scene_row(HASHES[0], '<td>1K</td><td>unbd</td><td>abs-reflection</td><td>abs nontransparent</td>'
+                             '<td>nlight</td><td>Swimming-Pools</td><td>Sports &amp; Fitness</td><td>Swimming-Pools</td>'),
+        # empty cells are missing values
+        scene_row(HASHES[1], '<td>1K</td><td></td><td>nan</td><td> </td><td>hlight</td><td>Museums</td>'
+                             '<td>Tourist Attractions</td><td>pixel6a</td>'),
+        # a capture folder name in the device column
+        scene_row(HASHES[2], '<td>2K</td><td>bd</td><td>abs nonreflection</td><td>abs transparent</td><td>mlight</td>'
+                             '<td>Parking-Lots</td><td>Automotive Services</td><td>scene\\unbd-mlight-pixel6a-yzx(1)</td>'),
+        # one cell short: rejected instead of shifting the columns
+        scene_row(HASHES[3], '<td>2K</td><td>bd</td><td>abs nonreflection</td><td>abs transparent</td><td>mlight</td>'
+                             '<td>Parking-Lots</td><td>iPhone14</td>'),
+    ])
+    rows = parse_visualize_html(html_file)
+    assert sorted(rows) == HASHES[:3]
+    assert rows[HASHES[0]]['category'] == 'Sports & Fitness'
+    assert rows[HASHES[0]]['device'] is None  # a copy of the POI
+    assert rows[HASHES[1]]['bound'] is None and rows[HASHES[1]]['reflection'] is None
+    assert rows[HASHES[1]]['transparency'] is None
+    assert rows[HASHES[1]]['device'] == 'pixel6a'
+    assert rows[HASHES[2]]['device'] == 'pixel6a'
+    assert set(rows[HASHES[2]]) == set(HTML_COLUMNS)
+
+
+def test_header_and_colspan(tmp_path):
+    header = ('<tr><th>Scene</th><th>Device</th><th>Batch</th><th>Lighting</th><th>Notes</th>'
+              '<th>Category</th></tr>')
+    html_file = write_html(tmp_path / 'index.html', [
+        scene_row(HASHES[0], '<td>iPhone11</td><td>1K</td><td>hlight</td><td>-</td><td>Parks and Recreation</td>'),
+        scene_row(HASHES[1], '<td>iPhone14</td><td>1K</td><td colspan="2">nan</td><td>Shopping Centers</td>'),
+        scene_row(HASHES[2], '<td>iPhone14</td><td>1K</td><td>nlight</td><td>Shopping Centers</td>'),
+    ], header)
+    rows = parse_visualize_html(html_file)
+    assert sorted(rows) == HASHES[:2]
+    assert rows[HASHES[0]] == {'device': 'iPhone11', 'html_batch': '1K', 'lighting': 'hlight',
+                               'category': 'Parks and Recreation'}
+    assert rows[HASHES[1]]['lighting'] is None
+    assert rows[HASHES[1]]['category'] == 'Shopping Centers'
+
+
+def test_published_table(tmp_path):
+    meta_file = str(tmp_path / 'DL3DV-valid.csv')
+    shutil.copy(os.path.join(ROOT, 'cache', 'DL3DV-valid.csv'), meta_file)
+    html_file = os.path.join(ROOT, 'visualize', 'index.html')
+    attributes = load_scene_attributes(meta_file, html_file)
+    assert os.path.exists(str(tmp_path / 'DL3DV-valid.attributes'))
+    devices = attributes.values('device')
+    assert not any('\\' in d or d == 'Swimming-Pools' for d in devices)
+
+    # the cached columns give the same answer
+    where = 'bound=unbd and lighting=nlight and device=pixel6a'
+    assert load_scene_attributes(meta_file, html_file).select(where) == attributes.select(where)
+    assert attributes.select(where)